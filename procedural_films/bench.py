@@ -0,0 +1,158 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+from .file_formats import encode_json, library_file_name, is_library_file_name
+
+# =========================================================
+# БЕНЧМАРКИ (только внутри Blender: storage / bpy импортируются в функциях)
+#   from procedural_films import bench
+#   bench.main()                       # скан синтетических библиотек NONE / GZIP / XZ
+#   bench.main(["/путь/к/папке"])      # скан своей папки
+#   print(bench.bench_capture())       # захват кривых: foreach_get против чтения по ключу
+#
+# Скан меряется тем же кодом, что и в аддоне (storage._parse_external_meta).
+# =========================================================
+
+
+def make_synthetic_library(folder, files=2000, objects=20, keys=120, compression="NONE", seed=0):
+    """Пишет files файлов <name>.json с objects объектами по 9 кривых из keys ключей."""
+    rnd = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        tracks = []
+        for o in range(objects):
+            fcurves = []
+            for data_path in ("location", "rotation_euler", "scale"):
+                for idx in range(3):
+                    fcurves.append({
+                        "data_path": data_path,
+                        "array_index": idx,
+                        "frames": [float(f) for f in range(keys)],
+                        "values": [round(rnd.uniform(-10.0, 10.0), 4) for _ in range(keys)],
+                        "interpolation": [2] * keys,
+                    })
+            tracks.append({
+                "object_name": f"Obj_{o}",
+                "animation": {"tracks": [{"name": "t", "strips": [{
+                    "name": "s", "frame_start": 1.0, "frame_end": float(keys),
+                    "action": {"name": f"A_{i}_{o}", "fcurves": fcurves},
+                }]}]},
+            })
+        entry = {"created_at": "2024-01-01T00:00:00", "frame_start": 1, "frame_end": keys, "tracks": tracks}
+        path = os.path.join(folder, library_file_name(f"anim_{i:05d}", compression))
+        with open(path, "wb") as f:
+            f.write(encode_json({f"anim_{i:05d}": entry}, compression))
+
+
+def _library_paths(folder):
+    return [os.path.join(folder, f) for f in os.listdir(folder) if is_library_file_name(f)]
+
+
+def bench_parse_folder(folder, repeat=3):
+    """
+    (Blender) Время скана папки тем же кодом, что и в аддоне:
+      cold_s — холодный старт: каждый файл разбирается до метаданных (_parse_external_meta);
+      warm_s — повторный скан по манифесту: только stat файлов.
+    Возвращает {"files", "cold_s", "warm_s", "per_file_ms"} (лучшее из repeat).
+    """
+    from . import storage
+
+    paths = _library_paths(folder)
+
+    def best(func):
+        times = []
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            for path in paths:
+                func(path)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    cold = best(storage._parse_external_meta)
+    warm = best(storage._file_stat_key)
+    return {
+        "files": len(paths),
+        "cold_s": cold,
+        "warm_s": warm,
+        "per_file_ms": 1000.0 * cold / len(paths) if paths else 0.0,
+    }
+
+
+def make_synthetic_action(name="bench_mocap", curves=9, keys=20000, seed=0):
+    """(Blender) Action с curves кривыми по keys ключей, как у запечённого mocap."""
+    import bpy
+
+    rnd = random.Random(seed)
+    action = bpy.data.actions.new(name)
+    paths = ("location", "rotation_euler", "scale")
+    for i in range(curves):
+        fc = action.fcurves.new(data_path=paths[(i // 3) % 3], index=i % 3, action_group=f"g{i // 9}")
+        fc.keyframe_points.add(keys)
+        co = []
+        for f in range(keys):
+            co.extend((float(f), rnd.uniform(-1.0, 1.0)))
+        fc.keyframe_points.foreach_set("co", co)
+        fc.update()
+    return action
+
+
+def bench_capture(actions=None, repeat=3):
+    """
+    (Blender) Время serialize_action: foreach_get против чтения по одному ключу.
+    Без actions берутся все Action сцены (или создаётся синтетический).
+    action_fingerprint считается один раз до замеров: оба прогона меряют только чтение ключей.
+    """
+    import bpy
+    from .blender_codec import action_fingerprint, serialize_action
+
+    actions = list(actions if actions is not None else bpy.data.actions)
+    created = None
+    if not actions:
+        created = make_synthetic_action()
+        actions = [created]
+
+    fingerprints = []
+    for a in actions:
+        try:
+            fingerprints.append(action_fingerprint(a) or "")
+        except Exception:
+            fingerprints.append("")
+
+    def best(bulk):
+        times = []
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            out = [serialize_action(a, bulk=bulk, fingerprint=fp) for a, fp in zip(actions, fingerprints)]
+            times.append(time.perf_counter() - t0)
+        return min(times), out
+
+    try:
+        per_key, ref = best(False)
+        bulk, res = best(True)
+    finally:
+        if created is not None:
+            bpy.data.actions.remove(created)
+
+    keys = sum(len(fc["frames"]) for a in ref for fc in a["fcurves"])
+    return {
+        "actions": len(actions),
+        "keys": keys,
+        "per_key_s": per_key,
+        "bulk_s": bulk,
+        "speedup": per_key / bulk if bulk > 0 else 0.0,
+        "identical": ref == res,
+    }
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0]:
+        print(bench_parse_folder(argv[0]))
+        return
+    for compression in ("NONE", "GZIP", "XZ"):
+        with tempfile.TemporaryDirectory() as folder:
+            make_synthetic_library(folder, files=300, objects=10, compression=compression)
+            print(compression, bench_parse_folder(folder))
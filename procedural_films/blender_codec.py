@@ -1,4 +1,15 @@
 import bpy
+import hashlib
+import json
+from array import array
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from .constants import INTERPOLATION_MODES, HANDLE_TYPES, ACTION_DIGEST_PROP, ACTION_FINGERPRINT_PROP
+from .keyframe_reduction import reduce_keyframes
 
 # =========================================================
 # КОДЕК БИБЛИОТЕКИ АНИМАЦИЙ (Blender -> JSON entry -> Blender)
@@ -11,42 +22,428 @@ import bpy
 # Action: сериализация/десериализация
 # -------------------------
 
-def serialize_action(action):
-    """Сериализует bpy.types.Action в словарь (включая fcurves и keyframes)."""
+_INTERPOLATION_CODES = {name: i for i, name in enumerate(INTERPOLATION_MODES)}
+
+
+def interpolation_code(name):
+    return _INTERPOLATION_CODES.get(name, _INTERPOLATION_CODES["BEZIER"])
+
+
+def interpolation_name(code):
+    try:
+        return INTERPOLATION_MODES[int(code)]
+    except Exception:
+        return None
+
+
+def fcurve_columns(fc_data):
+    """
+    Возвращает (frames, values, interpolation_codes) для сериализованной fcurve.
+    Понимает и колоночный формат (v2), и старый список {"co", "interpolation"} (v1).
+    """
+    if "frames" in fc_data:
+        frames = fc_data.get("frames") or []
+        values = fc_data.get("values") or []
+        interp = fc_data.get("interpolation") or []
+        n = min(len(frames), len(values))
+        if len(interp) < n:
+            interp = list(interp) + [_INTERPOLATION_CODES["BEZIER"]] * (n - len(interp))
+        return frames[:n], values[:n], interp[:n]
+
+    frames, values, interp = [], [], []
+    for kp in fc_data.get("keyframes", []):
+        co = kp.get("co")
+        if not co or len(co) < 2:
+            continue
+        frames.append(co[0])
+        values.append(co[1])
+        interp.append(interpolation_code(kp.get("interpolation")))
+    return frames, values, interp
+
+
+_BEZIER_CODE = _INTERPOLATION_CODES["BEZIER"]
+_HANDLE_TYPE_CODES = {name: i for i, name in enumerate(HANDLE_TYPES)}
+# Автоматические ручки пересчитываются fcurve.update() из co — их не храним
+_AUTO_HANDLE_CODES = (_HANDLE_TYPE_CODES["AUTO"], _HANDLE_TYPE_CODES["AUTO_CLAMPED"])
+
+
+def _float_buffer(n):
+    if np is not None:
+        return np.empty(n, dtype=np.float32)
+    return array("f", bytes(4 * n))
+
+
+def _int_buffer(n):
+    if np is not None:
+        return np.empty(n, dtype=np.int32)
+    return array("i", bytes(4 * n))
+
+
+def _keyframes_bulk(fc):
+    """
+    Колонки ключей fcurve через keyframe_points.foreach_get (по одному вызову на атрибут).
+    Возвращает (frames, values, interp_codes, handles | None),
+    handles = (left [x, y, ...], right [x, y, ...], types [l, r, ...]).
+    """
+    kps = fc.keyframe_points
+    n = len(kps)
+    co = _float_buffer(2 * n)
+    kps.foreach_get("co", co)
+    codes = _int_buffer(n)
+    kps.foreach_get("interpolation", codes)
+    co = co.tolist()
+    interp = codes.tolist()
+
+    handles = None
+    if _BEZIER_CODE in interp:
+        left_t = _int_buffer(n)
+        right_t = _int_buffer(n)
+        kps.foreach_get("handle_left_type", left_t)
+        kps.foreach_get("handle_right_type", right_t)
+        types = [t for pair in zip(left_t.tolist(), right_t.tolist()) for t in pair]
+        if any(t not in _AUTO_HANDLE_CODES for t in types):
+            left = _float_buffer(2 * n)
+            right = _float_buffer(2 * n)
+            kps.foreach_get("handle_left", left)
+            kps.foreach_get("handle_right", right)
+            handles = (left.tolist(), right.tolist(), types)
+
+    return co[0::2], co[1::2], interp, handles
+
+
+def _keyframes_per_key(fc):
+    """То же, что _keyframes_bulk, но по одному ключу (запасной путь и эталон для бенчмарка)."""
+    frames, values, interp = [], [], []
+    left, right, types = [], [], []
+    for kp in fc.keyframe_points:
+        frames.append(kp.co.x)
+        values.append(kp.co.y)
+        interp.append(interpolation_code(kp.interpolation))
+        left.extend((kp.handle_left.x, kp.handle_left.y))
+        right.extend((kp.handle_right.x, kp.handle_right.y))
+        types.append(_HANDLE_TYPE_CODES.get(kp.handle_left_type, _AUTO_HANDLE_CODES[1]))
+        types.append(_HANDLE_TYPE_CODES.get(kp.handle_right_type, _AUTO_HANDLE_CODES[1]))
+
+    handles = None
+    if _BEZIER_CODE in interp and any(t not in _AUTO_HANDLE_CODES for t in types):
+        handles = (left, right, types)
+    return frames, values, interp, handles
+
+
+def action_fingerprint(action):
+    """
+    Дешёвый отпечаток содержимого bpy.types.Action без сериализации в JSON:
+    "<кривых>:<ключей>:<hash>", hash — по имени, frame_range, data_path кривых и
+    сырым массивам ключей (co, интерполяция, ручки), прочитанным через foreach_get.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(action.name.encode("utf-8"))
+    h.update(repr(tuple(action.frame_range)).encode("utf-8"))
+    fcurve_count = 0
+    key_count = 0
+    for fc in action.fcurves:
+        kps = fc.keyframe_points
+        n = len(kps)
+        fcurve_count += 1
+        key_count += n
+        h.update(f"|{fc.data_path}|{fc.array_index}|{n}|".encode("utf-8"))
+        for attr, size, make in (
+            ("co", 2, _float_buffer),
+            ("interpolation", 1, _int_buffer),
+            ("handle_left_type", 1, _int_buffer),
+            ("handle_right_type", 1, _int_buffer),
+            ("handle_left", 2, _float_buffer),
+            ("handle_right", 2, _float_buffer),
+        ):
+            buf = make(size * n)
+            kps.foreach_get(attr, buf)
+            h.update(buf.tobytes())
+    return f"{fcurve_count}:{key_count}:{h.hexdigest()}"
+
+
+def serialize_action(action, bulk=True, fingerprint=None, tolerance=0.0):
+    """
+    Сериализует bpy.types.Action в словарь (включая fcurves и keyframes).
+    Ключи fcurve хранятся колонками: frames / values / interpolation (коды),
+    ручки — только если они не автоматические (см. ENTRY_FORMAT_VERSION).
+    bulk=True читает ключи через foreach_get, при ошибке — по одному ключу.
+    В "fingerprint" сохраняется action_fingerprint (для повторного использования при обновлении).
+    tolerance > 0 прореживает ключи (keyframe_reduction); тогда в Action пишутся
+    "key_tolerance" и "keys_original" (число ключей до прореживания).
+    """
     if action is None:
         return None
 
     out = {"name": action.name, "frame_range": list(action.frame_range), "fcurves": []}
+    if fingerprint is None:
+        try:
+            fingerprint = action_fingerprint(action)
+        except Exception:
+            fingerprint = None
+    if fingerprint:
+        out["fingerprint"] = fingerprint
 
+    keys_original = 0
     for fc in action.fcurves:
-        fc_out = {"data_path": fc.data_path, "array_index": fc.array_index, "keyframes": []}
-        for kp in fc.keyframe_points:
-            fc_out["keyframes"].append({
-                "co": [kp.co.x, kp.co.y],
-                "interpolation": kp.interpolation
-            })
+        columns = None
+        if bulk:
+            try:
+                columns = _keyframes_bulk(fc)
+            except Exception:
+                columns = None
+        if columns is None:
+            columns = _keyframes_per_key(fc)
+        frames, values, interp, handles = columns
+        keys_original += len(frames)
+
+        # Кривые с ручными (не авто) ручками не прореживаем: форма задана ручками
+        if tolerance > 0 and handles is None:
+            frames, values, interp = reduce_keyframes(frames, values, interp, tolerance)
+
+        fc_out = {
+            "data_path": fc.data_path,
+            "array_index": fc.array_index,
+            "frames": frames,
+            "values": values,
+            "interpolation": interp,
+        }
+        if handles is not None:
+            fc_out["handle_left"], fc_out["handle_right"], fc_out["handle_types"] = handles
         out["fcurves"].append(fc_out)
 
+    if tolerance > 0:
+        out["key_tolerance"] = tolerance
+        out["keys_original"] = keys_original
+
     return out
 
 
+# Служебные ключи, не влияющие на содержимое Action (в digest не входят)
+_DIGEST_EXCLUDED_KEYS = ("digest", "fingerprint")
+
+
+def action_digest(action_data):
+    """
+    Content digest сериализованного Action (имя + кривые + ключи).
+    Одинаковые Action дают одинаковый digest независимо от того, в какой анимации лежат.
+    """
+    payload = {k: v for k, v in action_data.items() if k not in _DIGEST_EXCLUDED_KEYS}
+    s = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def ensure_action_digest(action_data):
+    """Возвращает digest Action, вычисляя и запоминая его в action_data["digest"] при первом обращении."""
+    digest = action_data.get("digest")
+    if not digest:
+        digest = action_digest(action_data)
+        action_data["digest"] = digest
+    return digest
+
+
+def _as_float_buffer(values):
+    if np is not None:
+        return np.asarray(values, dtype=np.float32)
+    return array("f", values)
+
+
+def _as_int_buffer(values):
+    if np is not None:
+        return np.asarray(values, dtype=np.int32)
+    return array("i", values)
+
+
+def _restore_keyframes_bulk(fcurve, fc_data):
+    """
+    Все ключи fcurve одним keyframe_points.add(n) + foreach_set (co, interpolation, ручки).
+    fcurve.update() (сортировка + пересчёт авто-ручек) вызывает вызывающий код.
+    """
+    frames, values, codes = fcurve_columns(fc_data)
+    n = len(frames)
+    if n == 0:
+        return
+
+    kps = fcurve.keyframe_points
+    kps.add(n)
+
+    co = [0.0] * (2 * n)
+    co[0::2] = frames
+    co[1::2] = values
+    kps.foreach_set("co", _as_float_buffer(co))
+    kps.foreach_set("interpolation", _as_int_buffer(codes))
+
+    left = fc_data.get("handle_left")
+    right = fc_data.get("handle_right")
+    types = fc_data.get("handle_types")
+    if left and right and types and len(left) == len(right) == 2 * n and len(types) == 2 * n:
+        kps.foreach_set("handle_left_type", _as_int_buffer(types[0::2]))
+        kps.foreach_set("handle_right_type", _as_int_buffer(types[1::2]))
+        kps.foreach_set("handle_left", _as_float_buffer(left))
+        kps.foreach_set("handle_right", _as_float_buffer(right))
+
+
+def _restore_keyframes_per_key(fcurve, fc_data):
+    frames, values, codes = fcurve_columns(fc_data)
+    for fr, val, code in zip(frames, values, codes):
+        kfp = fcurve.keyframe_points.insert(
+            frame=fr,
+            value=val,
+            options={'FAST'}
+        )
+        interp = interpolation_name(code)
+        if interp:
+            try:
+                kfp.interpolation = interp
+            except Exception:
+                pass
+
+
+# digest -> имя Action в bpy.data (по ACTION_DIGEST_PROP); пересобирается, когда
+# число Action в файле изменилось не через нас
+_DIGEST_INDEX = {}
+_DIGEST_INDEX_COUNT = -1
+
+
+def _action_digest_prop(action):
+    try:
+        return action.get(ACTION_DIGEST_PROP)
+    except Exception:
+        return None
+
+
+def _tag_action(action, digest, fingerprint=None):
+    global _DIGEST_INDEX_COUNT
+    try:
+        if fingerprint is None:
+            fingerprint = action_fingerprint(action)
+        action[ACTION_DIGEST_PROP] = digest
+        action[ACTION_FINGERPRINT_PROP] = fingerprint
+    except Exception:
+        return
+    _DIGEST_INDEX[digest] = action.name
+    _DIGEST_INDEX_COUNT = len(bpy.data.actions)
+
+
+def _untag_action(action):
+    for prop in (ACTION_DIGEST_PROP, ACTION_FINGERPRINT_PROP):
+        try:
+            if prop in action:
+                del action[prop]
+        except Exception:
+            pass
+
+
+def _verify_tagged(action, digest):
+    """
+    Помеченный digest Action не менялся с момента пометки: сверяется action_fingerprint,
+    при расхождении (или если отпечатка нет) — полный digest содержимого.
+    Изменённый вручную Action теряет пометку и больше не переиспользуется.
+    """
+    try:
+        fingerprint = action_fingerprint(action)
+    except Exception:
+        return False
+    try:
+        stored = action.get(ACTION_FINGERPRINT_PROP)
+    except Exception:
+        stored = None
+    if stored and stored == fingerprint:
+        return True
+    try:
+        same = action_digest(serialize_action(action, fingerprint=fingerprint)) == digest
+    except Exception:
+        same = False
+    if same:
+        _tag_action(action, digest, fingerprint)
+    else:
+        _untag_action(action)
+        if _DIGEST_INDEX.get(digest) == action.name:
+            _DIGEST_INDEX.pop(digest, None)
+    return same
+
+
+def find_action_by_digest(digest):
+    """Action из bpy.data, помеченный этим digest, или None."""
+    global _DIGEST_INDEX_COUNT
+    name = _DIGEST_INDEX.get(digest)
+    action = bpy.data.actions.get(name) if name else None
+    if action is not None and _action_digest_prop(action) == digest:
+        return action if _verify_tagged(action, digest) else None
+
+    if _DIGEST_INDEX_COUNT != len(bpy.data.actions) or name is not None:
+        _DIGEST_INDEX.clear()
+        for a in bpy.data.actions:
+            d = _action_digest_prop(a)
+            if d:
+                _DIGEST_INDEX[d] = a.name
+        _DIGEST_INDEX_COUNT = len(bpy.data.actions)
+        name = _DIGEST_INDEX.get(digest)
+        action = bpy.data.actions.get(name) if name else None
+        if action is not None and _verify_tagged(action, digest):
+            return action
+    return None
+
+
+# as_pointer() чужого (не созданного аддоном) Action -> (action_fingerprint, digest содержимого):
+# такие Action сверяются только на чтение, без custom properties, и не пересериализуются,
+# пока отпечаток не изменился
+_FOREIGN_DIGESTS = {}
+
+
+def _foreign_digest(action):
+    fingerprint = action_fingerprint(action)
+    try:
+        pointer = action.as_pointer()
+    except Exception:
+        pointer = None
+    cached = _FOREIGN_DIGESTS.get(pointer) if pointer is not None else None
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    digest = action_digest(serialize_action(action, fingerprint=fingerprint))
+    if pointer is not None:
+        _FOREIGN_DIGESTS[pointer] = (fingerprint, digest)
+    return digest
+
+
+def _matches_digest(action, digest):
+    """
+    Помеченный Action (созданный deserialize_action) проверяется на ручные правки
+    (_verify_tagged); непомеченный (например, исходный в сцене) сверяется по
+    содержимому без записи в него (_foreign_digest).
+    """
+    tagged = _action_digest_prop(action)
+    if tagged == digest:
+        return _verify_tagged(action, digest)
+    if tagged:
+        return False
+    try:
+        return _foreign_digest(action) == digest
+    except Exception:
+        return False
+
+
 def deserialize_action(action_data, prefer_name=None):
     """
     Восстанавливает Action из словаря.
-    Если Action с нужным именем уже существует — возвращает существующий.
+    Существующий Action переиспользуется только если его содержимое совпадает
+    (content digest в custom property ACTION_DIGEST_PROP); иначе создаётся новый.
     """
     if not action_data:
         return None
 
+    digest = ensure_action_digest(action_data)
     orig_name = action_data.get("name")
 
-    # 1) Если такой Action уже есть — используем его
-    if orig_name and bpy.data.actions.get(orig_name):
-        return bpy.data.actions.get(orig_name)
+    # 1) Action с тем же именем и тем же содержимым
+    for candidate in (orig_name, prefer_name):
+        existing = bpy.data.actions.get(candidate) if candidate else None
+        if existing is not None and _matches_digest(existing, digest):
+            return existing
 
-    # 2) Если задан prefer_name и он есть — используем его
-    if prefer_name and bpy.data.actions.get(prefer_name):
-        return bpy.data.actions.get(prefer_name)
+    # 2) Action с тем же содержимым под другим именем (например, name_1)
+    existing = find_action_by_digest(digest)
+    if existing is not None:
+        return existing
 
     # 3) Иначе создаём новый Action с уникальным именем
     desired = orig_name or prefer_name or "action"
@@ -70,25 +467,22 @@ def deserialize_action(action_data, prefer_name=None):
             except Exception:
                 continue
 
-            for kp in fc.get("keyframes", []):
-                co = kp.get("co", [0.0, 0.0])
-                kfp = fcurve.keyframe_points.insert(
-                    frame=co[0],
-                    value=co[1],
-                    options={'FAST'}
-                )
-                interp = kp.get("interpolation")
-                if interp:
-                    try:
-                        kfp.interpolation = interp
-                    except Exception:
-                        pass
+            try:
+                _restore_keyframes_bulk(fcurve, fc)
+            except Exception:
+                # Запасной путь: по одному ключу
+                try:
+                    fcurve.keyframe_points.clear()
+                except Exception:
+                    pass
+                _restore_keyframes_per_key(fcurve, fc)
 
             try:
                 fcurve.update()
             except Exception:
                 pass
 
+        _tag_action(action, digest)
         return action
 
     except Exception:
@@ -105,8 +499,74 @@ def deserialize_action(action_data, prefer_name=None):
 # NLA: сериализация/восстановление для объекта
 # -------------------------
 
-def serialize_nla_for_object(obj):
-    """Сериализует NLA-треки объекта в словарь."""
+def _reuse_or_serialize_action(action, reuse, stats, tolerance=0.0):
+    """
+    Сериализованный Action: из reuse ({fingerprint: action dict}), если отпечаток
+    совпал и он прорежен с тем же допуском, иначе serialize_action (результат добавляется в reuse).
+    """
+    if reuse is None:
+        return serialize_action(action, tolerance=tolerance)
+    try:
+        fingerprint = action_fingerprint(action)
+    except Exception:
+        return serialize_action(action, tolerance=tolerance)
+
+    data = reuse.get(fingerprint)
+    if data is not None and data.get("key_tolerance", 0.0) == tolerance:
+        if stats is not None:
+            stats["actions_reused"] = stats.get("actions_reused", 0) + 1
+        return data
+    data = serialize_action(action, fingerprint=fingerprint, tolerance=tolerance)
+    reuse[fingerprint] = data
+    if stats is not None:
+        stats["actions_serialized"] = stats.get("actions_serialized", 0) + 1
+    return data
+
+
+def key_reduction_summary(tracks, tolerance):
+    """{"tolerance", "keys_original", "keys_stored", "ratio"} по Action треков entry (каждый Action один раз)."""
+    seen = set()
+    original = 0
+    stored = 0
+    for tr in tracks or []:
+        anim = tr.get("animation") if isinstance(tr, dict) else None
+        for t in (anim or {}).get("tracks") or []:
+            for st in t.get("strips") or []:
+                act = st.get("action")
+                if not isinstance(act, dict) or id(act) in seen:
+                    continue
+                seen.add(id(act))
+                n = sum(len(fc.get("frames") or []) for fc in act.get("fcurves") or [])
+                stored += n
+                original += int(act.get("keys_original", n) or n)
+    return {
+        "tolerance": tolerance,
+        "keys_original": original,
+        "keys_stored": stored,
+        "ratio": (stored / original) if original else 1.0,
+    }
+
+
+def actions_by_fingerprint(entry):
+    """{fingerprint: action dict} по всем стрипам entry (для повторного использования при обновлении)."""
+    res = {}
+    for tr in (entry or {}).get("tracks") or []:
+        anim = tr.get("animation") if isinstance(tr, dict) else None
+        for t in (anim or {}).get("tracks") or []:
+            for st in t.get("strips") or []:
+                act = st.get("action")
+                if isinstance(act, dict) and act.get("fingerprint"):
+                    res[act["fingerprint"]] = act
+    return res
+
+
+def serialize_nla_for_object(obj, reuse=None, stats=None, tolerance=0.0):
+    """
+    Сериализует NLA-треки объекта в словарь.
+    reuse ({fingerprint: action dict}, см. actions_by_fingerprint) — неизменённые Action
+    берутся оттуда без повторной сериализации; stats получает счётчики
+    actions_reused / actions_serialized. tolerance — допуск прореживания ключей.
+    """
     out_tracks = []
     ad = getattr(obj, "animation_data", None)
 
@@ -125,13 +585,14 @@ def serialize_nla_for_object(obj):
                 "frame_end": strip.frame_end,
                 "action_frame_start": getattr(strip, "action_frame_start", None),
                 "action_frame_end": getattr(strip, "action_frame_end", None),
-                "action": serialize_action(strip.action) if strip.action else None,
+                "action": _reuse_or_serialize_action(strip.action, reuse, stats, tolerance) if strip.action else None,
                 "repeat": getattr(strip, "repeat", None),
                 "scale": getattr(strip, "scale", None),
                 "influence": getattr(strip, "influence", None),
                 "muted": getattr(strip, "mute", False),
                 "blend_type": getattr(strip, "blend_type", "REPLACE"),
                 "use_reverse": getattr(strip, "use_reverse", False),
+                "extrapolation": getattr(strip, "extrapolation", None),
             }
             t["strips"].append(s)
 
@@ -140,16 +601,213 @@ def serialize_nla_for_object(obj):
     return {"active_action_name": active_action_name, "tracks": out_tracks}
 
 
+def _strip_start(sdata):
+    try:
+        return int(round(sdata.get("frame_start", 1.0)))
+    except Exception:
+        return 1
+
+
+# Допуск сравнения дробных параметров strip (кадры, scale, repeat, influence)
+_STRIP_FLOAT_EPS = 1e-4
+
+
+def _strip_settings(sdata):
+    """(атрибут strip, значение) сохранённых параметров; None — параметр не сохранён."""
+    return (
+        ("action_frame_start", sdata.get("action_frame_start")),
+        ("action_frame_end", sdata.get("action_frame_end")),
+        ("repeat", sdata.get("repeat")),
+        ("scale", sdata.get("scale")),
+        ("influence", sdata.get("influence")),
+        ("mute", sdata.get("muted", False)),
+        ("blend_type", sdata.get("blend_type", "REPLACE")),
+        ("use_reverse", sdata.get("use_reverse", False)),
+        ("extrapolation", sdata.get("extrapolation")),
+    )
+
+
+def _setting_equal(current, value):
+    if isinstance(value, float) or isinstance(current, float):
+        try:
+            return abs(float(current) - float(value)) <= _STRIP_FLOAT_EPS
+        except Exception:
+            return False
+    return current == value
+
+
+def _apply_strip_settings(strip, sdata):
+    """Восстанавливает параметры strip; пишет только отличающиеся значения."""
+    for attr, value in _strip_settings(sdata):
+        if value is None or not hasattr(strip, attr):
+            continue
+        try:
+            if not _setting_equal(getattr(strip, attr), value):
+                setattr(strip, attr, value)
+        except Exception:
+            pass
+
+
+def _strip_matches(strip, sdata, s_idx):
+    """
+    Тот же strip: имя, диапазон кадров, все сохранённые параметры (_strip_settings)
+    и Action с тем же содержимым (по digest).
+    """
+    try:
+        if strip.name != sdata.get("name", f"Strip_{s_idx}"):
+            return False
+        start = _strip_start(sdata)
+        if int(round(strip.frame_start)) != start:
+            return False
+        # Strip создаётся с округлённого начала: конец сравнивается с тем же сдвигом
+        end = sdata.get("frame_end")
+        if end is not None:
+            expected_end = float(end) - float(sdata.get("frame_start", start)) + start
+            if not _setting_equal(float(strip.frame_end), expected_end):
+                return False
+        for attr, value in _strip_settings(sdata):
+            if value is None or not hasattr(strip, attr):
+                continue
+            if not _setting_equal(getattr(strip, attr), value):
+                return False
+    except Exception:
+        return False
+    action_data = sdata.get("action")
+    if not action_data:
+        return strip.action is None
+    if strip.action is None:
+        return False
+    return _matches_digest(strip.action, ensure_action_digest(action_data))
+
+
+def _pair_tracks(existing, nla_tracks_data):
+    """
+    Пары (индекс существующего трека, индекс трека в данных) с одинаковыми именами,
+    в том же порядке (наибольшая общая подпоследовательность имён).
+    Blender добавляет трек только над другим треком, поэтому треки данных ниже первой
+    пары должны уместиться в несвязанные треки под ней; иначе пара отбрасывается
+    (её трек правится на месте).
+    """
+    names = [t.name for t in existing]
+    wanted = [td.get("name", f"Track_{i}") for i, td in enumerate(nla_tracks_data)]
+    n, m = len(names), len(wanted)
+    lcs = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n - 1, -1, -1):
+        for j in range(m - 1, -1, -1):
+            if names[i] == wanted[j]:
+                lcs[i][j] = lcs[i + 1][j + 1] + 1
+            else:
+                lcs[i][j] = max(lcs[i + 1][j], lcs[i][j + 1])
+    pairs = []
+    i = j = 0
+    while i < n and j < m:
+        if names[i] == wanted[j]:
+            pairs.append((i, j))
+            i += 1
+            j += 1
+        elif lcs[i + 1][j] >= lcs[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    while pairs and pairs[0][1] > pairs[0][0]:
+        pairs.pop(0)
+    return pairs
+
+
+def _new_track(ad, prev):
+    """Новый трек сразу над prev (или сверху стека, если prev нет)."""
+    if prev is None:
+        return ad.nla_tracks.new()
+    try:
+        return ad.nla_tracks.new(prev=prev)
+    except TypeError:
+        return ad.nla_tracks.new()
+
+
+def _new_strip(track, sdata, s_idx):
+    action_data = sdata.get("action")
+    action_obj = None
+
+    # Существующий Action с тем же содержимым или новый из данных
+    if action_data:
+        action_obj = deserialize_action(action_data, prefer_name=None)
+
+    start = _strip_start(sdata)
+    name = sdata.get("name", f"Strip_{s_idx}")
+
+    try:
+        strip = track.strips.new(name, start, action_obj)
+    except Exception:
+        try:
+            strip = track.strips.new(name, start, None)
+        except Exception:
+            return None
+
+    # На некоторых версиях Blender action может не назначиться с первого раза
+    try:
+        if action_obj and getattr(strip, "action", None) is None:
+            strip.action = action_obj
+    except Exception:
+        pass
+
+    # Восстанавливаем дополнительные параметры (если они поддерживаются)
+    _apply_strip_settings(strip, sdata)
+    return strip
+
+
+def _sync_track(track, tdata, t_idx, actions):
+    """
+    Приводит трек к tdata: совпадающие strip'ы (_strip_matches) остаются как есть,
+    отличающиеся и лишние удаляются, недостающие создаются. Action strip'ов
+    добавляются в actions.
+    """
+    name = tdata.get("name", f"Track_{t_idx}")
+    try:
+        if track.name != name:
+            track.name = name
+        existing = {st.name: st for st in track.strips}
+    except Exception:
+        existing = {}
+
+    strips_data = tdata.get("strips") or []
+    kept = {}
+    for s_idx, sdata in enumerate(strips_data):
+        strip = existing.get(sdata.get("name", f"Strip_{s_idx}"))
+        if strip is not None and strip.name not in kept and _strip_matches(strip, sdata, s_idx):
+            kept[strip.name] = strip
+
+    # Сначала удаляем: новые strip'ы не должны пересекаться со старыми
+    for strip_name, strip in existing.items():
+        if strip_name not in kept:
+            try:
+                track.strips.remove(strip)
+            except Exception:
+                pass
+
+    for s_idx, sdata in enumerate(strips_data):
+        strip = kept.get(sdata.get("name", f"Strip_{s_idx}"))
+        if strip is None:
+            strip = _new_strip(track, sdata, s_idx)
+        action = getattr(strip, "action", None) if strip is not None else None
+        if action and action not in actions:
+            actions.append(action)
+
+
 def deserialize_nla_for_object(obj, nla_tracks_struct):
     """
     Восстанавливает NLA-треки/стрипы объекта из словаря.
+    Текущий NLA объекта сравнивается с целевым потреково: треки сопоставляются по
+    имени в порядке стека (_pair_tracks), внутри трека остаются strip'ы с тем же
+    именем, диапазоном, параметрами и Action (по digest), пересоздаются только
+    отличающиеся. Несопоставленные треки правятся на месте или добавляются,
+    лишние удаляются.
 
     Возвращает:
-      (created_actions, saved_active_action_name)
+      (actions, saved_active_action_name) — actions: Action всех стрипов
     """
-    created_actions = []
+    actions = []
     if not nla_tracks_struct:
-        return created_actions, None
+        return actions, None
 
     nla_tracks_data = nla_tracks_struct.get("tracks", [])
     active_action_name_saved = nla_tracks_struct.get("active_action_name")
@@ -159,101 +817,46 @@ def deserialize_nla_for_object(obj, nla_tracks_struct):
 
     ad = obj.animation_data
 
-    # Удаляем все существующие NLA треки
     try:
-        for t in list(ad.nla_tracks):
-            ad.nla_tracks.remove(t)
+        existing = list(ad.nla_tracks)
     except Exception:
-        pass
-
-    # Создаём новые треки/стрипы
+        existing = []
+    pairs = _pair_tracks(existing, nla_tracks_data)
+    paired = {j: i for i, j in pairs}
+    paired_existing = sorted(paired.values())
+
+    used = set()
+    cursor = 0
+    prev = None
     for t_idx, tdata in enumerate(nla_tracks_data):
-        try:
-            track = ad.nla_tracks.new()
-            track.name = tdata.get("name", f"Track_{t_idx}")
-        except Exception:
-            continue
-
-        for s_idx, sdata in enumerate(tdata.get("strips") or []):
-            action_data = sdata.get("action")
-            action_obj = None
-
-            # Если Action уже есть в bpy.data — берём его
-            if action_data:
-                orig_name = action_data.get("name")
-                if orig_name and bpy.data.actions.get(orig_name):
-                    action_obj = bpy.data.actions.get(orig_name)
-
-            # Иначе создаём новый Action из данных
-            if not action_obj and action_data:
-                action_obj = deserialize_action(action_data, prefer_name=None)
-
-            try:
-                start = int(round(sdata.get("frame_start", 1.0)))
-            except Exception:
-                start = 1
-
-            # Создаём strip
-            try:
-                strip = track.strips.new(sdata.get("name", f"Strip_{s_idx}"), start, action_obj)
-            except Exception:
+        if t_idx in paired:
+            cursor = paired[t_idx]
+            track = existing[cursor]
+            cursor += 1
+        else:
+            # Свободный трек между соседними парами правится на месте, иначе добавляется новый
+            bound = next((i for i in paired_existing if i >= cursor), len(existing))
+            if cursor < bound:
+                track = existing[cursor]
+                cursor += 1
+            else:
                 try:
-                    strip = track.strips.new(sdata.get("name", f"Strip_{s_idx}"), start, None)
+                    track = _new_track(ad, prev)
                 except Exception:
                     continue
+        if cursor and existing[cursor - 1] is track:
+            used.add(cursor - 1)
+        _sync_track(track, tdata, t_idx, actions)
+        prev = track
 
-            # На некоторых версиях Blender action может не назначиться с первого раза
-            try:
-                if action_obj and getattr(strip, "action", None) is None:
-                    strip.action = action_obj
-            except Exception:
-                pass
-
-            # Восстанавливаем дополнительные параметры (если они поддерживаются)
-            try:
-                if sdata.get("action_frame_start") is not None and hasattr(strip, "action_frame_start"):
-                    strip.action_frame_start = sdata.get("action_frame_start")
-            except Exception:
-                pass
-            try:
-                if sdata.get("action_frame_end") is not None and hasattr(strip, "action_frame_end"):
-                    strip.action_frame_end = sdata.get("action_frame_end")
-            except Exception:
-                pass
-            try:
-                if sdata.get("repeat") is not None and hasattr(strip, "repeat"):
-                    strip.repeat = sdata.get("repeat")
-            except Exception:
-                pass
-            try:
-                if sdata.get("scale") is not None and hasattr(strip, "scale"):
-                    strip.scale = sdata.get("scale")
-            except Exception:
-                pass
-            try:
-                if sdata.get("influence") is not None and hasattr(strip, "influence"):
-                    strip.influence = sdata.get("influence")
-            except Exception:
-                pass
-            try:
-                if hasattr(strip, "mute"):
-                    strip.mute = sdata.get("muted", False)
-            except Exception:
-                pass
-            try:
-                strip.blend_type = sdata.get("blend_type", "REPLACE")
-            except Exception:
-                pass
+    for i, track in enumerate(existing):
+        if i not in used:
             try:
-                if hasattr(strip, "use_reverse"):
-                    strip.use_reverse = sdata.get("use_reverse", False)
+                ad.nla_tracks.remove(track)
             except Exception:
                 pass
 
-            if action_obj and action_obj not in created_actions:
-                created_actions.append(action_obj)
-
-    return created_actions, active_action_name_saved
+    return actions, active_action_name_saved
 
 
 def pushdown_action_to_nla(obj, action, start_frame=None):
@@ -285,18 +888,50 @@ def pushdown_action_to_nla(obj, action, start_frame=None):
         return None
 
 
+def action_usage_index(objects=None):
+    """
+    Обратный индекс использования Action за один проход по объектам:
+      {action name: {"strips": [(obj, track, strip), ...], "active": [obj, ...]}}
+    """
+    index = {}
+    for obj in (bpy.data.objects if objects is None else objects):
+        ad = getattr(obj, "animation_data", None)
+        if not ad:
+            continue
+        try:
+            if ad.action:
+                index.setdefault(ad.action.name, {"strips": [], "active": []})["active"].append(obj)
+        except Exception:
+            pass
+        try:
+            for track in ad.nla_tracks:
+                for strip in track.strips:
+                    if strip.action:
+                        index.setdefault(strip.action.name, {"strips": [], "active": []})["strips"].append(
+                            (obj, track, strip)
+                        )
+        except Exception:
+            pass
+    return index
+
+
 # -------------------------
 # Фильтр: надо ли включать объект в библиотеку
 # -------------------------
 
+# Кривые, ради которых объект имеет смысл сохранять в библиотеку:
+#   - location / rotation_* / scale
+#   - color или ["alpha"] (для alpha_tracks в three_*.json)
+TRANSFORM_DATA_PATHS = frozenset((
+    "location", "rotation_euler", "rotation_quaternion", "scale",
+    "color", '["alpha"]',
+))
+
+
 def nla_has_transform_curves(nla_struct):
     """
     Проверяет, есть ли в NLA структуре хоть какие-то кривые,
-    ради которых объект имеет смысл сохранять в библиотеку.
-
-    Сейчас считаем важными:
-      - location / rotation_* / scale
-      - color или ["alpha"] (для alpha_tracks в three_*.json)
+    ради которых объект имеет смысл сохранять в библиотеку (TRANSFORM_DATA_PATHS).
     """
     if not nla_struct:
         return False
@@ -305,10 +940,48 @@ def nla_has_transform_curves(nla_struct):
         for st in (tr.get("strips") or []):
             act = (st.get("action") or {})
             for fc in (act.get("fcurves") or []):
-                dp = fc.get("data_path")
-                if dp in ("location", "rotation_euler", "rotation_quaternion", "scale"):
-                    return True
-                if dp == "color" or dp == '["alpha"]':
+                if fc.get("data_path") in TRANSFORM_DATA_PATHS:
                     return True
 
-    return False
\ No newline at end of file
+    return False
+
+
+def _action_has_transform_curves(action, memo):
+    """По data_path кривых Action (ключи не читаются); результат кешируется в memo по имени."""
+    key = action.name
+    if key not in memo:
+        try:
+            memo[key] = any(fc.data_path in TRANSFORM_DATA_PATHS for fc in action.fcurves)
+        except Exception:
+            memo[key] = True
+    return memo[key]
+
+
+def plan_capture(objs):
+    """
+    Дешёвый отбор объектов перед serialize_nla_for_object: остаются только объекты,
+    у которых в NLA есть стрип с Action, содержащим кривые из TRANSFORM_DATA_PATHS
+    (только такие переживут nla_has_transform_curves).
+
+    Возвращает (candidates, stats), stats = {"total", "candidates", "skipped"}.
+    """
+    memo = {}
+    candidates = []
+    total = 0
+    for obj in objs:
+        total += 1
+        ad = getattr(obj, "animation_data", None)
+        if not ad:
+            continue
+        try:
+            found = any(
+                strip.action is not None and _action_has_transform_curves(strip.action, memo)
+                for track in ad.nla_tracks
+                for strip in track.strips
+            )
+        except Exception:
+            found = True
+        if found:
+            candidates.append(obj)
+
+    return candidates, {"total": total, "candidates": len(candidates), "skipped": total - len(candidates)}
\ No newline at end of file
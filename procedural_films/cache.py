@@ -0,0 +1,121 @@
+import sys
+from collections import OrderedDict
+
+# =========================================================
+# LRU-КЕШ С ОГРАНИЧЕНИЕМ ПО ПАМЯТИ
+# Размер значения оценивается один раз при вставке (estimate_size);
+# при превышении бюджета вытесняются давно не использованные значения.
+# Без bpy.
+# =========================================================
+
+DEFAULT_BUDGET_MB = 256
+
+
+def estimate_size(obj, skip=None):
+    """
+    Примерный размер объекта в памяти (байты): sys.getsizeof по всему дереву
+    dict/list/tuple, общие объекты считаются один раз.
+    skip(obj) -> True: не заходить в объект (он учитывается в другом месте).
+    """
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        if skip is not None and o is not obj and skip(o):
+            continue
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
+    return total
+
+
+class SizedLRU:
+    """key -> value с бюджетом в байтах и счётчиками hits/misses/evictions."""
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024):
+        self._items = OrderedDict()   # key -> (value, size)
+        self.budget = int(budget_bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        return list(self._items.keys())
+
+    def peek(self, key, default=None):
+        """Значение без учёта в статистике и без обновления порядка."""
+        item = self._items.get(key)
+        return item[0] if item is not None else default
+
+    def get(self, key, default=None):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, size):
+        """Положить значение; значения больше всего бюджета не кешируются. Возвращает True, если положено."""
+        self.pop(key)
+        size = int(size)
+        if size > self.budget:
+            self.rejected += 1
+            return False
+        self._items[key] = (value, size)
+        self.bytes += size
+        self._evict()
+        return True
+
+    def pop(self, key, default=None):
+        item = self._items.pop(key, None)
+        if item is None:
+            return default
+        self.bytes -= item[1]
+        return item[0]
+
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+
+    def set_budget(self, budget_bytes):
+        self.budget = int(budget_bytes)
+        self._evict()
+
+    def _evict(self):
+        while self.bytes > self.budget and self._items:
+            _key, (_value, size) = self._items.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "bytes": self.bytes,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = self.rejected = 0
@@ -7,8 +7,51 @@ MODULE_ID = "procedural_films"
 MODULE_NAME = "Библиотека анимаций"
 
 # Имя Text-блока внутри .blend для хранения библиотеки
+# (старый монолитный формат: читается и автоматически мигрирует в шарды)
 FILMS_TEXT_NAME = "procedural_animations.json"
 
+# Шардированная библиотека: маленький индекс + один Text-блок на анимацию
+FILMS_INDEX_TEXT_NAME = "procedural_animations.index.json"
+FILMS_SHARD_PREFIX = "procedural_animations/"
+
+# Пул Action: каждый Action хранится один раз, entry ссылаются на него по digest
+ACTION_POOL_TEXT_PREFIX = "procedural_actions/"
+EXTERNAL_ACTION_POOL_DIR = "_actions"
+# Файлы пула моложе этого не удаляются сборщиком: другой Blender мог записать
+# Action, но ещё не успеть записать ссылающуюся на него анимацию
+ACTION_GC_GRACE_SECONDS = 600
+
+# История версий анимации: один Text-блок на анимацию (base + дельты)
+FILMS_HISTORY_PREFIX = "procedural_history/"
+# Сколько версий хранить; более старые дельты сворачиваются в base
+HISTORY_KEEP_VERSIONS = 20
+
+# Библиотека в SQLite (настройка library_backend = "SQLITE"):
+# файл по умолчанию кладётся во внешнюю папку анимаций
+SQLITE_LIBRARY_NAME = "library.sqlite"
+
+# Манифест внешней папки (только метаданные: имя, дата, диапазон, размер...)
+# Без расширения .json, чтобы не попадать в сканирование библиотеки
+EXTERNAL_MANIFEST_NAME = ".procedural_films_manifest"
+
+# Версия формата entry:
+#   1 — ключи как список {"co": [x, y], "interpolation": "..."}
+#   2 — колонки fcurve: "frames" / "values" / "interpolation" (коды ниже);
+#       необязательно "handle_left" / "handle_right" ([x0, y0, x1, y1, ...]) и
+#       "handle_types" ([left0, right0, left1, right1, ...], коды HANDLE_TYPES) —
+#       только если у кривой есть не-автоматические ручки
+ENTRY_FORMAT_VERSION = 2
+
+# Коды интерполяции в колоночном формате (порядок совпадает с DNA BEZT_IPO_*)
+INTERPOLATION_MODES = (
+    "CONSTANT", "LINEAR", "BEZIER",
+    "BACK", "BOUNCE", "CIRC", "CUBIC", "ELASTIC",
+    "EXPO", "QUAD", "QUART", "QUINT", "SINE",
+)
+
+# Коды типов ручек (порядок совпадает с DNA HD_*)
+HANDLE_TYPES = ("FREE", "AUTO", "VECTOR", "ALIGNED", "AUTO_CLAMPED")
+
 # Настройки экспорта в three.js
 ROT_BAKE_STEP_FRAMES = 24
 
@@ -16,5 +59,13 @@ ROT_BAKE_STEP_FRAMES = 24
 CAMERA_BAKE_EVERY_FRAME = True
 CAMERA_BAKE_STEP_FRAMES = 6
 
+# Custom property с content digest сериализованного Action, из которого он создан
+# (повторное применение переиспользует Action только при совпадении digest)
+ACTION_DIGEST_PROP = "umz_digest"
+
+# Custom property с action_fingerprint Action на момент пометки digest:
+# если кривые с тех пор правили, отпечаток не совпадёт и Action не переиспользуется
+ACTION_FINGERPRINT_PROP = "umz_fingerprint"
+
 # Имя custom property для стабильного id ноды (для glTF/three)
 GLTF_ID_PROP = "gltf_id"
\ No newline at end of file
@@ -0,0 +1,133 @@
+import gzip
+import io
+import json
+import lzma
+import os
+
+# =========================================================
+# ФОРМАТЫ ФАЙЛОВ БИБЛИОТЕКИ (<name>.json / .json.gz / .json.xz)
+# Только stdlib и байты — без bpy, можно звать из фонового потока.
+# =========================================================
+
+# Режим сжатия (значение настройки аддона library_compression) -> расширение
+COMPRESSION_EXTENSIONS = {
+    "NONE": ".json",
+    "GZIP": ".json.gz",
+    "XZ": ".json.xz",
+}
+
+# Порядок важен: длинные суффиксы проверяются раньше ".json"
+LIBRARY_SUFFIXES = (".json.gz", ".json.xz", ".json")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def normalize_compression(compression):
+    c = str(compression or "NONE").upper()
+    return c if c in COMPRESSION_EXTENSIONS else "NONE"
+
+
+def three_clip_compression(compression):
+    """
+    Сжатие клипа для three.js: браузер распаковывает только gzip (DecompressionStream),
+    поэтому XZ библиотеки для клипа заменяется на GZIP.
+    """
+    compression = normalize_compression(compression)
+    return "GZIP" if compression == "XZ" else compression
+
+
+def library_file_name(stem, compression="NONE"):
+    return f"{stem}{COMPRESSION_EXTENSIONS[normalize_compression(compression)]}"
+
+
+def split_library_file_name(fname):
+    """'walk.json.gz' -> ('walk', 'GZIP'); не файл библиотеки -> (None, None)."""
+    low = fname.lower()
+    for suffix in LIBRARY_SUFFIXES:
+        if low.endswith(suffix):
+            for compression, ext in COMPRESSION_EXTENSIONS.items():
+                if ext == suffix:
+                    return fname[:-len(suffix)], compression
+    return None, None
+
+
+def is_library_file_name(fname):
+    return split_library_file_name(fname)[0] is not None
+
+
+def encode_json(data, compression="NONE", indent=None):
+    """JSON -> bytes (utf-8), при необходимости сжатые gzip/lzma."""
+    if indent is None:
+        s = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        s = json.dumps(data, ensure_ascii=False, indent=indent)
+    raw = s.encode("utf-8")
+
+    compression = normalize_compression(compression)
+    if compression == "GZIP":
+        return gzip.compress(raw, compresslevel=6)
+    if compression == "XZ":
+        return lzma.compress(raw, preset=6)
+    return raw
+
+
+def decode_json_bytes(raw):
+    """Формат определяется по сигнатуре, а не по расширению."""
+    if raw[:2] == _GZIP_MAGIC:
+        raw = gzip.decompress(raw)
+    elif raw[:6] == _XZ_MAGIC:
+        raw = lzma.decompress(raw)
+    return json.loads(raw.decode("utf-8"))
+
+
+def read_json_file(path):
+    with open(path, "rb") as f:
+        return decode_json_bytes(f.read())
+
+
+class JsonStreamWriter:
+    """
+    Потоковая запись текста (JSON по частям) в <path> с тем же сжатием, что у encode_json.
+    Пишется во временный файл рядом с path; commit() атомарно подменяет path, abort() удаляет temp.
+    """
+
+    def __init__(self, path, compression="NONE"):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._tmp = f"{path}.{os.getpid()}.stream.tmp"
+        self._raw = open(self._tmp, "wb")
+        compression = normalize_compression(compression)
+        if compression == "GZIP":
+            self._packed = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        elif compression == "XZ":
+            self._packed = lzma.LZMAFile(self._raw, mode="wb", preset=6)
+        else:
+            self._packed = None
+        self._text = io.TextIOWrapper(self._packed or self._raw, encoding="utf-8")
+
+    def write(self, s):
+        self._text.write(s)
+
+    def commit(self):
+        self._text.flush()
+        self._text.detach()
+        if self._packed is not None:
+            # Дописывает хвост gzip/xz; исходный файл при этом не закрывается
+            self._packed.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        try:
+            self._raw.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self._tmp)
+        except Exception:
+            pass
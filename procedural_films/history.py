@@ -0,0 +1,236 @@
+import copy
+
+# =========================================================
+# ИСТОРИЯ ВЕРСИЙ АНИМАЦИИ (дельты между версиями entry)
+# Документ истории:
+#   {"version": 1, "name": ...,
+#    "base":   {"number": 1, "created_at": ..., "entry": <полный entry>},
+#    "deltas": [{"number": 2, "created_at": ..., "delta": <дельта к предыдущей>}, ...]}
+#
+# Дельта хранится на уровне треков объектов и fcurves:
+#   - изменившиеся поля entry (кроме "tracks") — "set" / "unset";
+#   - трек объекта, у которого поменялась структура NLA, — целиком в "tracks_set";
+#   - если структура та же — только изменившиеся fcurves стрипов ("fcurves").
+# Последняя версия == текущий entry библиотеки.
+# Здесь нет bpy и нет хранения (Text-блоки — в storage.py).
+# =========================================================
+
+HISTORY_FORMAT_VERSION = 1
+
+# Производные от кривых ключи Action: после применения дельты к кривым они устаревают
+_ACTION_DERIVED_KEYS = ("digest", "fingerprint", "keys_original")
+
+
+def _track_key(tr):
+    return tr.get("object_name") if isinstance(tr, dict) else None
+
+
+def _fcurve_key(fc):
+    return f'{fc.get("data_path")}[{int(fc.get("array_index", 0) or 0)}]'
+
+
+def _strip_skeleton(strip):
+    """Стрип без кривых Action: по нему понимаем, совпадает ли структура NLA."""
+    out = {k: v for k, v in strip.items() if k != "action"}
+    act = strip.get("action")
+    if isinstance(act, dict):
+        out["action"] = {k: v for k, v in act.items() if k != "fcurves" and k not in _ACTION_DERIVED_KEYS}
+    else:
+        out["action"] = None
+    return out
+
+
+def _track_skeleton(tr):
+    anim = tr.get("animation") or {}
+    return {
+        "object_name": tr.get("object_name"),
+        "extra": {k: v for k, v in tr.items() if k not in ("object_name", "animation")},
+        "anim": {k: v for k, v in anim.items() if k != "tracks"},
+        "tracks": [
+            {
+                "name": t.get("name"),
+                "strips": [_strip_skeleton(s) for s in (t.get("strips") or [])],
+            }
+            for t in (anim.get("tracks") or [])
+        ],
+    }
+
+
+def _iter_strip_actions(tr):
+    """Yield ("<nla_index>/<strip_index>", action dict or None)."""
+    anim = tr.get("animation") or {}
+    for t_idx, t in enumerate(anim.get("tracks") or []):
+        for s_idx, s in enumerate(t.get("strips") or []):
+            act = s.get("action")
+            yield f"{t_idx}/{s_idx}", act if isinstance(act, dict) else None
+
+
+def _diff_fcurves(old_act, new_act):
+    old_fcs = {_fcurve_key(fc): fc for fc in (old_act or {}).get("fcurves") or []}
+    new_list = (new_act or {}).get("fcurves") or []
+    new_fcs = {_fcurve_key(fc): fc for fc in new_list}
+
+    changed = [fc for key, fc in new_fcs.items() if old_fcs.get(key) != fc]
+    removed = [key for key in old_fcs if key not in new_fcs]
+    order = [_fcurve_key(fc) for fc in new_list]
+    if not changed and not removed and order == list(old_fcs.keys()):
+        return None
+    return {"set": changed, "remove": removed, "order": order}
+
+
+def diff_entries(old, new):
+    """Дельта old -> new (см. описание формата в шапке модуля)."""
+    delta = {"set": {}, "unset": [], "order": [], "tracks_set": {}, "fcurves": {}}
+
+    for k, v in new.items():
+        if k != "tracks" and old.get(k) != v:
+            delta["set"][k] = v
+    for k in old:
+        if k != "tracks" and k not in new:
+            delta["unset"].append(k)
+
+    old_tracks = {_track_key(tr): tr for tr in (old.get("tracks") or [])}
+    for tr in (new.get("tracks") or []):
+        key = _track_key(tr)
+        delta["order"].append(key)
+        prev = old_tracks.get(key)
+        if prev == tr:
+            continue
+        if prev is None or _track_skeleton(prev) != _track_skeleton(tr):
+            delta["tracks_set"][key] = tr
+            continue
+
+        strip_deltas = {}
+        prev_actions = dict(_iter_strip_actions(prev))
+        for path, act in _iter_strip_actions(tr):
+            d = _diff_fcurves(prev_actions.get(path), act)
+            if d:
+                strip_deltas[path] = d
+        if strip_deltas:
+            delta["fcurves"][key] = strip_deltas
+
+    return delta
+
+
+def _apply_fcurve_delta(act, d):
+    fcs = {_fcurve_key(fc): fc for fc in (act or {}).get("fcurves") or []}
+    for key in d.get("remove") or []:
+        fcs.pop(key, None)
+    for fc in d.get("set") or []:
+        fcs[_fcurve_key(fc)] = fc
+    out = {k: v for k, v in (act or {}).items() if k not in _ACTION_DERIVED_KEYS}
+    out["fcurves"] = [fcs[key] for key in (d.get("order") or []) if key in fcs]
+    return out
+
+
+def _apply_track_fcurves(tr, strip_deltas):
+    tr = copy.copy(tr)
+    anim = dict(tr.get("animation") or {})
+    nla_tracks = []
+    for t_idx, t in enumerate(anim.get("tracks") or []):
+        strips = []
+        for s_idx, s in enumerate(t.get("strips") or []):
+            d = strip_deltas.get(f"{t_idx}/{s_idx}")
+            if d:
+                s = dict(s)
+                s["action"] = _apply_fcurve_delta(s.get("action"), d)
+            strips.append(s)
+        nla_tracks.append(dict(t, strips=strips))
+    anim["tracks"] = nla_tracks
+    tr["animation"] = anim
+    return tr
+
+
+def apply_delta(entry, delta):
+    """Версия N-1 + дельта -> версия N. Неизменённые части разделяются с entry."""
+    out = {k: v for k, v in entry.items() if k not in (delta.get("unset") or [])}
+    out.update(delta.get("set") or {})
+
+    old_tracks = {_track_key(tr): tr for tr in (entry.get("tracks") or [])}
+    tracks_set = delta.get("tracks_set") or {}
+    fcurves = delta.get("fcurves") or {}
+
+    tracks = []
+    for key in delta.get("order") or []:
+        if key in tracks_set:
+            tracks.append(tracks_set[key])
+        elif key in old_tracks:
+            tr = old_tracks[key]
+            if key in fcurves:
+                tr = _apply_track_fcurves(tr, fcurves[key])
+            tracks.append(tr)
+    out["tracks"] = tracks
+    return out
+
+
+# -------------------------
+# Документ истории
+# -------------------------
+
+def new_history(name, entry, created_at=None):
+    return {
+        "version": HISTORY_FORMAT_VERSION,
+        "name": name,
+        "base": {"number": 1, "created_at": created_at or entry.get("created_at"), "entry": entry},
+        "deltas": [],
+    }
+
+
+def latest_number(doc):
+    deltas = doc.get("deltas") or []
+    return deltas[-1]["number"] if deltas else doc["base"]["number"]
+
+
+def append_version(doc, prev_entry, new_entry, created_at=None):
+    """Добавляет версию new_entry (prev_entry — текущая последняя версия). Возвращает её номер."""
+    number = latest_number(doc) + 1
+    doc.setdefault("deltas", []).append({
+        "number": number,
+        "created_at": created_at or new_entry.get("created_at"),
+        "delta": diff_entries(prev_entry, new_entry),
+    })
+    return number
+
+
+def list_versions(doc):
+    """[(number, created_at)] от старой к новой."""
+    res = [(doc["base"]["number"], doc["base"].get("created_at"))]
+    for d in doc.get("deltas") or []:
+        res.append((d["number"], d.get("created_at")))
+    return res
+
+
+def reconstruct(doc, number):
+    """entry версии number или None, если такой версии нет (или она уже свёрнута)."""
+    base = doc["base"]
+    if number < base["number"]:
+        return None
+    entry = base["entry"]
+    if number == base["number"]:
+        return entry
+    for d in doc.get("deltas") or []:
+        entry = apply_delta(entry, d["delta"])
+        if d["number"] == number:
+            return entry
+    return None
+
+
+def compact(doc, keep=10):
+    """
+    Сворачивает старые дельты в base так, чтобы осталось не больше keep версий.
+    Версии старше новой base после этого недоступны. Возвращает число свёрнутых дельт.
+    """
+    keep = max(1, int(keep))
+    deltas = doc.get("deltas") or []
+    drop = len(deltas) + 1 - keep
+    if drop <= 0:
+        return 0
+
+    base = doc["base"]
+    entry = base["entry"]
+    for d in deltas[:drop]:
+        entry = apply_delta(entry, d["delta"])
+    last = deltas[drop - 1]
+    doc["base"] = {"number": last["number"], "created_at": last.get("created_at"), "entry": entry}
+    doc["deltas"] = deltas[drop:]
+    return drop
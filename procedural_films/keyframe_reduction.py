@@ -0,0 +1,118 @@
+from .constants import INTERPOLATION_MODES
+
+# =========================================================
+# ПРОРЕЖИВАНИЕ КЛЮЧЕЙ ПРИ ЗАХВАТЕ (запечённый mocap / симуляции)
+# Ключ выбрасывается, если кривая без него отличается от исходной по значению
+# не больше чем на tolerance (Ramer–Douglas–Peucker по вертикальной ошибке).
+#
+#   LINEAR   — граница ошибки точная;
+#   BEZIER   — прореживаются только плотные участки (шаг <= 1 кадр), редкие ручные
+#              ключи не трогаем; оставшиеся ключи прореженного участка становятся
+#              LINEAR (авто-ручки Bezier по редким ключам дали бы выброс за tolerance),
+#              поэтому граница ошибки тоже точная;
+#              авто-ручки считаются по соседним ключам, поэтому у каждого оставшегося
+#              BEZIER-сегмента (например, из участка в следующий) сохраняются и соседи
+#              его концов — форма сегмента не меняется;
+#   CONSTANT — выбрасываются ключи, повторяющие предыдущее значение;
+#   прочие   — без изменений.
+# Ключи на стыке разных интерполяций, первый и последний ключ сохраняются всегда.
+# Без bpy.
+# =========================================================
+
+_LINEAR = INTERPOLATION_MODES.index("LINEAR")
+_BEZIER = INTERPOLATION_MODES.index("BEZIER")
+_CONSTANT = INTERPOLATION_MODES.index("CONSTANT")
+
+# Шаг между ключами, при котором BEZIER-участок считается запечённым
+DENSE_STEP_FRAMES = 1.0
+
+
+def _rdp_keep(frames, values, lo, hi, tolerance, keep):
+    """Отмечает в keep ключи участка [lo, hi], без которых ошибка превысит tolerance."""
+    stack = [(lo, hi)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        fa, va = frames[a], values[a]
+        span = frames[b] - fa
+        slope = (values[b] - va) / span if span else 0.0
+        worst = -1.0
+        worst_i = -1
+        for i in range(a + 1, b):
+            err = abs(values[i] - (va + slope * (frames[i] - fa)))
+            if err > worst:
+                worst = err
+                worst_i = i
+        if worst > tolerance:
+            keep[worst_i] = True
+            stack.append((a, worst_i))
+            stack.append((worst_i, b))
+
+
+def _reducible_run(frames, codes, lo, hi):
+    code = codes[lo]
+    if code == _LINEAR:
+        return True
+    if code == _BEZIER:
+        return all(frames[i + 1] - frames[i] <= DENSE_STEP_FRAMES for i in range(lo, hi))
+    return False
+
+
+def reduce_keyframes(frames, values, codes, tolerance):
+    """
+    Прореживает колонки ключей одной fcurve. Возвращает (frames, values, codes);
+    при tolerance <= 0 или меньше трёх ключей — исходные списки.
+    В прореженных плотных BEZIER-участках коды оставшихся ключей заменяются на LINEAR.
+    """
+    n = len(frames)
+    if tolerance <= 0 or n < 3:
+        return frames, values, codes
+
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    out_codes = list(codes)
+    thinned = []   # прореженные плотные BEZIER-участки (lo, hi)
+
+    # Участки одинаковой интерполяции: [lo, hi] включительно
+    lo = 0
+    while lo < n - 1:
+        hi = lo
+        while hi + 1 < n and codes[hi + 1] == codes[lo]:
+            hi += 1
+        keep[lo] = keep[hi] = True
+
+        if codes[lo] == _CONSTANT:
+            last = values[lo]
+            for i in range(lo + 1, hi + 1):
+                if abs(values[i] - last) > tolerance:
+                    keep[i] = True
+                    last = values[i]
+        elif _reducible_run(frames, codes, lo, hi):
+            _rdp_keep(frames, values, lo, hi, tolerance, keep)
+            # Последний ключ участка задаёт сегмент к следующему участку — его код не меняем
+            if codes[lo] == _BEZIER and not all(keep[lo:hi + 1]):
+                for i in range(lo, hi):
+                    out_codes[i] = _LINEAR
+                thinned.append((lo, hi))
+        else:
+            for i in range(lo, hi + 1):
+                keep[i] = True
+        lo = hi + 1
+
+    # Авто-ручки концов BEZIER-сегмента зависят от соседних ключей: их не выбрасываем
+    for i in range(n - 1):
+        if out_codes[i] == _BEZIER:
+            if i > 0:
+                keep[i - 1] = True
+            if i + 2 < n:
+                keep[i + 2] = True
+    # Участок, которому вернули все ключи, остаётся BEZIER как был
+    for lo, hi in thinned:
+        if all(keep[lo:hi + 1]):
+            out_codes[lo:hi] = codes[lo:hi]
+
+    idx = [i for i in range(n) if keep[i]]
+    if len(idx) == n:
+        return frames, values, codes
+    return [frames[i] for i in idx], [values[i] for i in idx], [out_codes[i] for i in idx]
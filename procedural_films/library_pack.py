@@ -0,0 +1,100 @@
+import json
+import mmap
+import struct
+
+# =========================================================
+# УПАКОВАННАЯ БИБЛИОТЕКА (*.pfpack)
+# Несколько анимаций в одном файле + индекс в заголовке:
+#
+#   b"PFPACK1\n"                     сигнатура (8 байт)
+#   <uint64 little-endian>           длина заголовка
+#   <заголовок JSON utf-8>           {"version", "animations": {name: {"offset", "length", "meta"}},
+#                                     "actions": {digest: {"offset", "length"}}}
+#   <данные>                         компактные JSON-блобы; offset считается от начала данных
+#
+# Список анимаций читается только из заголовка, одна анимация — только свой срез (через mmap).
+# Без bpy: кодирование можно делать в фоновом потоке.
+# =========================================================
+
+PACK_MAGIC = b"PFPACK1\n"
+PACK_EXTENSION = ".pfpack"
+PACK_VERSION = 1
+
+_LEN = struct.Struct("<Q")
+
+
+def _dumps_bytes(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_pack(data):
+    """
+    data = {"animations": {name: (entry, meta)}, "actions": {digest: action}}
+    -> bytes файла .pfpack.
+    """
+    blobs = []
+    offset = 0
+    anims_header = {}
+    actions_header = {}
+
+    for name, (entry, meta) in data.get("animations", {}).items():
+        blob = _dumps_bytes(entry)
+        anims_header[name] = {"offset": offset, "length": len(blob), "meta": dict(meta, size=len(blob))}
+        blobs.append(blob)
+        offset += len(blob)
+
+    for digest, act in data.get("actions", {}).items():
+        blob = _dumps_bytes(act)
+        actions_header[digest] = {"offset": offset, "length": len(blob)}
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = _dumps_bytes({
+        "version": PACK_VERSION,
+        "animations": anims_header,
+        "actions": actions_header,
+    })
+    return b"".join([PACK_MAGIC, _LEN.pack(len(header)), header] + blobs)
+
+
+def read_pack_header(path):
+    """
+    Читает только заголовок. Возвращает (header, data_start) или бросает ValueError.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+            raise ValueError("not a pfpack file")
+        raw_len = f.read(_LEN.size)
+        if len(raw_len) != _LEN.size:
+            raise ValueError("truncated pfpack header")
+        (header_len,) = _LEN.unpack(raw_len)
+        raw = f.read(header_len)
+        if len(raw) != header_len:
+            raise ValueError("truncated pfpack header")
+
+    header = json.loads(raw.decode("utf-8"))
+    if not isinstance(header, dict) or header.get("version") != PACK_VERSION:
+        raise ValueError("unsupported pfpack version")
+    return header, len(PACK_MAGIC) + _LEN.size + header_len
+
+
+def read_pack_slice(path, start, length):
+    """Читает байты [start, start+length) через mmap (обычное чтение, если mmap недоступен)."""
+    with open(path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if start + length > len(mm):
+                    raise ValueError("pfpack slice out of range")
+                return mm[start:start + length]
+        except OSError:
+            f.seek(start)
+            raw = f.read(length)
+            if len(raw) != length:
+                raise ValueError("pfpack slice out of range")
+            return raw
+
+
+def read_pack_item(path, data_start, rec):
+    """Декодирует один блоб по записи заголовка {"offset", "length"}."""
+    raw = read_pack_slice(path, data_start + int(rec["offset"]), int(rec["length"]))
+    return json.loads(raw.decode("utf-8"))
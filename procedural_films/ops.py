@@ -1,27 +1,46 @@
 import bpy
 import os
+import time
 from datetime import datetime
 
+from .constants import ENTRY_FORMAT_VERSION
 from .storage import (
-    read_internal_films,
-    write_internal_films,
+    read_internal_film,
+    write_internal_film,
+    remove_internal_film,
     write_animation_to_file,
     remove_animation_file,
-    read_all_films_cached,
-    read_external_films,
+    read_manifest_cached,
+    get_film,
     mark_cache_dirty,
     get_external_folder,
+    get_library_compression,
+    record_film_version,
+    read_film_version,
+    compact_film_history,
+    remove_film_history,
+    find_animations,
+    write_animation_streamed,
+    iter_internal_film_tracks,
 )
+from . import write_queue
 from .blender_codec import (
     serialize_nla_for_object,
     deserialize_nla_for_object,
     deserialize_action,
     pushdown_action_to_nla,
     nla_has_transform_curves,
+    plan_capture,
+    actions_by_fingerprint,
+    action_usage_index,
+    ensure_action_digest,
+    find_action_by_digest,
+    key_reduction_summary,
 )
 from .three_export import (
     build_three_clip_from_saved_entry,
     write_three_animation_to_file,
+    three_clip_paths,
 )
 from .text_utils import (
     read_active_text,
@@ -84,7 +103,12 @@ def _restore_text_editor_content(content):
 
 
 def create_animation_entry(name, description=""):
-    return {"created_at": datetime.now().isoformat(), "description": description, "tracks": []}
+    return {
+        "format_version": ENTRY_FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "description": description,
+        "tracks": [],
+    }
 
 
 def _clear_animation_on_object(obj):
@@ -113,9 +137,76 @@ def _clear_animation_on_object(obj):
         pass
 
 
+def _capture_tolerance():
+    """Допуск прореживания ключей при захвате (scene.umz_capture_tolerance, 0 — выключено)."""
+    try:
+        return max(0.0, float(getattr(bpy.context.scene, "umz_capture_tolerance", 0.0) or 0.0))
+    except Exception:
+        return 0.0
+
+
+def _capture_tracks(objs, prev_entry=None, tolerance=0.0):
+    """
+    Треки объектов для entry. Сериализуются только объекты, отобранные plan_capture;
+    Action, чей отпечаток совпал с Action из prev_entry, берутся оттуда как есть.
+    Возвращает (tracks, stats): skipped — пропущено объектов без сериализации,
+    actions_reused / actions_serialized — сколько Action взято из prev_entry / сериализовано.
+    """
+    candidates, stats = plan_capture(objs)
+    tracks = list(_iter_capture_tracks(candidates, stats, actions_by_fingerprint(prev_entry), tolerance))
+    return tracks, stats
+
+
+def _iter_capture_tracks(candidates, stats, reuse=None, tolerance=0.0):
+    """Генератор треков: объекты сериализуются по одному по мере чтения (счётчики stats — см. _capture_tracks)."""
+    stats["actions_reused"] = 0
+    stats["actions_serialized"] = 0
+    stats["captured"] = 0
+    for obj in candidates:
+        nla_struct = serialize_nla_for_object(obj, reuse, stats, tolerance)
+        if nla_struct and nla_has_transform_curves(nla_struct):
+            stats["captured"] += 1
+            yield {"object_name": obj.name, "animation": nla_struct}
+
+
+def _stream_key_reduction(tracks, entry, tolerance, stats):
+    """Пропускает треки насквозь, по ходу собирая entry["key_reduction"] (как _set_key_reduction)."""
+    original = 0
+    stored = 0
+    for tr in tracks:
+        if tolerance > 0:
+            part = key_reduction_summary([tr], tolerance)
+            original += part["keys_original"]
+            stored += part["keys_stored"]
+        yield tr
+    if tolerance > 0:
+        entry["key_reduction"] = {
+            "tolerance": tolerance,
+            "keys_original": original,
+            "keys_stored": stored,
+            "ratio": (stored / original) if original else 1.0,
+        }
+        stats["key_ratio"] = entry["key_reduction"]["ratio"]
+    else:
+        entry.pop("key_reduction", None)
+
+
+def _set_key_reduction(entry, tolerance, stats):
+    """Записывает в entry["key_reduction"] итог прореживания (или убирает его, если оно выключено)."""
+    if tolerance > 0:
+        entry["key_reduction"] = key_reduction_summary(entry["tracks"], tolerance)
+        stats["key_ratio"] = entry["key_reduction"]["ratio"]
+    else:
+        entry.pop("key_reduction", None)
+
+
 def create_animation_from_scene(name, description="", only_selected=False):
-    internal = read_internal_films()
+    """
+    Сохраняет анимацию сцены. Треки пишутся потоком (write_animation_streamed):
+    каждый объект сериализуется, записывается и отпускается, целиком entry в памяти не собирается.
+    """
     entry = create_animation_entry(name, description)
+    entry.pop("tracks", None)
     
     if only_selected:
         objs = list(bpy.context.selected_objects)
@@ -128,11 +219,6 @@ def create_animation_from_scene(name, description="", only_selected=False):
         if "visible_objects" in entry:
             del entry["visible_objects"]    
 
-    for obj in objs:
-        nla_struct = serialize_nla_for_object(obj)
-        if nla_struct and nla_has_transform_curves(nla_struct):
-            entry["tracks"].append({"object_name": obj.name, "animation": nla_struct})
-
     try:
         entry["frame_start"] = int(bpy.context.scene.frame_start)
         entry["frame_end"] = int(bpy.context.scene.frame_end)
@@ -162,15 +248,16 @@ def create_animation_from_scene(name, description="", only_selected=False):
         entry.pop("timeline_markers", None)
         entry.pop("text_editor_content", None)
 
-    internal[name] = entry
-    write_internal_films(internal)
-    write_animation_to_file(name, entry)
+    tolerance = _capture_tolerance()
+    candidates, stats = plan_capture(objs)
+    tracks = _iter_capture_tracks(candidates, stats, tolerance=tolerance)
+    write_animation_streamed(name, entry, _stream_key_reduction(tracks, entry, tolerance, stats))
 
-    # three_<name>.json
+    # three_<name>.json (треки читаются обратно из шарда по одному)
     try:
-        three_clip = build_three_clip_from_saved_entry(name, entry)
+        three_clip = build_three_clip_from_saved_entry(name, dict(entry, tracks=iter_internal_film_tracks(name)))
         folder = get_external_folder()
-        ok = write_three_animation_to_file(name, three_clip, folder)
+        ok = write_three_animation_to_file(name, three_clip, folder, get_library_compression())
         if not ok:
             print("[three-export] write_three_animation_to_file вернул False (папка не задана?)")
     except Exception as e:
@@ -179,16 +266,16 @@ def create_animation_from_scene(name, description="", only_selected=False):
         traceback.print_exc()
 
     mark_cache_dirty()
-    return True
+    return stats
 
 
 def update_animation_from_scene(anim_name, only_selected=False):
-    internal = read_internal_films()
-    if anim_name not in internal:
+    prev_entry = read_internal_film(anim_name)
+    if prev_entry is None:
         raise RuntimeError("Анимация не найдена.")
 
-    entry = internal[anim_name]
-    new_tracks = []
+    # Shallow copy: the shard reader may hand out its parsed object
+    entry = dict(prev_entry)
     
     if only_selected:
         objs = list(bpy.context.selected_objects)
@@ -201,12 +288,11 @@ def update_animation_from_scene(anim_name, only_selected=False):
         if "visible_objects" in entry:
             del entry["visible_objects"]  
 
-    for obj in objs:
-        nla_struct = serialize_nla_for_object(obj)
-        if nla_struct and nla_has_transform_curves(nla_struct):
-            new_tracks.append({"object_name": obj.name, "animation": nla_struct})
-
-    entry["tracks"] = new_tracks
+    # неизменённые Action (по отпечатку) берутся из предыдущей версии без сериализации
+    tolerance = _capture_tolerance()
+    entry["tracks"], stats = _capture_tracks(objs, prev_entry, tolerance)
+    _set_key_reduction(entry, tolerance, stats)
+    entry["format_version"] = ENTRY_FORMAT_VERSION
     entry["created_at"] = datetime.now().isoformat()
 
     try:
@@ -238,15 +324,20 @@ def update_animation_from_scene(anim_name, only_selected=False):
         entry.pop("timeline_markers", None)
         entry.pop("text_editor_content", None)
 
-    internal[anim_name] = entry
-    write_internal_films(internal)
+    # предыдущая версия уходит в историю (хранятся только изменившиеся треки/кривые)
+    try:
+        record_film_version(anim_name, prev_entry, entry)
+    except Exception as e:
+        print("[history ERROR]", repr(e))
+
+    write_internal_film(anim_name, entry)
     write_animation_to_file(anim_name, entry)
 
     # three_<name>.json
     try:
         three_clip = build_three_clip_from_saved_entry(anim_name, entry)
         folder = get_external_folder()
-        ok = write_three_animation_to_file(anim_name, three_clip, folder)
+        ok = write_three_animation_to_file(anim_name, three_clip, folder, get_library_compression())
         if not ok:
             print("[three-export] write_three_animation_to_file вернул False (папка не задана?)")
     except Exception as e:
@@ -254,217 +345,276 @@ def update_animation_from_scene(anim_name, only_selected=False):
         import traceback
         traceback.print_exc()
 
+    mark_cache_dirty()
+    return stats
+
+
+def restore_animation_version(anim_name, number):
+    """
+    Сделать версию number текущей. Восстановление само записывается новой версией,
+    поэтому его можно откатить. three_<name>.json не пересобирается (нужна сцена).
+    """
+    prev_entry = read_internal_film(anim_name)
+    if prev_entry is None:
+        raise RuntimeError("Анимация не найдена.")
+    entry = read_film_version(anim_name, number)
+    if entry is None:
+        raise RuntimeError(f"Версия {number} не найдена (или уже свёрнута).")
+
+    entry = dict(entry)
+    entry["created_at"] = datetime.now().isoformat()
+    record_film_version(anim_name, prev_entry, entry)
+
+    write_internal_film(anim_name, entry)
+    write_animation_to_file(anim_name, entry)
     mark_cache_dirty()
     return True
 
 
-def delete_animation(anim_name, full_delete=False):
-    internal = read_internal_films()
-    entry = internal.get(anim_name)
-    if not entry:
-        ext = read_external_films()
-        entry = ext.get(anim_name)
+def compact_animation_history(anim_name, keep):
+    """Свернуть старые дельты: остаётся не больше keep версий."""
+    return compact_film_history(anim_name, keep)
 
-    # полное удаление: чистим NLA и удаляем связанные Actions
-    action_names = set()
-    if full_delete and entry:
-        for tr in entry.get("tracks", []):
-            anim = tr.get("animation", {}) or {}
-            for t in anim.get("tracks", []):
-                for s in t.get("strips", []):
-                    act = s.get("action")
-                    if isinstance(act, dict):
-                        n = act.get("name")
-                        if n:
-                            action_names.add(n)
-
-        for a_name in list(action_names):
-            for obj in bpy.data.objects:
-                ad = getattr(obj, "animation_data", None)
-                if not ad:
+
+def _entry_actions(entry):
+    """Action из bpy.data, соответствующие Action entry: по имени и по content digest."""
+    found = {}
+    for tr in entry.get("tracks", []):
+        anim = tr.get("animation", {}) or {}
+        for t in anim.get("tracks", []):
+            for s in t.get("strips", []):
+                act = s.get("action")
+                if not isinstance(act, dict):
                     continue
+                n = act.get("name")
+                a = bpy.data.actions.get(n) if n else None
+                if a is not None:
+                    found[a.name] = (a, n)
                 try:
-                    if ad.action and ad.action.name == a_name:
-                        ad.action = None
-                except Exception:
-                    pass
-                try:
-                    for track in list(ad.nla_tracks):
-                        for strip in list(track.strips):
-                            try:
-                                if strip.action and strip.action.name == a_name:
-                                    track.strips.remove(strip)
-                            except Exception:
-                                pass
-                        try:
-                            if len(track.strips) == 0:
-                                ad.nla_tracks.remove(track)
-                        except Exception:
-                            pass
+                    a = find_action_by_digest(ensure_action_digest(act))
                 except Exception:
-                    pass
+                    a = None
+                if a is not None:
+                    found[a.name] = (a, n)
+    return found
 
-        for a_name in list(action_names):
-            a = bpy.data.actions.get(a_name)
-            if a:
-                try:
-                    bpy.data.actions.remove(a)
-                except Exception:
-                    pass
 
-    removed = False
-    if anim_name in internal:
-        del internal[anim_name]
-        write_internal_films(internal)
-        removed = True
+def _full_delete_actions(anim_name, entry):
+    """
+    Удаляет из сцены Action анимации и стрипы, которые их используют
+    (через обратный индекс, построенный за один проход по объектам).
+    Action, на которые ссылаются другие анимации библиотеки, остаются.
+    Возвращает (удалённые имена, {оставленное имя: [анимации, которые его используют]}).
+    """
+    usage = action_usage_index()
+    removed = []
+    kept = {}
+    emptied_tracks = []
+
+    for a_name, (action, entry_name) in _entry_actions(entry).items():
+        users = set(find_animations(action=entry_name)) if entry_name else set()
+        if a_name != entry_name:
+            users |= set(find_animations(action=a_name))
+        users.discard(anim_name)
+        if users:
+            kept[a_name] = sorted(users)
+            continue
+
+        use = usage.get(a_name) or {"strips": [], "active": []}
+        for obj in use["active"]:
+            try:
+                obj.animation_data.action = None
+            except Exception:
+                pass
+        for obj, track, strip in use["strips"]:
+            try:
+                track.strips.remove(strip)
+                emptied_tracks.append((obj, track))
+            except Exception:
+                pass
+        try:
+            bpy.data.actions.remove(action)
+            removed.append(a_name)
+        except Exception:
+            pass
+
+    for obj, track in emptied_tracks:
+        try:
+            if len(track.strips) == 0:
+                obj.animation_data.nla_tracks.remove(track)
+        except Exception:
+            pass
+
+    return removed, kept
+
+
+def delete_animation(anim_name, full_delete=False):
+    """
+    Удаляет анимацию из библиотеки (при full_delete — и её Action из сцены).
+    Возвращает {"removed": bool, "actions_removed": [...], "actions_kept": {action: [анимации]}}.
+    """
+    entry = read_internal_film(anim_name)
+    if not entry:
+        entry = get_film(anim_name)
+
+    # полное удаление: чистим NLA и удаляем связанные Actions
+    actions_removed = []
+    actions_kept = {}
+    if full_delete and entry:
+        actions_removed, actions_kept = _full_delete_actions(anim_name, entry)
+
+    removed = remove_internal_film(anim_name)
+    remove_film_history(anim_name)
 
     remove_animation_file(anim_name)
 
-    # удалить three_<name>.json
+    # удалить three_<name>.json (во всех вариантах сжатия)
     folder = get_external_folder()
     if folder:
         try:
-            p = os.path.join(folder, f"three_{anim_name}.json")
-            if os.path.isfile(p):
-                os.remove(p)
+            for p in three_clip_paths(anim_name, folder):
+                if write_queue.is_pending(p) or os.path.isfile(p):
+                    write_queue.submit_remove(p)
         except Exception:
             pass
 
     mark_cache_dirty()
 
-    names = list(read_all_films_cached().keys())
+    names = list(read_manifest_cached().keys())
     try:
         bpy.context.scene.umz_selected_animation = names[0] if names else ""
     except Exception:
         pass
 
-    return removed
+    return {"removed": bool(removed), "actions_removed": actions_removed, "actions_kept": actions_kept}
 
-def _apply_visibility_from_entry(entry):
-    mode = entry.get("visible_objects_mode", "ALL")
+def _visibility_resolver(entry):
+    """obj -> должен ли объект быть видимым по visible_objects_mode / visible_objects entry."""
+    if entry.get("visible_objects_mode", "ALL") != "SELECTED":
+        return lambda obj: True
+    visible_set = {v for v in (entry.get("visible_objects") or []) if isinstance(v, str)}
+    return lambda obj: obj.name in visible_set
 
-    if mode != "SELECTED":
-        for obj in bpy.data.objects:
-            try:
-                obj.hide_set(False)
-            except Exception:
-                pass
+
+def _set_visibility(obj, show):
+    """Пишет hide_set / hide_render только если значение действительно меняется. Возвращает число записей."""
+    writes = 0
+    try:
+        if obj.hide_get() == show:
+            obj.hide_set(not show)
+            writes += 1
+    except Exception:
+        pass
+    try:
+        if obj.hide_render == show:
+            obj.hide_render = not show
+            writes += 1
+    except Exception:
+        pass
+    return writes
+
+
+def _apply_track_to_object(obj, anim_struct):
+    nla_tracks_data = anim_struct.get("tracks", [])
+    if nla_tracks_data and len(nla_tracks_data) > 0:
+        if not obj.animation_data:
+            obj.animation_data_create()
+        created_actions, saved_active = deserialize_nla_for_object(obj, anim_struct)
+        if saved_active:
+            a = bpy.data.actions.get(saved_active)
+            if a and obj.animation_data:
+                try:
+                    obj.animation_data.action = a
+                except Exception:
+                    pass
+        else:
             try:
-                obj.hide_render = False
+                if obj.animation_data:
+                    obj.animation_data.action = None
             except Exception:
                 pass
-        return
-
-    visible = entry.get("visible_objects") or []
-    visible_set = set([v for v in visible if isinstance(v, str)])
+    else:
+        action_data = anim_struct.get("action")
+        if action_data:
+            action_obj = deserialize_action(action_data, prefer_name=f"{obj.name}__{action_data.get('name')}")
+            if action_obj:
+                if not obj.animation_data:
+                    obj.animation_data_create()
+                pushdown_action_to_nla(obj, action_obj, start_frame=None)
+                if anim_struct.get("active_action_name"):
+                    try:
+                        obj.animation_data.action = action_obj
+                    except Exception:
+                        pass
+                else:
+                    try:
+                        obj.animation_data.action = None
+                    except Exception:
+                        pass
 
-    for obj in bpy.data.objects:
-        show = (obj.name in visible_set)
-        try:
-            obj.hide_set(not show)
-        except Exception:
-            pass
-        try:
-            obj.hide_render = (not show)
-        except Exception:
-            pass
 
 def apply_animation_to_scene(anim_name, remove_other_animations=True):
+    """
+    Применяет анимацию за один проход по bpy.data.objects: для каждого объекта —
+    восстановление NLA (или очистка), затем видимость (пишется только при изменении).
+    Depsgraph обновляется один раз в конце (scene.frame_set).
+
+    Возвращает {"applied": [...], "visibility_writes": n, "timings": {фаза: секунды}}.
+    """
+    t_start = time.perf_counter()
+    timings = {}
     scene = bpy.context.scene
-    all_films = read_all_films_cached()
-    film = all_films.get(anim_name)
+    film = get_film(anim_name)
     if not film:
         raise RuntimeError("Анимация не найдена.")
+    t = time.perf_counter()
+    timings["load"] = t - t_start
 
-    # Apply saved frame range if present
+    # Apply saved frame range if present (the current frame is set once at the end)
+    target_frame = scene.frame_current
     try:
-        frame_range_updated = False
         if "frame_start" in film:
-            frame_start = int(film["frame_start"])
-            scene.frame_start = frame_start
-            frame_range_updated = True
+            scene.frame_start = int(film["frame_start"])
         if "frame_end" in film:
-            frame_end = int(film["frame_end"])
-            scene.frame_end = frame_end
-            frame_range_updated = True
-        
-        # Clamp current frame to new range if needed
-        if frame_range_updated:
-            current = scene.frame_current
-            start = scene.frame_start
-            end = scene.frame_end
-            if current < start:
-                scene.frame_set(start)
-            elif current > end:
-                scene.frame_set(end)
+            scene.frame_end = int(film["frame_end"])
+        target_frame = min(max(target_frame, scene.frame_start), scene.frame_end)
     except (ValueError, TypeError):
         # Invalid frame range values, skip applying them
         pass
 
-    track_objs = {t.get("object_name") for t in film.get("tracks", [])}
-
-    if remove_other_animations:
-        for obj in bpy.data.objects:
-            if obj.name not in track_objs:
-                _clear_animation_on_object(obj)
-
-    applied = []
-
+    tracks_by_object = {}
     for tr in film.get("tracks", []):
-        obj_name = tr.get("object_name")
-        anim_struct = tr.get("animation", {}) or {}
-        obj = bpy.data.objects.get(obj_name)
-        if not obj:
-            continue
-
-        nla_tracks_data = anim_struct.get("tracks", [])
-        if nla_tracks_data and len(nla_tracks_data) > 0:
-            if not obj.animation_data:
-                obj.animation_data_create()
-            created_actions, saved_active = deserialize_nla_for_object(obj, anim_struct)
-            if saved_active:
-                a = bpy.data.actions.get(saved_active)
-                if a and obj.animation_data:
-                    try:
-                        obj.animation_data.action = a
-                    except Exception:
-                        pass
-            else:
-                try:
-                    if obj.animation_data:
-                        obj.animation_data.action = None
-                except Exception:
-                    pass
-        else:
-            action_data = anim_struct.get("action")
-            if action_data:
-                action_obj = deserialize_action(action_data, prefer_name=f"{obj.name}__{action_data.get('name')}")
-                if action_obj:
-                    if not obj.animation_data:
-                        obj.animation_data_create()
-                    pushdown_action_to_nla(obj, action_obj, start_frame=None)
-                    if anim_struct.get("active_action_name"):
-                        try:
-                            obj.animation_data.action = action_obj
-                        except Exception:
-                            pass
-                    else:
-                        try:
-                            obj.animation_data.action = None
-                        except Exception:
-                            pass
-
-        applied.append(obj_name)
+        tracks_by_object[tr.get("object_name")] = tr.get("animation", {}) or {}
+    should_show = _visibility_resolver(film)
 
+    applied_set = set()
+    visibility_writes = 0
+    t_animation = 0.0
+    t_visibility = 0.0
+    for obj in bpy.data.objects:
+        t0 = time.perf_counter()
+        anim_struct = tracks_by_object.get(obj.name)
+        if anim_struct is not None:
+            _apply_track_to_object(obj, anim_struct)
+            applied_set.add(obj.name)
+        elif remove_other_animations:
+            _clear_animation_on_object(obj)
+        t1 = time.perf_counter()
+        visibility_writes += _set_visibility(obj, should_show(obj))
+        t_animation += t1 - t0
+        t_visibility += time.perf_counter() - t1
+    timings["animation"] = t_animation
+    timings["visibility"] = t_visibility
+
+    applied = [name for name in tracks_by_object if name in applied_set]
+
+    t = time.perf_counter()
     try:
-        current_frame = scene.frame_current
-        scene.frame_set(current_frame)
-        bpy.context.view_layer.update()
+        scene.frame_set(target_frame)
     except Exception:
         pass
-    
-    _apply_visibility_from_entry(film)
-    
+    timings["depsgraph"] = time.perf_counter() - t
+
     # Restore timeline markers and text editor content if toggle is ON
     restore_text_and_markers = getattr(scene, "umz_text_and_markers", False)
     
@@ -494,5 +644,6 @@ def apply_animation_to_scene(anim_name, remove_other_animations=True):
                 _restore_text_editor_content(text_content)
         except Exception:
             pass
-    
-    return {"applied": applied}
\ No newline at end of file
+
+    timings["total"] = time.perf_counter() - t_start
+    return {"applied": applied, "visibility_writes": visibility_writes, "timings": timings}
\ No newline at end of file
@@ -0,0 +1,98 @@
+# =========================================================
+# ОБРАТНЫЙ ИНДЕКС ДЛЯ ПОИСКА АНИМАЦИЙ
+# object_name / data_path / имя Action -> имена анимаций.
+# Термины берутся из метаданных манифеста (entry_meta), поэтому индекс
+# обновляется при каждой записи без чтения самих entry. Без bpy.
+# =========================================================
+
+SEARCH_FIELDS = ("objects", "data_paths", "actions")
+
+
+def entry_search_terms(entry, load_action=None):
+    """
+    {"objects": [...], "data_paths": [...], "actions": [...]} для entry.
+    Стрипы со ссылкой "action_ref" разрешаются через load_action(digest), если он передан.
+    """
+    objects = set()
+    data_paths = set()
+    actions = set()
+    for tr in entry.get("tracks") or []:
+        if not isinstance(tr, dict):
+            continue
+        if tr.get("object_name"):
+            objects.add(tr["object_name"])
+        anim = tr.get("animation") or {}
+        for t in anim.get("tracks") or []:
+            for s in t.get("strips") or []:
+                act = s.get("action")
+                if not isinstance(act, dict) and s.get("action_ref") and load_action is not None:
+                    act = load_action(s["action_ref"])
+                if not isinstance(act, dict):
+                    continue
+                if act.get("name"):
+                    actions.add(act["name"])
+                for fc in act.get("fcurves") or []:
+                    if fc.get("data_path"):
+                        data_paths.add(fc["data_path"])
+    return {"objects": sorted(objects), "data_paths": sorted(data_paths), "actions": sorted(actions)}
+
+
+class InvertedIndex:
+    """field -> term -> set(animation names); обновляется по одной анимации."""
+
+    def __init__(self):
+        self._terms = {field: {} for field in SEARCH_FIELDS}
+        self._by_name = {}   # name -> {field: tuple(terms)}
+
+    def clear(self):
+        for field in SEARCH_FIELDS:
+            self._terms[field].clear()
+        self._by_name.clear()
+
+    def remove(self, name):
+        old = self._by_name.pop(name, None)
+        if not old:
+            return
+        for field, terms in old.items():
+            bucket = self._terms[field]
+            for term in terms:
+                names = bucket.get(term)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del bucket[term]
+
+    def add(self, name, meta):
+        """(Пере)индексировать анимацию по её метаданным."""
+        self.remove(name)
+        rec = {field: tuple(meta.get(field) or ()) for field in SEARCH_FIELDS}
+        self._by_name[name] = rec
+        for field, terms in rec.items():
+            bucket = self._terms[field]
+            for term in terms:
+                bucket.setdefault(term, set()).add(name)
+
+    def names(self):
+        return set(self._by_name)
+
+    def find(self, object_name=None, data_path=None, action=None):
+        """Имена анимаций, подходящих под все заданные условия (точное совпадение)."""
+        result = None
+        for field, term in (("objects", object_name), ("data_paths", data_path), ("actions", action)):
+            if term is None:
+                continue
+            names = self._terms[field].get(term, set())
+            result = set(names) if result is None else result & names
+        return self.names() if result is None else result
+
+    def search(self, query):
+        """Имена анимаций, у которых имя или любой термин содержит query (без учёта регистра)."""
+        q = (query or "").strip().lower()
+        if not q:
+            return self.names()
+        result = {name for name in self._by_name if q in name.lower()}
+        for field in SEARCH_FIELDS:
+            for term, names in self._terms[field].items():
+                if q in term.lower():
+                    result |= names
+        return result
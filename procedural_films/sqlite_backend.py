@@ -0,0 +1,259 @@
+import json
+import sqlite3
+import threading
+
+# =========================================================
+# БИБЛИОТЕКА В SQLITE (опциональный бэкенд вместо папки с JSON)
+# WAL: читатели не блокируют писателя, несколько Blender могут читать одну базу.
+#
+#   animations(name PK, revision, created_at, frame_start, frame_end, track_count, size, entry, search)
+#       entry — JSON entry без "tracks"; revision растёт при каждой записи;
+#       search — JSON {"objects", "data_paths", "actions"} для обратного индекса
+#   object_tracks(animation, position, object_name, track)
+#       track — JSON трека объекта, стрипы ссылаются на Action через "action_ref"
+#   actions(digest PK, name, data)
+#   animation_actions(animation, digest)  — какие Action использует анимация;
+#       Action без ссылок удаляются (collect_garbage) при записи и удалении
+#   library(key PK, value)  — счётчик "revision" растёт при любой записи/удалении
+#
+# Индекс по animations.name — первичный ключ; отдельные индексы: created_at,
+# object_tracks.object_name, actions.name.
+# Запись анимации переписывает только изменившиеся строки object_tracks.
+# Без bpy.
+# =========================================================
+
+SCHEMA_VERSION = 3
+SEARCH_FIELDS = ("objects", "data_paths", "actions")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS animations (
+    name TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    created_at TEXT,
+    frame_start INTEGER,
+    frame_end INTEGER,
+    track_count INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    entry TEXT NOT NULL,
+    search TEXT
+);
+CREATE TABLE IF NOT EXISTS object_tracks (
+    animation TEXT NOT NULL REFERENCES animations(name) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    object_name TEXT,
+    track TEXT NOT NULL,
+    PRIMARY KEY (animation, position)
+);
+CREATE TABLE IF NOT EXISTS library (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO library(key, value) VALUES ('revision', 0);
+CREATE TABLE IF NOT EXISTS actions (
+    digest TEXT PRIMARY KEY,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS animation_actions (
+    animation TEXT NOT NULL REFERENCES animations(name) ON DELETE CASCADE,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (animation, digest)
+);
+CREATE INDEX IF NOT EXISTS idx_animation_actions_digest ON animation_actions(digest);
+CREATE INDEX IF NOT EXISTS idx_animations_created_at ON animations(created_at);
+CREATE INDEX IF NOT EXISTS idx_object_tracks_object_name ON object_tracks(object_name);
+CREATE INDEX IF NOT EXISTS idx_actions_name ON actions(name);
+"""
+
+_CONNECTIONS = {}
+_LOCK = threading.Lock()
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def connect(path):
+    """Открыть (и при необходимости создать) базу; соединения переиспользуются по пути."""
+    with _LOCK:
+        conn = _CONNECTIONS.get(path)
+        if conn is not None:
+            return conn
+        conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(_SCHEMA)
+        # База версии 1: добавить колонку search
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(animations)")}
+        if "search" not in columns:
+            conn.execute("ALTER TABLE animations ADD COLUMN search TEXT")
+        # База версии < 3: заполнить animation_actions по ссылкам в треках
+        if int(conn.execute("PRAGMA user_version").fetchone()[0]) < 3:
+            _backfill_animation_actions(conn)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        conn.commit()
+        _CONNECTIONS[path] = conn
+        return conn
+
+
+def _track_action_refs(track):
+    refs = set()
+    anim = track.get("animation") if isinstance(track, dict) else None
+    for t in (anim or {}).get("tracks") or []:
+        for st in t.get("strips") or []:
+            if isinstance(st, dict) and st.get("action_ref"):
+                refs.add(st["action_ref"])
+    return refs
+
+
+def _backfill_animation_actions(conn):
+    for name, track in conn.execute("SELECT animation, track FROM object_tracks").fetchall():
+        try:
+            refs = _track_action_refs(json.loads(track))
+        except Exception:
+            continue
+        conn.executemany(
+            "INSERT OR IGNORE INTO animation_actions(animation, digest) VALUES (?, ?)",
+            [(name, d) for d in refs],
+        )
+
+
+def close_all():
+    with _LOCK:
+        for conn in _CONNECTIONS.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        _CONNECTIONS.clear()
+
+
+def _next_revision(conn):
+    conn.execute("UPDATE library SET value=value+1 WHERE key='revision'")
+    return int(conn.execute("SELECT value FROM library WHERE key='revision'").fetchone()[0])
+
+
+def library_signature(conn):
+    """Меняется при любой записи/удалении (в том числе из другого процесса)."""
+    row = conn.execute("SELECT value FROM library WHERE key='revision'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def list_meta(conn):
+    """{name: meta} без чтения самих треков."""
+    res = {}
+    rows = conn.execute(
+        "SELECT name, revision, created_at, frame_start, frame_end, track_count, size, search "
+        "FROM animations ORDER BY name"
+    )
+    for name, revision, created_at, frame_start, frame_end, track_count, size, search in rows:
+        meta = res[name] = {
+            "name": name,
+            "created_at": created_at,
+            "frame_start": frame_start,
+            "frame_end": frame_end,
+            "track_count": track_count,
+            "size": size,
+            "revision": revision,
+        }
+        try:
+            meta.update(json.loads(search) if search else {})
+        except Exception:
+            pass
+    return res
+
+
+def write_animation(conn, name, packed, actions, meta):
+    """
+    Записать анимацию (packed: entry со "action_ref" вместо Action) одной транзакцией.
+    Строки треков, JSON которых не изменился, не трогаются. Возвращает новую revision.
+    """
+    tracks = packed.get("tracks") or []
+    head = {k: v for k, v in packed.items() if k != "tracks"}
+    track_rows = [_dumps(tr) for tr in tracks]
+    size = len(_dumps(head)) + sum(len(t) for t in track_rows)
+
+    with conn:
+        for digest, act in actions.items():
+            conn.execute(
+                "INSERT OR IGNORE INTO actions(digest, name, data) VALUES (?, ?, ?)",
+                (digest, act.get("name"), _dumps({k: v for k, v in act.items() if k != "digest"})),
+            )
+
+        revision = _next_revision(conn)
+        conn.execute(
+            "INSERT INTO animations(name, revision, created_at, frame_start, frame_end, track_count, size, entry, search) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET revision=excluded.revision, created_at=excluded.created_at, "
+            "frame_start=excluded.frame_start, frame_end=excluded.frame_end, "
+            "track_count=excluded.track_count, size=excluded.size, entry=excluded.entry, search=excluded.search",
+            (name, revision, meta.get("created_at"), meta.get("frame_start"), meta.get("frame_end"),
+             len(tracks), size, _dumps(head), _dumps({f: meta.get(f) or [] for f in SEARCH_FIELDS})),
+        )
+
+        existing = dict(conn.execute(
+            "SELECT position, track FROM object_tracks WHERE animation=?", (name,)
+        ).fetchall())
+        for pos, (tr, data) in enumerate(zip(tracks, track_rows)):
+            if existing.get(pos) == data:
+                continue
+            object_name = tr.get("object_name") if isinstance(tr, dict) else None
+            conn.execute(
+                "INSERT OR REPLACE INTO object_tracks(animation, position, object_name, track) VALUES (?, ?, ?, ?)",
+                (name, pos, object_name, data),
+            )
+        conn.execute("DELETE FROM object_tracks WHERE animation=? AND position>=?", (name, len(tracks)))
+
+        refs = set(actions)
+        for tr in tracks:
+            refs.update(_track_action_refs(tr))
+        conn.execute("DELETE FROM animation_actions WHERE animation=?", (name,))
+        conn.executemany(
+            "INSERT INTO animation_actions(animation, digest) VALUES (?, ?)",
+            [(name, d) for d in sorted(refs)],
+        )
+        _delete_unreferenced_actions(conn)
+    return revision
+
+
+def read_animation(conn, name):
+    """packed entry (стрипы со ссылками "action_ref") или None."""
+    row = conn.execute("SELECT entry FROM animations WHERE name=?", (name,)).fetchone()
+    if row is None:
+        return None
+    entry = json.loads(row[0])
+    rows = conn.execute(
+        "SELECT track FROM object_tracks WHERE animation=? ORDER BY position", (name,)
+    ).fetchall()
+    entry["tracks"] = [json.loads(r[0]) for r in rows]
+    return entry
+
+
+def read_action(conn, digest):
+    row = conn.execute("SELECT data FROM actions WHERE digest=?", (digest,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _delete_unreferenced_actions(conn):
+    return conn.execute(
+        "DELETE FROM actions WHERE digest NOT IN (SELECT digest FROM animation_actions)"
+    ).rowcount
+
+
+def collect_garbage(conn):
+    """Удаляет Action, на которые не ссылается ни одна анимация. Возвращает число удалённых."""
+    with conn:
+        return _delete_unreferenced_actions(conn)
+
+
+def remove_animation(conn, name):
+    """Удаляет анимацию, её треки и Action, на которые больше никто не ссылается. True, если была."""
+    with conn:
+        conn.execute("DELETE FROM object_tracks WHERE animation=?", (name,))
+        conn.execute("DELETE FROM animation_actions WHERE animation=?", (name,))
+        _delete_unreferenced_actions(conn)
+        cur = conn.execute("DELETE FROM animations WHERE name=?", (name,))
+        if cur.rowcount > 0:
+            _next_revision(conn)
+    return cur.rowcount > 0
@@ -1,60 +1,798 @@
 import bpy
+import hashlib
 import json
 import os
-from .constants import FILMS_TEXT_NAME
+import time
+from .constants import (
+    FILMS_TEXT_NAME,
+    FILMS_INDEX_TEXT_NAME,
+    FILMS_SHARD_PREFIX,
+    EXTERNAL_MANIFEST_NAME,
+    ACTION_POOL_TEXT_PREFIX,
+    EXTERNAL_ACTION_POOL_DIR,
+    ACTION_GC_GRACE_SECONDS,
+    FILMS_HISTORY_PREFIX,
+    HISTORY_KEEP_VERSIONS,
+    SQLITE_LIBRARY_NAME,
+)
+from .blender_codec import ensure_action_digest
+from . import history
+from . import write_queue
+from .file_formats import (
+    COMPRESSION_EXTENSIONS,
+    JsonStreamWriter,
+    encode_json,
+    library_file_name,
+    normalize_compression,
+    read_json_file,
+    split_library_file_name,
+    three_clip_compression,
+)
+from .library_pack import PACK_EXTENSION, encode_pack, read_pack_header, read_pack_item
+from .cache import DEFAULT_BUDGET_MB, SizedLRU, estimate_size
+from . import sqlite_backend
+from .search_index import InvertedIndex, entry_search_terms, SEARCH_FIELDS
 
 # Кеш анимаций (внутренние + внешние)
-FILMS_CACHE = {}
+# FILMS_CACHE: memory-bounded LRU of decoded data, loaded lazily (apply/update/export):
+#   ("entry", name) -> [location, full entry]; ("action", digest) -> pooled action;
+#   ("text", text name) -> ((len, hash) of content, parsed Text block)
+# Every value is charged with everything it references: an entry pays for the pooled
+# actions it shares, so the reported bytes are an upper bound of what is held.
+# FILMS_MANIFEST: name -> lightweight metadata (listing/redraw)
+FILMS_CACHE = SizedLRU(DEFAULT_BUDGET_MB * 1024 * 1024)
+FILMS_MANIFEST = {}
 FILMS_CACHE_DIRTY = True
 
+# Bumped whenever the set of animations or any entry changes;
+# UI/exporter memoize derived data by it (get_films_generation())
+FILMS_GENERATION = 0
 
-def ensure_films_text(create_if_missing=True):
+# Where each manifest entry comes from:
+#   name -> ("internal", text) | ("external", path, key) | ("sqlite", db path, revision)
+_FILM_LOCATIONS = {}
+# External folder scan index: path -> {"key": (mtime_ns, size), "meta": {name: meta}}
+_EXTERNAL_INDEX = {}
+_EXTERNAL_INDEX_FOLDER = None
+
+# Packed libraries: path -> (stat key, header, data_start); only headers are kept
+_PACK_HEADERS = {}
+
+# object_name / data_path / action name -> animation names, kept in sync with FILMS_MANIFEST
+_SEARCH_INDEX = InvertedIndex()
+
+# SQLite backend: ((db path, library revision), listing) of the last scan
+_SQLITE_LISTING = None
+
+# Internal library layout version (index Text block)
+INDEX_VERSION = 1
+MANIFEST_VERSION = 3
+
+
+
+def _dumps_compact(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _text_fingerprint(s):
+    return (len(s), hash(s))
+
+
+def _memo_text(text_name, fp, data):
+    _sync_cache_budget()
+    FILMS_CACHE.put(("text", text_name), (fp, data), estimate_size(data))
+
+
+def _parse_text_block(txt, cache=True):
+    """
+    Parse a Text datablock as JSON, reusing the previous result (kept in
+    FILMS_CACHE, within its budget) while the text content is unchanged.
+    With cache=False a fresh parse is not kept.
+    """
+    s = txt.as_string()
+    fp = _text_fingerprint(s)
+    memo = FILMS_CACHE.get(("text", txt.name))
+    if memo is not None and memo[0] == fp:
+        return memo[1]
+    data = json.loads(s)
+    if cache:
+        _memo_text(txt.name, fp, data)
+    return data
+
+
+def _write_text_block(text_name, data):
+    """
+    Write data as compact JSON into a Text block (created if missing).
+    Returns (text block, written size in characters).
+    """
+    txt = bpy.data.texts.get(text_name)
+    if not txt:
+        txt = bpy.data.texts.new(text_name)
+    s = _dumps_compact(data)
+    txt.clear()
+    txt.write(s)
+    _memo_text(txt.name, _text_fingerprint(s), data)
+    return txt, len(s)
+
+
+def _remove_text_block(text_name):
+    FILMS_CACHE.pop(("text", text_name))
+    txt = bpy.data.texts.get(text_name)
+    if txt:
+        bpy.data.texts.remove(txt)
+
+
+# -------------------------
+# Manifest (metadata only)
+# -------------------------
+
+def entry_meta(name, entry, size=0, source="internal", load_action=None):
+    """
+    Lightweight metadata of an animation entry (what the UI lists), including
+    the search terms (objects / data_paths / actions) of the inverted index.
+    Packed entries carry their terms in the head ("search", see _pack_entry), so no
+    action has to be read; for entries written without it load_action(digest)
+    resolves "action_ref" strips.
+    """
+    meta = {
+        "name": name,
+        "created_at": entry.get("created_at"),
+        "frame_start": entry.get("frame_start"),
+        "frame_end": entry.get("frame_end"),
+        "track_count": len(entry.get("tracks") or []),
+        "size": int(size),
+        "source": source,
+    }
+    reduction = entry.get("key_reduction")
+    if isinstance(reduction, dict) and "ratio" in reduction:
+        meta["key_ratio"] = reduction["ratio"]
+    search = entry.get("search")
+    if isinstance(search, dict):
+        meta.update({field: list(search.get(field) or []) for field in SEARCH_FIELDS})
+    else:
+        meta.update(entry_search_terms(entry, load_action))
+    return meta
+
+
+def _bump_generation():
+    global FILMS_GENERATION
+    FILMS_GENERATION += 1
+
+
+def get_films_generation():
+    return FILMS_GENERATION
+
+
+# -------------------------
+# Decoded data cache (FILMS_CACHE)
+# -------------------------
+
+def _sync_cache_budget():
+    try:
+        mb = float(get_library_setting("films_cache_budget_mb", DEFAULT_BUDGET_MB))
+    except Exception:
+        mb = DEFAULT_BUDGET_MB
+    budget = int(max(0.0, mb) * 1024 * 1024)
+    if budget != FILMS_CACHE.budget:
+        FILMS_CACHE.set_budget(budget)
+
+
+def _cache_entry(name, loc, entry):
+    _sync_cache_budget()
+    # The entry keeps its (possibly shared) actions alive, so they are charged to it
+    FILMS_CACHE.put(("entry", name), [loc, entry], estimate_size(entry))
+
+
+def _cached_entry(name, loc):
+    item = FILMS_CACHE.get(("entry", name))
+    if item is not None and item[0] == loc:
+        return item[1]
+    return None
+
+
+def _pool_get(digest):
+    return FILMS_CACHE.get(("action", digest))
+
+
+def _pool_add(digest, act):
+    if ("action", digest) not in FILMS_CACHE:
+        _sync_cache_budget()
+        FILMS_CACHE.put(("action", digest), act, estimate_size(act))
+
+
+def get_cache_stats():
+    """{"items", "bytes", "budget", "hits", "misses", "evictions", "rejected", "hit_rate"}"""
+    _sync_cache_budget()
+    return FILMS_CACHE.stats()
+
+
+def _set_loaded(name, meta, loc, entry):
+    """Publish a freshly written entry into manifest + cache (no-op while a rebuild is pending)."""
+    if FILMS_CACHE_DIRTY:
+        return
+    _bump_generation()
+    current = _FILM_LOCATIONS.get(name)
+    # External files override internal shards with the same name
+    if loc[0] == "internal" and current is not None and current[0] != "internal":
+        return
+    FILMS_MANIFEST[name] = meta
+    _FILM_LOCATIONS[name] = loc
+    _SEARCH_INDEX.add(name, meta)
+    if entry is not None:
+        _cache_entry(name, loc, entry)
+    else:
+        # Streamed write: the entry was never built, it is loaded lazily on first use
+        FILMS_CACHE.pop(("entry", name))
+
+
+# -------------------------
+# Action pool (actions stored once, referenced by digest)
+# -------------------------
+
+def _pack_track(tr, actions):
+    """One object track of _pack_entry; pooled actions are added to actions."""
+    anim = tr.get("animation") if isinstance(tr, dict) else None
+    if not isinstance(anim, dict):
+        return tr
+    nla_tracks = []
+    for t in anim.get("tracks") or []:
+        strips = []
+        for st in t.get("strips") or []:
+            act = st.get("action")
+            if isinstance(act, dict):
+                digest = ensure_action_digest(act)
+                actions[digest] = act
+                st = {k: v for k, v in st.items() if k != "action"}
+                st["action_ref"] = digest
+            strips.append(st)
+        nla_tracks.append(dict(t, strips=strips))
+    return dict(tr, animation=dict(anim, tracks=nla_tracks))
+
+
+def _pack_entry(entry):
+    """
+    Replace every strip's embedded "action" with "action_ref": digest.
+    The search terms are stored in the head ("search"), so scans never need the actions.
+    Returns (packed entry, {digest: action}); the input entry is not modified.
+    """
+    actions = {}
+    tracks = [_pack_track(tr, actions) for tr in entry.get("tracks") or []]
+    return dict(entry, tracks=tracks, search=entry_search_terms(entry)), actions
+
+
+def _entry_action_refs(entry):
+    """Digests referenced ("action_ref") by the strips of a packed entry."""
+    refs = set()
+    for tr in entry.get("tracks") or []:
+        anim = tr.get("animation") if isinstance(tr, dict) else None
+        if not isinstance(anim, dict):
+            continue
+        for t in anim.get("tracks") or []:
+            for st in t.get("strips") or []:
+                if isinstance(st, dict) and st.get("action_ref"):
+                    refs.add(st["action_ref"])
+    return refs
+
+
+def _resolve_entry(entry, load_action, cache=True):
+    """
+    Inverse of _pack_entry: put shared decoded actions back into strips.
+    Only digests missing from the decoded cache are loaded (via load_action(digest));
+    with cache=False the loaded actions are not added to it.
+    """
+    tracks = []
+    for tr in entry.get("tracks") or []:
+        anim = tr.get("animation") if isinstance(tr, dict) else None
+        if not isinstance(anim, dict):
+            tracks.append(tr)
+            continue
+        nla_tracks = []
+        for t in anim.get("tracks") or []:
+            strips = []
+            for st in t.get("strips") or []:
+                digest = st.get("action_ref")
+                if digest:
+                    act = _pool_get(digest)
+                    if act is None:
+                        act = load_action(digest)
+                        if isinstance(act, dict):
+                            act["digest"] = digest
+                            if cache:
+                                _pool_add(digest, act)
+                    # Unresolvable references are kept as-is (the strip simply has no action)
+                    if isinstance(act, dict):
+                        st = {k: v for k, v in st.items() if k != "action_ref"}
+                        st["action"] = act
+                strips.append(st)
+            nla_tracks.append(dict(t, strips=strips))
+        tracks.append(dict(tr, animation=dict(anim, tracks=nla_tracks)))
+    # "search" is derived from the tracks and must not go stale on the decoded entry
+    resolved = dict(entry, tracks=tracks)
+    resolved.pop("search", None)
+    return resolved
+
+
+def _pool_text_name(digest):
+    return f"{ACTION_POOL_TEXT_PREFIX}{digest}.json"
+
+
+def _write_internal_pool(actions, cache=True):
+    """Write pooled actions into Text blocks; digests already present are skipped."""
+    for digest, act in actions.items():
+        if cache:
+            _pool_add(digest, act)
+        if bpy.data.texts.get(_pool_text_name(digest)) is not None:
+            continue
+        txt = bpy.data.texts.new(_pool_text_name(digest))
+        txt.write(_dumps_compact(act))
+
+
+def _gc_internal_pool(index):
+    """
+    Remove pooled action Text blocks that no shard references any more.
+    References come from the index ("actions" of each record); records written
+    before that field existed are derived from their shard.
+    History documents keep their actions inline, so they hold no pool references.
+    Returns the number of removed blocks.
+    """
+    referenced = set()
+    for rec in index["animations"].values():
+        if not isinstance(rec, dict):
+            continue
+        refs = rec.get("actions")
+        if refs is None:
+            shard = _read_shard(rec)
+            if shard is None and bpy.data.texts.get(rec.get("text", "")) is not None:
+                # Unreadable shard: its references are unknown, keep the whole pool
+                return 0
+            refs = sorted(_entry_action_refs(shard or {}))
+            rec["actions"] = refs
+        referenced.update(refs)
+
+    removed = 0
+    for txt in list(bpy.data.texts):
+        name = txt.name
+        if not name.startswith(ACTION_POOL_TEXT_PREFIX) or not name.endswith(".json"):
+            continue
+        if name[len(ACTION_POOL_TEXT_PREFIX):-len(".json")] in referenced:
+            continue
+        _remove_text_block(name)
+        removed += 1
+    return removed
+
+
+def _load_internal_pool_action(digest):
+    txt = bpy.data.texts.get(_pool_text_name(digest))
+    if not txt:
+        return None
     try:
-        txt = bpy.data.texts.get(FILMS_TEXT_NAME)
-        if not txt and create_if_missing:
-            txt = bpy.data.texts.new(FILMS_TEXT_NAME)
-            txt.clear()
-            txt.write(json.dumps({"animations": {}}, ensure_ascii=False, indent=2))
-        return txt
+        return json.loads(txt.as_string())
     except Exception:
         return None
 
 
-def read_internal_films():
-    txt = ensure_films_text(create_if_missing=False)
+def _external_pool_dir(folder):
+    return os.path.join(folder, EXTERNAL_ACTION_POOL_DIR)
+
+
+def _library_file_variants(folder, stem):
+    """Paths of <stem>.json / .json.gz / .json.xz in folder."""
+    return [os.path.join(folder, library_file_name(stem, c)) for c in COMPRESSION_EXTENSIONS]
+
+
+def _encoder_for(compression, indent=None):
+    def encode(data):
+        return encode_json(data, compression, indent)
+    return encode
+
+
+def _write_external_pool(folder, actions, submit_write=None, cache=True):
+    """
+    Write pooled actions as <folder>/_actions/<digest>.json[.gz|.xz]; existing digests are skipped.
+    submit_write defaults to write_queue.submit_write (a stream passes its own, see write_queue.StreamHandle).
+    """
+    pool_dir = _external_pool_dir(folder)
+    compression = get_library_compression()
+    submit_write = submit_write or write_queue.submit_write
+    for digest, act in actions.items():
+        if cache:
+            _pool_add(digest, act)
+        variants = _library_file_variants(pool_dir, digest)
+        if any(write_queue.is_pending(p) or os.path.isfile(p) for p in variants):
+            continue
+        path = os.path.join(pool_dir, library_file_name(digest, compression))
+        submit_write(path, act, encoder=_encoder_for(compression))
+
+
+def _gc_external_pool(folder):
+    """
+    Queue removal of <folder>/_actions files that no library file references any
+    more (references are kept per file in the scan index). Nothing is removed
+    while a file in the folder has unknown references (new / changed since the
+    last scan) or when the pool file is younger than ACTION_GC_GRACE_SECONDS.
+    Returns the number of queued removals.
+    """
+    pool_dir = _external_pool_dir(folder)
+    if not os.path.isdir(pool_dir):
+        return 0
+    index = _external_index_for(folder)
+    referenced = set()
+    for fname in os.listdir(folder):
+        stem = split_library_file_name(fname)[0]
+        if not _is_pack_file(fname) and (stem is None or stem.startswith("three_")):
+            continue
+        path = os.path.join(folder, fname)
+        rec = index.get(path)
+        if rec is None and write_queue.is_pending(path):
+            # Queued for removal
+            continue
+        if rec is None or rec.get("refs") is None:
+            return 0
+        if rec["key"] is not None and not write_queue.is_pending(path):
+            try:
+                if _file_stat_key(path) != rec["key"]:
+                    return 0
+            except OSError:
+                continue
+    for rec in index.values():
+        if rec.get("refs") is None:
+            return 0
+        referenced.update(rec["refs"])
+
+    removed = 0
+    now = time.time()
+    for fname in os.listdir(pool_dir):
+        stem, _compression = split_library_file_name(fname)
+        if stem is None or stem in referenced:
+            continue
+        path = os.path.join(pool_dir, fname)
+        try:
+            if write_queue.is_pending(path) or now - os.path.getmtime(path) < ACTION_GC_GRACE_SECONDS:
+                continue
+        except OSError:
+            continue
+        write_queue.submit_remove(path)
+        removed += 1
+    return removed
+
+
+def collect_action_garbage():
+    """
+    Drop pooled actions nobody references: internal Text blocks, the external
+    _actions folder or SQLite rows (depending on the backend).
+    Returns {"internal": n, "external": n}.
+    """
+    res = {"internal": 0, "external": 0}
+    try:
+        index = _read_index()
+        if index is not None:
+            res["internal"] = _gc_internal_pool(index)
+            _write_index(index)
+    except Exception:
+        pass
+    try:
+        if get_library_backend() == "SQLITE":
+            _path, conn = _sqlite_conn()
+            if conn is not None:
+                res["external"] = sqlite_backend.collect_garbage(conn)
+        else:
+            folder = get_external_folder()
+            if folder:
+                res["external"] = _gc_external_pool(folder)
+    except Exception:
+        pass
+    return res
+
+
+def _external_pool_loader(folder):
+    def load(digest):
+        for path in _library_file_variants(_external_pool_dir(folder), digest):
+            try:
+                return read_json_file(path)
+            except Exception:
+                continue
+        return None
+    return load
+
+
+# -------------------------
+# Internal library (sharded Text blocks)
+# -------------------------
+
+def _new_index():
+    return {"format": "sharded", "version": INDEX_VERSION, "animations": {}}
+
+
+def _shard_text_name(name, taken):
+    """Stable, length-safe Text block name for an animation shard."""
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:12]
+    text_name = f"{FILMS_SHARD_PREFIX}{digest}.json"
+    i = 1
+    while text_name in taken or bpy.data.texts.get(text_name) is not None:
+        text_name = f"{FILMS_SHARD_PREFIX}{digest}_{i}.json"
+        i += 1
+    return text_name
+
+
+def _read_legacy_films():
+    """Read the old monolithic {"animations": {...}} Text block."""
+    txt = bpy.data.texts.get(FILMS_TEXT_NAME)
     if not txt:
-        return {}
+        return None
     try:
         data = json.loads(txt.as_string())
-        return data.get("animations", {}) if isinstance(data, dict) else {}
     except Exception:
-        return {}
+        return None
+    if not isinstance(data, dict):
+        return None
+    anims = data.get("animations", {})
+    return anims if isinstance(anims, dict) else {}
 
 
-def read_all_films():
-    """Read ALL animations (internal + external) without cache."""
-    internal = read_internal_films()
-    external = read_external_films()
-    merged = dict(internal)
-    merged.update(external)
-    return merged
+def _migrate_legacy_films():
+    """
+    Split the old monolithic Text block into per-animation shards + index.
+    The legacy block is removed only after every shard is written.
+    """
+    legacy = _read_legacy_films()
+    if legacy is None:
+        return None
 
+    index = _new_index()
+    taken = set()
+    for name, entry in legacy.items():
+        if not isinstance(entry, dict):
+            continue
+        text_name = _shard_text_name(name, taken)
+        taken.add(text_name)
+        txt, size = _write_text_block(text_name, entry)
+        index["animations"][name] = {"text": txt.name, "meta": entry_meta(name, entry, size)}
 
-def write_internal_films(d):
+    _write_text_block(FILMS_INDEX_TEXT_NAME, index)
+    try:
+        _remove_text_block(FILMS_TEXT_NAME)
+    except Exception:
+        pass
+    return index
+
+
+def _read_index():
     """
-    Write internal library (Text datablock) and refresh cache as 'clean'.
+    Return the internal index dict, or None when the .blend has no internal library.
+    Migrates the legacy monolithic block when possible (writes to bpy.data are not
+    allowed from draw callbacks, so a failed migration is simply retried on the next write).
     """
-    global FILMS_CACHE, FILMS_CACHE_DIRTY
-    txt = ensure_films_text(create_if_missing=True)
+    txt = bpy.data.texts.get(FILMS_INDEX_TEXT_NAME)
+    if txt:
+        try:
+            data = _parse_text_block(txt)
+        except Exception:
+            return None
+        if isinstance(data, dict) and isinstance(data.get("animations"), dict):
+            return data
+        return None
+
+    if bpy.data.texts.get(FILMS_TEXT_NAME) is None:
+        return None
+    try:
+        return _migrate_legacy_films()
+    except Exception:
+        return None
+
+
+def ensure_films_index(create_if_missing=True):
+    """Return the internal index dict (migrating/creating it if needed) or None."""
+    try:
+        index = _read_index()
+        if index is None and create_if_missing:
+            if bpy.data.texts.get(FILMS_TEXT_NAME) is not None:
+                index = _migrate_legacy_films()
+            else:
+                index = _new_index()
+                _write_text_block(FILMS_INDEX_TEXT_NAME, index)
+        return index
+    except Exception:
+        return None
+
+
+def _write_index(index):
+    _write_text_block(FILMS_INDEX_TEXT_NAME, index)
+
+
+def _read_shard(rec, cache=True):
+    txt = bpy.data.texts.get(rec.get("text", "")) if isinstance(rec, dict) else None
     if not txt:
+        return None
+    try:
+        entry = _parse_text_block(txt, cache)
+    except Exception:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def _iter_internal_manifest():
+    """Yield (name, meta, location) for internal animations from the index only."""
+    index = _read_index()
+    if index is None:
+        # Legacy block that could not be migrated in this context
+        for name, entry in (_read_legacy_films() or {}).items():
+            if isinstance(entry, dict):
+                yield name, entry_meta(name, entry), ("internal", FILMS_TEXT_NAME)
+        return
+
+    for name, rec in index["animations"].items():
+        if not isinstance(rec, dict):
+            continue
+        meta = rec.get("meta")
+        if not isinstance(meta, dict) or "objects" not in meta:
+            # Index written before metadata / search terms existed: derive it from the
+            # shard (rewritten with full metadata on the next write of this animation)
+            entry = _read_shard(rec)
+            if entry is None:
+                continue
+            meta = entry_meta(name, entry, (meta or {}).get("size", 0), load_action=_load_internal_pool_action)
+        yield name, meta, ("internal", rec.get("text"))
+
+
+def read_internal_film(name, cache=True):
+    """Read one internal animation (only its shard and its missing pooled actions are parsed)."""
+    index = _read_index()
+    if index is None:
+        legacy = _read_legacy_films()
+        return (legacy or {}).get(name)
+    entry = _read_shard(index["animations"].get(name), cache)
+    if entry is None:
+        return None
+    return _resolve_entry(entry, _load_internal_pool_action, cache)
+
+
+def write_internal_film(name, entry):
+    """
+    Write one animation into its own shard. Other shards are not touched;
+    besides the shard only the small metadata index and actions that are
+    not yet in the pool are written.
+    """
+    index = ensure_films_index(create_if_missing=True)
+    if index is None:
         raise RuntimeError("Не удалось получить текст-блок для анимаций.")
-    txt.clear()
-    txt.write(json.dumps({"animations": d}, ensure_ascii=False, indent=2))
 
-    # Keep cache in sync (including external overrides)
-    FILMS_CACHE = dict(read_all_films())
-    FILMS_CACHE_DIRTY = False
+    packed, actions = _pack_entry(entry)
+    _write_internal_pool(actions)
+
+    txt, size = _write_text_block(_shard_text_for(index, name), packed)
 
+    meta = entry_meta(name, entry, size)
+    index["animations"][name] = {"text": txt.name, "meta": meta, "actions": sorted(actions)}
+    _gc_internal_pool(index)
+    _write_index(index)
+
+    _set_loaded(name, meta, ("internal", txt.name), entry)
+
+
+def _shard_text_for(index, name):
+    """Text block name of name's shard (existing one is reused)."""
+    anims = index["animations"]
+    rec = anims.get(name)
+    if rec and bpy.data.texts.get(rec.get("text", "")) is not None:
+        return rec["text"]
+    taken = {r.get("text") for r in anims.values() if isinstance(r, dict)}
+    return _shard_text_name(name, taken)
+
+
+def iter_internal_film_tracks(name):
+    """
+    Resolved object tracks of an internal animation, one at a time: only the shard
+    skeleton is parsed up front, pooled actions are loaded per track.
+    Neither the parsed shard nor the loaded actions are kept in FILMS_CACHE.
+    """
+    index = _read_index()
+    if index is None:
+        yield from ((_read_legacy_films() or {}).get(name) or {}).get("tracks") or []
+        return
+    entry = _read_shard(index["animations"].get(name), cache=False)
+    for tr in (entry or {}).get("tracks") or []:
+        yield _resolve_entry({"tracks": [tr]}, _load_internal_pool_action, cache=False)["tracks"][0]
+
+
+def remove_internal_film(name):
+    """Remove one animation shard. Returns True if it existed."""
+    global FILMS_CACHE_DIRTY
+    index = ensure_films_index(create_if_missing=False)
+    if not index or name not in index["animations"]:
+        return False
+
+    rec = index["animations"].pop(name)
+    try:
+        _remove_text_block(rec.get("text", ""))
+    except Exception:
+        pass
+    _gc_internal_pool(index)
+    _write_index(index)
+
+    # An external file with the same name may still provide this animation
+    FILMS_CACHE_DIRTY = True
+    return True
+
+
+# -------------------------
+# Version history (internal Text blocks, base + deltas)
+# -------------------------
+
+def _history_text_name(name):
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+    return f"{FILMS_HISTORY_PREFIX}{digest}.json"
+
+
+def read_film_history(name):
+    """History document of an animation or None (see history.py for the layout)."""
+    txt = bpy.data.texts.get(_history_text_name(name))
+    if not txt:
+        return None
+    try:
+        doc = _parse_text_block(txt)
+    except Exception:
+        return None
+    if not isinstance(doc, dict) or doc.get("name") != name or not isinstance(doc.get("base"), dict):
+        return None
+    return doc
+
+
+def record_film_version(name, prev_entry, new_entry, keep=HISTORY_KEEP_VERSIONS):
+    """
+    Append new_entry as the next version of name; prev_entry (the version being
+    replaced) becomes the base when the animation has no history yet.
+    Only the changed tracks / fcurves are stored. Returns the new version number.
+    """
+    doc = read_film_history(name)
+    if doc is None:
+        doc = history.new_history(name, prev_entry)
+        last = prev_entry
+    else:
+        last = history.reconstruct(doc, history.latest_number(doc))
+        if last is None:
+            last = prev_entry
+    number = history.append_version(doc, last, new_entry)
+    if keep:
+        history.compact(doc, keep)
+    _write_text_block(_history_text_name(name), doc)
+    return number
+
+
+def list_film_versions(name):
+    """[(number, created_at)] oldest first; empty when the animation has no history."""
+    doc = read_film_history(name)
+    return history.list_versions(doc) if doc else []
+
+
+def read_film_version(name, number):
+    doc = read_film_history(name)
+    if doc is None:
+        return None
+    return history.reconstruct(doc, int(number))
+
+
+def compact_film_history(name, keep):
+    """Collapse old deltas so that at most keep versions remain. Returns how many were collapsed."""
+    doc = read_film_history(name)
+    if doc is None:
+        return 0
+    dropped = history.compact(doc, keep)
+    if dropped:
+        _write_text_block(_history_text_name(name), doc)
+    collect_action_garbage()
+    return dropped
+
+
+def remove_film_history(name):
+    try:
+        _remove_text_block(_history_text_name(name))
+    except Exception:
+        pass
+
+
+# -------------------------
+# External folder (<name>.json files)
+# -------------------------
 
 def _get_addon_package_name():
     # procedural_films.storage -> procedural_films -> addon root package
@@ -64,93 +802,951 @@ def _get_addon_package_name():
         return ""
 
 
-def get_external_folder():
+def _get_addon_prefs():
     addon = _get_addon_package_name()
     try:
-        prefs = bpy.context.preferences.addons.get(addon).preferences
+        return bpy.context.preferences.addons.get(addon).preferences
+    except Exception:
+        return None
+
+
+def get_library_setting(name, default):
+    """
+    Library setting: scene property umz_<name> (declared in ui.register_scene_props
+    and shown in the panel), else an addon preference with the same name, else default.
+    """
+    try:
+        scene = bpy.context.scene
+        if scene is not None and hasattr(scene, f"umz_{name}"):
+            return getattr(scene, f"umz_{name}")
     except Exception:
-        prefs = None
+        pass
+    return getattr(_get_addon_prefs(), name, default)
+
+
+def get_external_folder():
+    prefs = _get_addon_prefs()
     if prefs and getattr(prefs, "external_animations_folder", ""):
         return bpy.path.abspath(prefs.external_animations_folder)
     return None
 
 
+def get_library_compression():
+    """'NONE' | 'GZIP' | 'XZ' (library_compression setting)."""
+    return normalize_compression(get_library_setting("library_compression", "NONE"))
+
+
+def get_library_backend():
+    """'FOLDER' (loose JSON files) | 'SQLITE' (library_backend setting)."""
+    backend = str(get_library_setting("library_backend", "FOLDER") or "FOLDER").upper()
+    return backend if backend in ("FOLDER", "SQLITE") else "FOLDER"
+
+
+def get_sqlite_library_path():
+    """sqlite_library_path setting, else <external folder>/library.sqlite; None if neither is set."""
+    path = get_library_setting("sqlite_library_path", "")
+    if path:
+        return bpy.path.abspath(path)
+    folder = get_external_folder()
+    return os.path.join(folder, SQLITE_LIBRARY_NAME) if folder else None
+
+
+def _sqlite_conn():
+    path = get_sqlite_library_path()
+    if not path:
+        return None, None
+    try:
+        return path, sqlite_backend.connect(path)
+    except Exception:
+        return path, None
+
+
+def _file_stat_key(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _parse_external_file(path):
+    """
+    Parse one external library file into {name: entry}. Returns None on error.
+    Plain, gzip and xz files are detected by their content.
+    """
+    try:
+        data = read_json_file(path)
+    except Exception:
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    # Supported formats:
+    # 1) {"animations": {...}}
+    # 2) {"AnimName": {...}, ...} where {...} contains "tracks"
+    if "animations" in data and isinstance(data["animations"], dict):
+        return dict(data["animations"])
+
+    res = {}
+    for k, v in data.items():
+        if isinstance(v, dict) and "tracks" in v:
+            res[k] = v
+    return res
+
+
+def _external_manifest_path(folder):
+    return os.path.join(folder, EXTERNAL_MANIFEST_NAME)
+
+
+def _load_external_manifest(folder):
+    """
+    Seed the scan index from the persisted folder manifest, so a cold start
+    only stats files instead of parsing them.
+    """
+    try:
+        with open(_external_manifest_path(folder), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return
+    for fname, rec in (data.get("files") or {}).items():
+        try:
+            key = (int(rec["key"][0]), int(rec["key"][1]))
+            meta = dict(rec["meta"])
+            refs = list(rec["refs"])
+        except Exception:
+            continue
+        _EXTERNAL_INDEX[os.path.join(folder, fname)] = {"key": key, "meta": meta, "refs": refs}
+
+
+def _save_external_manifest(folder):
+    """Persist the scan index (metadata only) through the background writer."""
+    files = {}
+    for path, rec in _EXTERNAL_INDEX.items():
+        # Files still being written get their key once the write completes
+        if rec["key"] is None:
+            continue
+        files[os.path.basename(path)] = {"key": list(rec["key"]), "meta": rec["meta"], "refs": rec.get("refs") or []}
+    write_queue.submit_write(
+        _external_manifest_path(folder),
+        {"version": MANIFEST_VERSION, "files": files},
+    )
+
+
+def _external_index_for(folder):
+    """Return the scan index for folder; switching folders drops the old one."""
+    global _EXTERNAL_INDEX_FOLDER
+    if _EXTERNAL_INDEX_FOLDER != folder:
+        _EXTERNAL_INDEX.clear()
+        _EXTERNAL_INDEX_FOLDER = folder
+        _load_external_manifest(folder)
+    return _EXTERNAL_INDEX
+
+
+def _is_pack_file(fname):
+    return fname.lower().endswith(PACK_EXTENSION)
+
+
+def _pack_header(path, key=None):
+    """Header of a .pfpack file, re-read only when the file changed."""
+    if key is None:
+        key = _file_stat_key(path)
+    cached = _PACK_HEADERS.get(path)
+    if cached and cached[0] == key:
+        return cached[1], cached[2]
+    header, data_start = read_pack_header(path)
+    _PACK_HEADERS[path] = (key, header, data_start)
+    return header, data_start
+
+
+def _pack_meta(path, key):
+    """
+    (manifest metadata, referenced digests) of a .pfpack file, taken from its header only.
+    Packs carry the actions they use, so their header action digests are the references.
+    """
+    try:
+        header, _data_start = _pack_header(path, key)
+    except Exception:
+        return {}, []
+    res = {}
+    for name, rec in (header.get("animations") or {}).items():
+        meta = rec.get("meta") if isinstance(rec, dict) else None
+        if isinstance(meta, dict):
+            res[name] = dict(meta, name=name, source="external")
+    return res, sorted(header.get("actions") or {})
+
+
+def _load_pack_entry(path, name, cache=True):
+    """Decode one animation (and the actions it references) from its slices only."""
+    try:
+        header, data_start = _pack_header(path)
+        rec = (header.get("animations") or {}).get(name)
+        if not rec:
+            return None
+        entry = read_pack_item(path, data_start, rec)
+    except Exception:
+        return None
+
+    folder_loader = _external_pool_loader(os.path.dirname(path))
+
+    def load_action(digest):
+        arec = (header.get("actions") or {}).get(digest)
+        if arec:
+            try:
+                return read_pack_item(path, data_start, arec)
+            except Exception:
+                pass
+        return folder_loader(digest)
+
+    return _resolve_entry(entry, load_action, cache)
+
+
+def _external_meta(path, entries):
+    size = 0
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        pass
+    # Only files written without head search terms get here; pool files are read
+    # directly so the scan does not fill the decoded cache
+    pool_loader = _external_pool_loader(os.path.dirname(path))
+    loaded = {}
+
+    def load_action(digest):
+        if digest not in loaded:
+            loaded[digest] = pool_loader(digest)
+        return loaded[digest]
+
+    return {name: entry_meta(name, e, size, "external", load_action) for name, e in entries.items()}
+
+
+def _parse_external_meta(path):
+    """
+    Parse one file down to (manifest metadata, referenced pool digests).
+    """
+    entries = _parse_external_file(path) or {}
+    refs = set()
+    for e in entries.values():
+        refs.update(_entry_action_refs(e))
+    return _external_meta(path, entries), sorted(refs)
+
+
+def _on_external_written(folder, path, name):
+    """Completion callback (main thread): stat the written file and fix up its location."""
+    def on_done(_path, error):
+        rec = _EXTERNAL_INDEX.get(path)
+        if error or rec is None or _EXTERNAL_INDEX_FOLDER != folder:
+            mark_cache_dirty()
+            return
+        try:
+            key = _file_stat_key(path)
+        except OSError:
+            mark_cache_dirty()
+            return
+        rec["key"] = key
+        for meta in rec["meta"].values():
+            meta["size"] = key[1]
+
+        old_loc = ("external", path, None)
+        new_loc = ("external", path, key)
+        if _FILM_LOCATIONS.get(name) == old_loc:
+            _FILM_LOCATIONS[name] = new_loc
+        cached = FILMS_CACHE.peek(("entry", name))
+        if cached is not None and cached[0] == old_loc:
+            cached[0] = new_loc
+        _save_external_manifest(folder)
+    return on_done
+
+
+def _write_animation_sqlite(name, entry):
+    path, conn = _sqlite_conn()
+    if conn is None:
+        return False
+    try:
+        packed, actions = _pack_entry(entry)
+        for digest, act in actions.items():
+            _pool_add(digest, act)
+        meta = entry_meta(name, entry, 0, "external")
+        revision = sqlite_backend.write_animation(conn, name, packed, actions, meta)
+    except Exception:
+        return False
+    _set_loaded(name, meta, ("sqlite", path, revision), entry)
+    return True
+
+
 def write_animation_to_file(name, entry):
-    global FILMS_CACHE_DIRTY
+    """
+    Queue <name>.json (or .json.gz / .json.xz, see get_library_compression())
+    for writing. Encoding, compression and the atomic temp-file + rename happen
+    on the background writer; use flush_pending_writes() to wait for it.
+    With the SQLite backend the entry is written to the database instead.
+    """
+    if get_library_backend() == "SQLITE":
+        return _write_animation_sqlite(name, entry)
     folder = get_external_folder()
     if not folder:
         return False
     try:
-        os.makedirs(folder, exist_ok=True)
-        path = os.path.join(folder, f"{name}.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump({name: entry}, f, ensure_ascii=False, indent=2)
-        FILMS_CACHE_DIRTY = True
+        compression = get_library_compression()
+        path = os.path.join(folder, library_file_name(name, compression))
+        packed, actions = _pack_entry(entry)
+        _write_external_pool(folder, actions)
+
+        # Record the file now so scans neither parse nor drop it while it is pending
+        index = _external_index_for(folder)
+        for other in _library_file_variants(folder, name):
+            if other != path and (write_queue.is_pending(other) or os.path.isfile(other)):
+                write_queue.submit_remove(other)
+                index.pop(other, None)
+        meta = {name: entry_meta(name, entry, 0, "external")}
+        index[path] = {"key": None, "meta": meta, "refs": sorted(actions)}
+        write_queue.submit_write(
+            path,
+            {name: packed},
+            encoder=_encoder_for(compression),
+            on_done=_on_external_written(folder, path, name),
+        )
+        _set_loaded(name, meta[name], ("external", path, None), entry)
+        _gc_external_pool(folder)
         return True
     except Exception:
         return False
 
 
+def _json_members(data):
+    """'"k":v,...' of a dict (compact JSON object body without braces)."""
+    return ",".join(f"{_dumps_compact(k)}:{_dumps_compact(v)}" for k, v in data.items())
+
+
+def _on_external_streamed(folder, path, name):
+    """
+    Completion callback of a streamed file (main thread): the file (and the pooled
+    actions written ahead of it) is on disk, so its location can be published.
+    """
+    written = _on_external_written(folder, path, name)
+
+    def on_done(_path, error):
+        written(_path, error)
+        rec = _EXTERNAL_INDEX.get(path)
+        if error or rec is None or rec["key"] is None or name not in rec["meta"]:
+            return
+        _set_loaded(name, rec["meta"][name], ("external", path, rec["key"]), None)
+    return on_done
+
+
+def _open_external_stream(name):
+    """
+    (folder, path, write_queue.StreamHandle) for name's library file, or None without
+    a folder. Compression, file writes and fsync run on the background writer.
+    """
+    folder = get_external_folder()
+    if not folder:
+        return None
+    compression = get_library_compression()
+    path = os.path.join(folder, library_file_name(name, compression))
+    # A queued write of the same file must not land after the streamed one
+    if write_queue.is_pending(path):
+        write_queue.flush()
+
+    def opener(p):
+        return JsonStreamWriter(p, compression)
+
+    handle = write_queue.submit_stream(path, opener, on_done=_on_external_streamed(folder, path, name))
+    return folder, path, handle
+
+
+def write_animation_streamed(name, head, tracks):
+    """
+    Streaming counterpart of write_internal_film + write_animation_to_file for
+    large scenes. tracks is an iterable (typically a generator over objects): each
+    object track is packed, encoded once and appended to the internal shard; the
+    same text is handed to the background writer for the external file, which
+    compresses and writes it off the main thread. Tracks and their actions are
+    dropped right away (nothing is added to FILMS_CACHE), so the whole entry is
+    never held in memory.
+    head is the entry without "tracks"; it is written after the tracks, so the
+    generator may still fill it in. Both targets are replaced only on success;
+    the external file is published once the writer has committed it.
+    With the SQLite backend the tracks are collected and written the regular way.
+    Returns True if the external file was queued / the database was written.
+    """
+    if get_library_backend() == "SQLITE":
+        tracks = list(tracks)
+        entry = dict(head, tracks=tracks)
+        write_internal_film(name, entry)
+        return write_animation_to_file(name, entry)
+
+    index = ensure_films_index(create_if_missing=True)
+    if index is None:
+        raise RuntimeError("Не удалось получить текст-блок для анимаций.")
+
+    # The shard is written into a fresh Text block and renamed over the old one at the end
+    text_name = _shard_text_for(index, name)
+    txt = bpy.data.texts.new(f"{text_name}.tmp")
+    try:
+        external = _open_external_stream(name)
+    except Exception:
+        external = None
+    stream = external[2] if external else None
+
+    size = 0
+    count = 0
+    terms = {field: set() for field in SEARCH_FIELDS}
+    refs = set()
+
+    def emit(chunk):
+        nonlocal size
+        txt.write(chunk)
+        size += len(chunk)
+        if stream is not None:
+            stream.write(chunk)
+
+    try:
+        if stream is not None:
+            stream.write(f"{{{_dumps_compact(name)}:")
+        emit('{"tracks":[')
+        for tr in tracks:
+            actions = {}
+            packed = _pack_track(tr, actions)
+            refs.update(actions)
+            _write_internal_pool(actions, cache=False)
+            if stream is not None:
+                # Through the stream: pooled actions land before the file that references them
+                _write_external_pool(external[0], actions, stream.submit_write, cache=False)
+            for field, values in entry_search_terms({"tracks": [tr]}).items():
+                terms[field].update(values)
+            emit(("," if count else "") + _dumps_compact(packed))
+            count += 1
+        tail = {k: v for k, v in head.items() if k not in ("tracks", "search")}
+        tail["search"] = {field: sorted(values) for field, values in terms.items()}
+        members = _json_members(tail)
+        emit("]" + ("," + members if members else "") + "}")
+        if stream is not None:
+            stream.write("}")
+            stream.commit()
+    except Exception:
+        if stream is not None:
+            stream.abort()
+        bpy.data.texts.remove(txt)
+        raise
+
+    _remove_text_block(text_name)
+    txt.name = text_name
+
+    meta = entry_meta(name, dict(head, tracks=()), size)
+    meta["track_count"] = count
+    meta.update({field: sorted(values) for field, values in terms.items()})
+    index["animations"][name] = {"text": txt.name, "meta": meta, "actions": sorted(refs)}
+    _gc_internal_pool(index)
+    _write_index(index)
+    _set_loaded(name, meta, ("internal", txt.name), None)
+    # An older external version may stay published until the new file is committed
+    FILMS_CACHE.pop(("entry", name))
+
+    if stream is None:
+        return False
+    folder, path = external[0], external[1]
+    try:
+        # Recorded now (key None) so scans neither parse nor drop the file while it is pending;
+        # _on_external_streamed fills in the key and publishes the location
+        ext_index = _external_index_for(folder)
+        for other in _library_file_variants(folder, name):
+            if other != path and (write_queue.is_pending(other) or os.path.isfile(other)):
+                write_queue.submit_remove(other)
+                ext_index.pop(other, None)
+        ext_meta = dict(meta, size=0, source="external")
+        ext_index[path] = {"key": None, "meta": {name: ext_meta}, "refs": sorted(refs)}
+        _gc_external_pool(folder)
+    except Exception:
+        mark_cache_dirty()
+    return True
+
+
+def flush_pending_writes(timeout=None):
+    """Wait for queued library writes. Returns a list of (path, error)."""
+    return write_queue.flush(timeout=timeout)
+
+
 def remove_animation_file(name):
+    global FILMS_CACHE_DIRTY
+    if get_library_backend() == "SQLITE":
+        _path, conn = _sqlite_conn()
+        if conn is None:
+            return False
+        try:
+            removed = sqlite_backend.remove_animation(conn, name)
+        except Exception:
+            return False
+        if removed:
+            FILMS_CACHE_DIRTY = True
+        return removed
+    return _remove_folder_animation(name)
+
+
+def _remove_folder_animation(name):
     global FILMS_CACHE_DIRTY
     folder = get_external_folder()
     if not folder:
         return False
-    path = os.path.join(folder, f"{name}.json")
+    removed = False
     try:
-        if os.path.isfile(path):
-            os.remove(path)
+        index = _external_index_for(folder)
+        for path in _library_file_variants(folder, name):
+            if write_queue.is_pending(path) or os.path.isfile(path):
+                write_queue.submit_remove(path)
+                index.pop(path, None)
+                removed = True
+        if removed:
+            _save_external_manifest(folder)
+            _gc_external_pool(folder)
             FILMS_CACHE_DIRTY = True
-            return True
     except Exception:
         pass
-    return False
+    return removed
 
 
-def read_external_films():
+def convert_external_folder(compression):
+    """
+    Bulk converter: rewrite every library file in the external folder
+    (entries, pooled actions, three_*.json clips) in the given format and
+    remove the old files. Returns (converted count, [(path, error)]).
+    """
     folder = get_external_folder()
-    res = {}
+    compression = normalize_compression(compression)
     if not folder or not os.path.isdir(folder):
-        return res
+        return 0, []
+
+    converted = 0
+    errors = []
+    for d in (folder, _external_pool_dir(folder)):
+        if not os.path.isdir(d):
+            continue
+        for fname in os.listdir(d):
+            stem, current = split_library_file_name(fname)
+            if stem is None:
+                continue
+            is_clip = d == folder and stem.startswith("three_")
+            # three.js clips stay readable by the browser (plain or gzip only)
+            target = three_clip_compression(compression) if is_clip else compression
+            if current == target:
+                continue
+            src = os.path.join(d, fname)
+            try:
+                data = read_json_file(src)
+            except Exception as e:
+                errors.append((src, repr(e)))
+                continue
+            # three.js clips keep their readable layout when uncompressed
+            indent = 2 if is_clip else None
+            write_queue.submit_write(
+                os.path.join(d, library_file_name(stem, target)),
+                data,
+                encoder=_encoder_for(target, indent),
+            )
+            write_queue.submit_remove(src)
+            converted += 1
+
+    errors.extend(write_queue.flush())
+    mark_cache_dirty()
+    return converted, errors
+
+
+def write_library_pack(pack_name, names=None, remove_sources=False):
+    """
+    Pack animations (default: all) with the actions they use into
+    <folder>/<pack_name>.pfpack. With remove_sources the packed <name>.json*
+    files are removed. Returns (path or None, [(path, error)]).
+    """
+    folder = get_external_folder()
+    if not folder:
+        return None, []
+
+    if names is None:
+        names = list(read_manifest_cached().keys())
+
+    animations = {}
+    actions = {}
+    for name in names:
+        entry = get_film(name)
+        if entry is None:
+            continue
+        packed, acts = _pack_entry(entry)
+        actions.update(acts)
+        animations[name] = (packed, entry_meta(name, entry, 0, "external"))
+
+    if not pack_name.lower().endswith(PACK_EXTENSION):
+        pack_name = f"{pack_name}{PACK_EXTENSION}"
+    path = os.path.join(folder, pack_name)
+    write_queue.submit_write(path, {"animations": animations, "actions": actions}, encoder=encode_pack)
+
+    if remove_sources:
+        for name in animations:
+            _remove_folder_animation(name)
+
+    errors = write_queue.flush()
+    mark_cache_dirty()
+    return path, errors
+
+
+def import_folder_to_sqlite(db_path=None):
+    """
+    Copy every animation of the external JSON folder (loose files and packs) into
+    the SQLite library. Returns (imported count, [(name, error)]).
+    """
+    global FILMS_CACHE_DIRTY
+    db_path = db_path or get_sqlite_library_path()
+    if not db_path:
+        return 0, []
+    conn = sqlite_backend.connect(db_path)
+
+    imported = 0
+    errors = []
+    for name, entry in _read_folder_films().items():
+        try:
+            packed, actions = _pack_entry(entry)
+            sqlite_backend.write_animation(conn, name, packed, actions, entry_meta(name, entry))
+            imported += 1
+        except Exception as e:
+            errors.append((name, repr(e)))
+    FILMS_CACHE_DIRTY = True
+    return imported, errors
+
+
+def _scan_external_manifest():
+    """
+    Return ([(name, meta, location)], changed) for the external folder. Files are
+    parsed only when new or when their (mtime, size) changed; vanished files are dropped.
+    """
+    write_queue.process_completed()
+    folder = get_external_folder()
+    if not folder or not os.path.isdir(folder):
+        changed = bool(_EXTERNAL_INDEX)
+        _EXTERNAL_INDEX.clear()
+        return [], changed
+
+    index = _external_index_for(folder)
+    seen = set()
+    changed = False
+    res = []
 
+    files = []
     for fname in os.listdir(folder):
-        if not fname.lower().endswith(".json"):
+        is_pack = _is_pack_file(fname)
+        if not is_pack and split_library_file_name(fname)[0] is None:
             continue
         path = os.path.join(folder, fname)
+        if write_queue.is_pending(path) and path in index:
+            continue
 
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
+            key = _file_stat_key(path)
+        except OSError:
             continue
+        seen.add(path)
+        rec = index.get(path)
+        files.append((path, key, is_pack, rec is None or rec["key"] != key))
+
+    # Only new/changed JSON files are parsed (in listdir order: later files win)
+    parsed = {path: _parse_external_meta(path) for path, _key, is_pack, stale in files if stale and not is_pack}
+
+    for path, key, is_pack, stale in files:
+        if stale:
+            # Unreadable files are remembered too, so they are not re-parsed every scan
+            meta, refs = _pack_meta(path, key) if is_pack else parsed[path]
+            index[path] = {"key": key, "meta": meta, "refs": refs}
+            changed = True
 
-        if not isinstance(data, dict):
+        for name, meta in index[path]["meta"].items():
+            res.append((name, meta, ("external", path, key)))
+
+    for path in [p for p in _PACK_HEADERS if p not in seen]:
+        del _PACK_HEADERS[path]
+
+    for path in [p for p in index if p not in seen]:
+        rec = index[path]
+        if write_queue.is_pending(path):
+            # Our own write is still in flight: trust the recorded metadata
+            for name, meta in rec["meta"].items():
+                res.append((name, meta, ("external", path, rec["key"])))
             continue
+        del index[path]
+        changed = True
+
+    if changed:
+        _save_external_manifest(folder)
+    return res, changed
+
+
+def _scan_sqlite_manifest():
+    """Return ([(name, meta, location)], changed) for the SQLite library."""
+    global _SQLITE_LISTING
+    path, conn = _sqlite_conn()
+    if conn is None:
+        changed = _SQLITE_LISTING is not None
+        _SQLITE_LISTING = None
+        return [], changed
+    try:
+        signature = (path, sqlite_backend.library_signature(conn))
+        if _SQLITE_LISTING is not None and _SQLITE_LISTING[0] == signature:
+            return list(_SQLITE_LISTING[1]), False
+        metas = sqlite_backend.list_meta(conn)
+    except Exception:
+        return [], False
+
+    res = []
+    for name, meta in metas.items():
+        revision = meta.pop("revision")
+        res.append((name, dict(meta, source="external"), ("sqlite", path, revision)))
+    _SQLITE_LISTING = (signature, res)
+    return list(res), True
+
+
+def _scan_library_manifest():
+    """External listing of the active backend: ([(name, meta, location)], changed)."""
+    if get_library_backend() == "SQLITE":
+        return _scan_sqlite_manifest()
+    return _scan_external_manifest()
 
-        # Supported formats:
-        # 1) {"animations": {...}}
-        # 2) {"AnimName": {...}, ...} where {...} contains "tracks"
-        if "animations" in data and isinstance(data["animations"], dict):
-            res.update(data["animations"])
-        else:
-            for k, v in data.items():
-                if isinstance(v, dict) and "tracks" in v:
-                    res[k] = v
 
+def _sqlite_action_loader(path):
+    def load(digest):
+        try:
+            return sqlite_backend.read_action(sqlite_backend.connect(path), digest)
+        except Exception:
+            return None
+    return load
+
+
+def _load_sqlite_entry(path, name, cache=True):
+    try:
+        entry = sqlite_backend.read_animation(sqlite_backend.connect(path), name)
+    except Exception:
+        return None
+    if entry is None:
+        return None
+    return _resolve_entry(entry, _sqlite_action_loader(path), cache)
+
+
+def _read_folder_films():
+    """Every animation of the external folder with full payload (nothing is added to FILMS_CACHE)."""
+    listing = _scan_external_manifest()[0]
+    paths = []
+    for _name, _meta, loc in listing:
+        if not _is_pack_file(loc[1]):
+            paths.append(loc[1])
+    paths = list(dict.fromkeys(paths))
+    parsed = {path: _parse_external_file(path) for path in paths}
+
+    res = {}
+    for name, _meta, loc in listing:
+        if _is_pack_file(loc[1]):
+            entry = _load_pack_entry(loc[1], name, cache=False)
+        else:
+            entry = (parsed.get(loc[1]) or {}).get(name)
+            if entry is not None:
+                entry = _resolve_entry(entry, _external_pool_loader(os.path.dirname(loc[1])), cache=False)
+        if entry is not None:
+            res[name] = entry
     return res
 
 
-def read_all_films_cached():
+# -------------------------
+# Cached access
+# -------------------------
+
+def _load_from_location(name, loc, cache=True):
+    if loc[0] == "external" and write_queue.is_pending(loc[1]):
+        # Our own write of this file is still in flight (e.g. a streamed file that is
+        # published only once committed): wait for it, its callback may move the location
+        write_queue.flush()
+        loc = _FILM_LOCATIONS.get(name, loc)
+    if loc[0] == "sqlite":
+        return _load_sqlite_entry(loc[1], name, cache)
+    if loc[0] == "external" and _is_pack_file(loc[1]):
+        return _load_pack_entry(loc[1], name, cache)
+    if loc[0] == "external":
+        entry = (_parse_external_file(loc[1]) or {}).get(name)
+        if entry is None:
+            return None
+        return _resolve_entry(entry, _external_pool_loader(os.path.dirname(loc[1])), cache)
+    return read_internal_film(name, cache)
+
+
+def _rebuild_manifest(external=None):
     """
-    Return animations using cache. Disk is read only when FILMS_CACHE_DIRTY == True.
+    Merge internal index + external scan into FILMS_MANIFEST. Only cache entries
+    whose source location changed are dropped. Returns True if anything changed.
     """
-    global FILMS_CACHE, FILMS_CACHE_DIRTY
+    if external is None:
+        external = _scan_library_manifest()[0]
+    manifest = {}
+    locations = {}
+    for name, meta, loc in _iter_internal_manifest():
+        manifest[name] = meta
+        locations[name] = loc
+    for name, meta, loc in external:
+        manifest[name] = meta
+        locations[name] = loc
+
+    if manifest == FILMS_MANIFEST and locations == _FILM_LOCATIONS:
+        return False
+
+    _bump_generation()
+    for name in list(FILMS_MANIFEST.keys()):
+        if name not in manifest:
+            _SEARCH_INDEX.remove(name)
+    for name, meta in manifest.items():
+        if FILMS_MANIFEST.get(name) != meta:
+            _SEARCH_INDEX.add(name, meta)
+    FILMS_MANIFEST.clear()
+    FILMS_MANIFEST.update(manifest)
+    _FILM_LOCATIONS.clear()
+    _FILM_LOCATIONS.update(locations)
+
+    # Drop loaded entries whose source changed or disappeared
+    for key in FILMS_CACHE.keys():
+        if key[0] != "entry":
+            continue
+        cached = FILMS_CACHE.peek(key)
+        if cached[0] != locations.get(key[1]):
+            FILMS_CACHE.pop(key)
+    return True
+
+
+def read_manifest_cached():
+    """
+    Return {name: metadata} for all animations (internal + external).
+    Nothing but the index/manifest is read; full entries stay on disk.
+    """
+    global FILMS_CACHE_DIRTY
+    write_queue.process_completed()
     if FILMS_CACHE_DIRTY:
-        FILMS_CACHE = read_all_films()
+        _rebuild_manifest()
         FILMS_CACHE_DIRTY = False
-    return FILMS_CACHE
+    return FILMS_MANIFEST
+
+
+def poll_external_folder():
+    """
+    Folder watcher step (driven by a bpy.app.timers callback): stat the external
+    folder and invalidate only the entries whose files changed. Returns True if
+    anything changed (callers then redraw / drop memoized data).
+    """
+    if FILMS_CACHE_DIRTY:
+        return False
+    external, changed = _scan_library_manifest()
+    if not changed:
+        return False
+    return _rebuild_manifest(external)
+
+
+def get_film(name):
+    """Return the full entry for name, loading it on first use."""
+    read_manifest_cached()
+    loc = _FILM_LOCATIONS.get(name)
+    if loc is None:
+        return None
+    entry = _cached_entry(name, loc)
+    if entry is not None:
+        return entry
+
+    entry = _load_from_location(name, loc)
+    if entry is not None:
+        _cache_entry(name, loc, entry)
+    return entry
+
+
+def find_animations(object_name=None, data_path=None, action=None):
+    """
+    Names of animations that animate object_name / use data_path / use the action
+    named action (all given conditions must match). Answered from the index only.
+    """
+    read_manifest_cached()
+    return sorted(_SEARCH_INDEX.find(object_name, data_path, action))
+
+
+def search_animations(query):
+    """Names of animations whose name, objects, data paths or actions contain query."""
+    read_manifest_cached()
+    return sorted(_SEARCH_INDEX.search(query))
 
 
 def mark_cache_dirty():
     global FILMS_CACHE_DIRTY
-    FILMS_CACHE_DIRTY = True
\ No newline at end of file
+    FILMS_CACHE_DIRTY = True
+
+
+# -------------------------
+# Compatibility wrappers (pre-shard API)
+# Kept for scripts written against the old single-block API; the addon itself
+# lists through read_manifest_cached() and loads one entry with get_film().
+# None of these add entries to FILMS_CACHE.
+# -------------------------
+
+def read_internal_films():
+    """Compatibility: every internal animation with full payload."""
+    index = _read_index()
+    if index is None:
+        return _read_legacy_films() or {}
+    res = {}
+    for name, rec in index["animations"].items():
+        entry = _read_shard(rec, cache=False)
+        if entry is not None:
+            res[name] = _resolve_entry(entry, _load_internal_pool_action, cache=False)
+    return res
+
+
+def read_external_films():
+    """Compatibility: every external animation (folder or SQLite) with full payload."""
+    if get_library_backend() == "SQLITE":
+        res = {}
+        for name, _meta, loc in _scan_sqlite_manifest()[0]:
+            entry = _load_sqlite_entry(loc[1], name, cache=False)
+            if entry is not None:
+                res[name] = entry
+        return res
+    return _read_folder_films()
+
+
+def read_all_films():
+    """Compatibility: ALL animations (internal + external, external wins)."""
+    merged = dict(read_internal_films())
+    merged.update(read_external_films())
+    return merged
+
+
+def read_all_films_cached():
+    """
+    Compatibility: ALL animations with full payloads. Entries already in
+    FILMS_CACHE are reused, the rest are loaded without being cached.
+    """
+    res = {}
+    for name in list(read_manifest_cached().keys()):
+        loc = _FILM_LOCATIONS.get(name)
+        if loc is None:
+            continue
+        entry = _cached_entry(name, loc)
+        if entry is None:
+            entry = _load_from_location(name, loc, cache=False)
+        if entry is not None:
+            res[name] = entry
+    return res
+
+
+def write_internal_films(d):
+    """
+    Compatibility: replace the whole internal library with d through the shard API
+    (write_internal_film / remove_internal_film); unchanged shards are not rewritten.
+    """
+    index = ensure_films_index(create_if_missing=True)
+    if index is None:
+        raise RuntimeError("Не удалось получить текст-блок для анимаций.")
+
+    for name in [n for n in index["animations"] if n not in d]:
+        remove_internal_film(name)
+
+    for name, entry in d.items():
+        rec = index["animations"].get(name)
+        txt = bpy.data.texts.get(rec.get("text", "")) if rec else None
+        if txt is not None and txt.as_string() == _dumps_compact(_pack_entry(entry)[0]):
+            continue
+        write_internal_film(name, entry)
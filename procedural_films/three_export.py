@@ -1,5 +1,4 @@
 import bpy
-import json
 import os
 
 from mathutils import Quaternion
@@ -10,6 +9,9 @@ from .constants import (
     GLTF_ID_PROP,
 )
 from .text_utils import get_active_text_datablock
+from .blender_codec import fcurve_columns
+from . import write_queue
+from .file_formats import COMPRESSION_EXTENSIONS, encode_json, library_file_name, three_clip_compression
 
 # =========================================================
 # ЭКСПОРТ В THREE.JS (entry -> three_<name>.json)
@@ -97,17 +99,14 @@ def _collect_keyframes(action_fcurves, data_path, array_index, frame_start, fram
                         continue
                     pts.append((fr, val))
 
-            # сериализованный dict
+            # сериализованный dict (колонки v2 или старые {"co": ...})
             else:
-                for kp in fc.get("keyframes", []):
-                    co = kp.get("co")
-                    if not co or len(co) < 2:
-                        continue
-                    fr = float(co[0])
-                    val = float(co[1])
+                frames, values, _codes = fcurve_columns(fc)
+                for fr, val in zip(frames, values):
+                    fr = float(fr)
                     if fr < frame_start or fr > frame_end:
                         continue
-                    pts.append((fr, val))
+                    pts.append((fr, float(val)))
 
             pts.sort(key=lambda x: x[0])
             return pts
@@ -522,6 +521,186 @@ def _eval_local_matrix(obj, depsgraph):
     return mw
 
 
+# -------------------------
+# Запекание: план по объектам + один проход по таймлайну
+# -------------------------
+
+def _plan_object_bake(obj, anim, frame_start, frame_end, fps, export_alpha):
+    """
+    Что нужно запечь для объекта: кадры position / rotation (None — канал не анимирован),
+    alpha-трек (строится сразу, без depsgraph) и ключи fade. None — у объекта нет fcurves.
+    """
+    node_id = _safe_node_id(obj)
+    is_cam = _is_camera_object(obj)
+
+    # --- собираем data_path всех fcurves, чтобы быстро понять, что вообще анимируется ---
+    data_paths = set()
+    for nla_track in (anim.get("tracks") or []):
+        for strip in (nla_track.get("strips") or []):
+            act = strip.get("action") or {}
+            for fc in (act.get("fcurves") or []):
+                data_paths.add(fc.get("data_path"))
+
+    if not data_paths:
+        return None
+
+    has_loc = "location" in data_paths or "delta_location" in data_paths
+    has_rot = "rotation_quaternion" in data_paths or "rotation_euler" in data_paths
+    has_alpha = "color" in data_paths or '["alpha"]' in data_paths
+
+    plan = {
+        "obj": obj,
+        "node_id": node_id,
+        "alpha": None,
+        "pos_frames": None,
+        "rot_frames": None,
+        "fade": _collect_nla_keyframes(anim, '["fade"]', 0, frame_start, frame_end),
+        "samples": {},   # кадр -> (loc, quaternion), заполняет _bake_plans
+    }
+
+    # alpha_tracks (отдельно, линейно)
+    if export_alpha and has_alpha:
+        plan["alpha"] = _build_alpha_tracks_for_object(node_id, anim, frame_start, frame_end, fps)
+
+    # Position: keys-only (но значения берём из depsgraph). Камеру можно печь чаще/регулярно
+    if has_loc:
+        pos_frames = set()
+        for i in range(3):
+            pos_frames.update(_collect_nla_keyframes_frames(anim, "location", i, frame_start, frame_end))
+        if not pos_frames:
+            for i in range(3):
+                pos_frames.update(_collect_nla_keyframes_frames(anim, "delta_location", i, frame_start, frame_end))
+
+        if CAMERA_BAKE_EVERY_FRAME and is_cam:
+            frames = list(range(frame_start, frame_end + 1, int(CAMERA_BAKE_STEP_FRAMES)))
+        else:
+            frames = sorted(pos_frames)
+        if frames:
+            plan["pos_frames"] = frames
+
+    # Rotation: quaternion bake (шаг фиксированный), для камеры можно чаще
+    if has_rot:
+        if CAMERA_BAKE_EVERY_FRAME and is_cam:
+            frames = list(range(frame_start, frame_end + 1, int(CAMERA_BAKE_STEP_FRAMES)))
+        else:
+            frames = list(range(frame_start, frame_end + 1, int(ROT_BAKE_STEP_FRAMES)))
+
+        if not frames:
+            frames = [frame_start, frame_end]
+        if frames[-1] != frame_end:
+            frames.append(frame_end)
+        plan["rot_frames"] = frames
+
+    return plan
+
+
+def _bake_plans(scene, view_layer, depsgraph, plans):
+    """
+    Шагает по объединению кадров всех планов один раз (frame_set + view_layer.update
+    на кадр) и на каждом кадре снимает локальную матрицу всех объектов, которым он нужен.
+    """
+    by_frame = {}
+    for plan in plans:
+        for frames in (plan["pos_frames"], plan["rot_frames"]):
+            for fr in frames or ():
+                users = by_frame.setdefault(int(fr), [])
+                if not users or users[-1] is not plan:
+                    users.append(plan)
+
+    if not by_frame:
+        return
+
+    current_frame = scene.frame_current
+    for fr in sorted(by_frame):
+        try:
+            scene.frame_set(fr)
+            view_layer.update()
+        except Exception:
+            pass
+
+        for plan in by_frame[fr]:
+            ml = _eval_local_matrix(plan["obj"], depsgraph)
+            loc, rot, sca = ml.decompose()
+            q = rot.to_quaternion() if hasattr(rot, "to_quaternion") else rot
+            q.normalize()
+            plan["samples"][fr] = ((float(loc.x), float(loc.y), float(loc.z)), q)
+
+    try:
+        scene.frame_set(current_frame)
+        view_layer.update()
+    except Exception:
+        pass
+
+
+def _plan_tracks(plan, frame_start, fps):
+    """Треки clip для объекта из запечённых сэмплов: position, quaternion, userData.fade."""
+    node_id = plan["node_id"]
+    samples = plan["samples"]
+    out = []
+
+    frames = plan["pos_frames"]
+    if frames:
+        values = []
+        for fr in frames:
+            values.extend(samples[int(fr)][0])
+        out.append({
+            "type": "vector",
+            "name": f"{node_id}.position",
+            "times": [_frame_to_time(fr, frame_start, fps) for fr in frames],
+            "values": values
+        })
+
+    frames = plan["rot_frames"]
+    if frames:
+        quat_values = []
+        prev_q = None
+        for fr in frames:
+            q = samples[int(fr)][1]
+            # фикс "переворота" кватерниона: чтобы не было скачков из-за смены знака
+            if prev_q is not None and prev_q.dot(q) < 0.0:
+                q = Quaternion((-q.w, -q.x, -q.y, -q.z))
+            prev_q = q.copy()
+            quat_values.extend([float(q.x), float(q.y), float(q.z), float(q.w)])
+
+        # если кватернион константный — можно не писать трек
+        if not _is_quaternion_constant(quat_values):
+            out.append({
+                "type": "quaternion",
+                "name": f"{node_id}.quaternion",
+                "times": [_frame_to_time(fr, frame_start, fps) for fr in frames],
+                "values": quat_values
+            })
+
+    # Fade -> userData.fade (обычный number track)
+    fade = plan["fade"]
+    if fade:
+        frames = _union_frames(fade)
+        if frames:
+            def value_at_step(channel_pts, frame):
+                if not channel_pts:
+                    return 0.0
+                last = channel_pts[0][1]
+                for fr, val in channel_pts:
+                    if fr == frame:
+                        return val
+                    if fr < frame:
+                        last = val
+                    if fr > frame:
+                        break
+                return last
+
+            out.append(_build_number_track(
+                node_id,
+                "userData.fade",
+                frames,
+                frame_start,
+                fps,
+                lambda fr: value_at_step(fade, fr)
+            ))
+
+    return out
+
+
 # -------------------------
 # Основная сборка клипа
 # -------------------------
@@ -568,6 +747,9 @@ def build_three_clip_from_saved_entry(entry_name, entry):
 
     scene_objects = {o.name: o for o in bpy.data.objects}
 
+    # Проход 1: по каждому треку — какие кадры нужны для position / rotation.
+    # Треки читаются один раз (entry["tracks"] может быть генератором), Action не держим.
+    plans = []
     for tr in entry.get("tracks", []):
         obj_name_blender = tr.get("object_name")
         anim = tr.get("animation") or {}
@@ -578,171 +760,18 @@ def build_three_clip_from_saved_entry(entry_name, entry):
         if not obj:
             continue
 
-        node_id = _safe_node_id(obj)
-        is_cam = _is_camera_object(obj)
-
-        # --- собираем список всех fcurves (dict) чтобы быстро понять, что вообще анимируется ---
-        fcurves_all = []
-        for nla_track in (anim.get("tracks") or []):
-            for strip in (nla_track.get("strips") or []):
-                act = strip.get("action") or {}
-                for fc in (act.get("fcurves") or []):
-                    fcurves_all.append(fc)
-
-        if not fcurves_all:
+        plan = _plan_object_bake(obj, anim, frame_start, frame_end, fps, export_alpha)
+        if plan is None:
             continue
+        if plan["alpha"]:
+            alpha_tracks_out.append(plan["alpha"])
+        plans.append(plan)
 
-        def _has_dp(dp):
-            for fc in fcurves_all:
-                if fc.get("data_path") == dp:
-                    return True
-            return False
+    # Проход 2: один проход по объединению кадров, все объекты сэмплируются на каждом кадре
+    _bake_plans(scene, view_layer, depsgraph, plans)
 
-        has_loc = _has_dp("location") or _has_dp("delta_location")
-        has_rot = _has_dp("rotation_quaternion") or _has_dp("rotation_euler")
-        has_alpha = _has_dp("color") or _has_dp('["alpha"]')
-
-        # -------------------------
-        # alpha_tracks (отдельно, линейно)
-        # -------------------------
-        if export_alpha and has_alpha:
-            at = _build_alpha_tracks_for_object(node_id, anim, frame_start, frame_end, fps)
-            if at:
-                alpha_tracks_out.append(at)
-
-        fade = _collect_nla_keyframes(anim, '["fade"]', 0, frame_start, frame_end)
-
-        # -------------------------
-        # Position: keys-only (но значения берём из depsgraph)
-        # Камеру можно печь чаще/регулярно
-        # -------------------------
-        if has_loc:
-            pos_frames = set()
-            pos_frames.update(_collect_nla_keyframes_frames(anim, "location", 0, frame_start, frame_end))
-            pos_frames.update(_collect_nla_keyframes_frames(anim, "location", 1, frame_start, frame_end))
-            pos_frames.update(_collect_nla_keyframes_frames(anim, "location", 2, frame_start, frame_end))
-
-            if not pos_frames:
-                pos_frames.update(_collect_nla_keyframes_frames(anim, "delta_location", 0, frame_start, frame_end))
-                pos_frames.update(_collect_nla_keyframes_frames(anim, "delta_location", 1, frame_start, frame_end))
-                pos_frames.update(_collect_nla_keyframes_frames(anim, "delta_location", 2, frame_start, frame_end))
-
-            if CAMERA_BAKE_EVERY_FRAME and is_cam:
-                frames = list(range(frame_start, frame_end + 1, int(CAMERA_BAKE_STEP_FRAMES)))
-            else:
-                frames = sorted(pos_frames)
-
-            if frames:
-                times = [_frame_to_time(fr, frame_start, fps) for fr in frames]
-                values = []
-
-                current_frame = scene.frame_current
-                for fr in frames:
-                    try:
-                        scene.frame_set(int(fr))
-                        view_layer.update()
-                    except Exception:
-                        pass
-
-                    ml = _eval_local_matrix(obj, depsgraph)
-                    loc, rot, sca = ml.decompose()
-                    values.extend([float(loc.x), float(loc.y), float(loc.z)])
-
-                try:
-                    scene.frame_set(current_frame)
-                    view_layer.update()
-                except Exception:
-                    pass
-
-                tracks_out.append({
-                    "type": "vector",
-                    "name": f"{node_id}.position",
-                    "times": times,
-                    "values": values
-                })
-
-        # -------------------------
-        # Rotation: quaternion bake (шаг фиксированный), для камеры можно чаще
-        # -------------------------
-        if has_rot:
-            if CAMERA_BAKE_EVERY_FRAME and is_cam:
-                frames = list(range(frame_start, frame_end + 1, int(CAMERA_BAKE_STEP_FRAMES)))
-            else:
-                frames = list(range(frame_start, frame_end + 1, int(ROT_BAKE_STEP_FRAMES)))
-
-            if not frames:
-                frames = [frame_start, frame_end]
-            if frames[-1] != frame_end:
-                frames.append(frame_end)
-
-            times = [_frame_to_time(fr, frame_start, fps) for fr in frames]
-
-            quat_values = []
-            prev_q = None
-            current_frame = scene.frame_current
-
-            for fr in frames:
-                try:
-                    scene.frame_set(int(fr))
-                    view_layer.update()
-                except Exception:
-                    pass
-
-                ml = _eval_local_matrix(obj, depsgraph)
-                loc, rot, sca = ml.decompose()
-
-                q = rot.to_quaternion() if hasattr(rot, "to_quaternion") else rot
-                q.normalize()
-
-                # фикс "переворота" кватерниона: чтобы не было скачков из-за смены знака
-                if prev_q is not None and prev_q.dot(q) < 0.0:
-                    q = Quaternion((-q.w, -q.x, -q.y, -q.z))
-                prev_q = q.copy()
-
-                quat_values.extend([float(q.x), float(q.y), float(q.z), float(q.w)])
-
-            try:
-                scene.frame_set(current_frame)
-                view_layer.update()
-            except Exception:
-                pass
-
-            # если кватернион константный — можно не писать трек
-            if not _is_quaternion_constant(quat_values):
-                tracks_out.append({
-                    "type": "quaternion",
-                    "name": f"{node_id}.quaternion",
-                    "times": times,
-                    "values": quat_values
-                })
-
-        # -------------------------
-        # Fade -> userData.fade (обычный number track)
-        # -------------------------
-        if fade:
-            frames = _union_frames(fade)
-            if frames:
-                def value_at_step(channel_pts, frame):
-                    if not channel_pts:
-                        return 0.0
-                    last = channel_pts[0][1]
-                    for fr, val in channel_pts:
-                        if fr == frame:
-                            return val
-                        if fr < frame:
-                            last = val
-                        if fr > frame:
-                            break
-                    return last
-
-                tracks_out.append(_build_number_track(
-                    node_id,
-                    "userData.fade",
-                    frames,
-                    frame_start,
-                    fps,
-                    lambda fr: value_at_step(fade, fr)
-                ))
+    for plan in plans:
+        tracks_out.extend(_plan_tracks(plan, frame_start, fps))
 
     out = {
         "name": entry_name,
@@ -766,18 +795,30 @@ def build_three_clip_from_saved_entry(entry_name, entry):
     return out
 
 
-def write_three_animation_to_file(name, clip, folder):
+def three_clip_paths(name, folder):
+    """Все варианты файла клипа: three_<name>.json / .json.gz / .json.xz."""
+    return [os.path.join(folder, library_file_name(f"three_{name}", c)) for c in COMPRESSION_EXTENSIONS]
+
+
+def write_three_animation_to_file(name, clip, folder, compression="NONE"):
     """
-    Записывает three_<name>.json в папку folder.
-    Папку мы передаём снаружи (обычно из storage.get_external_folder()).
+    Ставит запись three_<name>.json (.json.gz при сжатии, см. three_clip_compression)
+    в папку folder в фоновую очередь (кодирование и атомарная подмена файла — в потоке write_queue).
+    Папку и режим сжатия мы передаём снаружи (обычно из storage).
     """
     if not folder:
         return False
+    compression = three_clip_compression(compression)
     try:
-        os.makedirs(folder, exist_ok=True)
-        path = os.path.join(folder, f"three_{name}.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(clip, f, ensure_ascii=False, indent=2)
+        path = os.path.join(folder, library_file_name(f"three_{name}", compression))
+        for other in three_clip_paths(name, folder):
+            if other != path and (write_queue.is_pending(other) or os.path.isfile(other)):
+                write_queue.submit_remove(other)
+
+        def encode(data):
+            return encode_json(data, compression, indent=2)
+
+        write_queue.submit_write(path, clip, encoder=encode)
         return True
     except Exception:
         return False
\ No newline at end of file
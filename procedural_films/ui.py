@@ -1,10 +1,28 @@
 import bpy
 import os
 from datetime import datetime
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 
 from .constants import MODULE_ID, MODULE_NAME
-from .storage import read_all_films_cached, mark_cache_dirty, get_external_folder
+from . import write_queue
+from . import sqlite_backend
+from .cache import DEFAULT_BUDGET_MB
+from .storage import (
+    read_manifest_cached,
+    mark_cache_dirty,
+    get_external_folder,
+    flush_pending_writes,
+    get_films_generation,
+    poll_external_folder,
+    convert_external_folder,
+    write_library_pack,
+    list_film_versions,
+    get_library_backend,
+    import_folder_to_sqlite,
+    search_animations,
+    get_cache_stats,
+    get_library_setting,
+)
 
 # Операции (пока импортируем из procedural_films_module через обратную ссылку нельзя — будет цикл)
 # Поэтому на этом шаге импортируем из blender_ops, которого ещё нет.
@@ -17,6 +35,8 @@ from .ops import (
     update_animation_from_scene,
     apply_animation_to_scene,
     delete_animation,
+    restore_animation_version,
+    compact_animation_history,
 )
 
 
@@ -24,20 +44,92 @@ from .ops import (
 # UI props
 # -------------------------
 
+# Список для EnumProperty: пересобирается только при смене поколения библиотеки
+# или фильтра (заодно держит ссылки на строки, как того требует Blender для динамических items)
+_FILMS_ITEMS = (None, [])
+
+
 def films_items(self, context):
-    films = read_all_films_cached()
-    items = [(n, n, "") for n in films.keys()]
+    global _FILMS_ITEMS
+    films = read_manifest_cached()
+    query = getattr(context.scene, "umz_anim_filter", "") if context and context.scene else ""
+    key = (get_films_generation(), query)
+    if _FILMS_ITEMS[0] == key:
+        return _FILMS_ITEMS[1]
+
+    names = films.keys()
+    if query.strip():
+        found = set(search_animations(query))
+        names = [n for n in names if n in found]
+    items = [(n, n, "") for n in names]
     if not items:
-        items = [("", "(нет анимаций)", "")]
+        items = [("", "(нет анимаций)" if not films else "(ничего не найдено)", "")]
+    _FILMS_ITEMS = (key, items)
     return items
 
 
+# -------------------------
+# Folder watcher (bpy.app.timers)
+# -------------------------
+
+FOLDER_WATCH_INTERVAL = 2.0
+
+
+def _folder_watch_interval():
+    try:
+        return max(0.5, float(get_library_setting("folder_watch_interval", FOLDER_WATCH_INTERVAL)))
+    except Exception:
+        return FOLDER_WATCH_INTERVAL
+
+
+def _tag_redraw_all():
+    try:
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                area.tag_redraw()
+    except Exception:
+        pass
+
+
+def _folder_watch_timer():
+    try:
+        if poll_external_folder():
+            _tag_redraw_all()
+    except Exception:
+        pass
+    return _folder_watch_interval()
+
+
+def start_folder_watcher():
+    if not bpy.app.timers.is_registered(_folder_watch_timer):
+        bpy.app.timers.register(_folder_watch_timer, first_interval=_folder_watch_interval(), persistent=True)
+
+
+def stop_folder_watcher():
+    try:
+        if bpy.app.timers.is_registered(_folder_watch_timer):
+            bpy.app.timers.unregister(_folder_watch_timer)
+    except Exception:
+        pass
+
+
+def _on_library_changed(self, context):
+    # Другой бэкенд / база / сжатие: список анимаций перечитывается
+    mark_cache_dirty()
+
+
 def register_scene_props():
     if not hasattr(bpy.types.Scene, "umz_selected_animation"):
         bpy.types.Scene.umz_selected_animation = EnumProperty(
             name="Анимация",
             items=films_items
         )
+    if not hasattr(bpy.types.Scene, "umz_anim_filter"):
+        bpy.types.Scene.umz_anim_filter = StringProperty(
+            name="Фильтр",
+            description="Поиск анимаций по имени, объекту, data path или имени Action",
+            default=""
+        )
     if not hasattr(bpy.types.Scene, "umz_anim_full_delete"):
         bpy.types.Scene.umz_anim_full_delete = BoolProperty(
             name="Полное удаление",
@@ -55,6 +147,61 @@ def register_scene_props():
             description="Если включено — в JSON сохраняются треки только для выделенных объектов и список видимых объектов (для three.js/Blender)",
             default=False
         )
+    if not hasattr(bpy.types.Scene, "umz_capture_tolerance"):
+        bpy.types.Scene.umz_capture_tolerance = FloatProperty(
+            name="Допуск прореживания",
+            description="Убирать при сохранении ключи, без которых кривая отклоняется не больше чем на это значение (0 — не прореживать)",
+            default=0.0,
+            min=0.0,
+            precision=4,
+            step=0.01
+        )
+    if not hasattr(bpy.types.Scene, "umz_library_backend"):
+        bpy.types.Scene.umz_library_backend = EnumProperty(
+            name="Хранилище",
+            description="Где хранится внешняя библиотека анимаций",
+            items=[
+                ("FOLDER", "Папка JSON", "Отдельный файл <имя>.json на анимацию во внешней папке"),
+                ("SQLITE", "SQLite", "Одна база SQLite (по умолчанию library.sqlite во внешней папке)"),
+            ],
+            default="FOLDER",
+            update=_on_library_changed
+        )
+    if not hasattr(bpy.types.Scene, "umz_sqlite_library_path"):
+        bpy.types.Scene.umz_sqlite_library_path = StringProperty(
+            name="База SQLite",
+            description="Путь к базе библиотеки (пусто — library.sqlite во внешней папке)",
+            default="",
+            subtype='FILE_PATH',
+            update=_on_library_changed
+        )
+    if not hasattr(bpy.types.Scene, "umz_library_compression"):
+        bpy.types.Scene.umz_library_compression = EnumProperty(
+            name="Сжатие",
+            description="Формат новых файлов библиотеки (клипы three.js сжимаются только gzip)",
+            items=[
+                ("NONE", "Без сжатия", ".json"),
+                ("GZIP", "gzip", ".json.gz"),
+                ("XZ", "xz", ".json.xz"),
+            ],
+            default="NONE"
+        )
+    if not hasattr(bpy.types.Scene, "umz_films_cache_budget_mb"):
+        bpy.types.Scene.umz_films_cache_budget_mb = IntProperty(
+            name="Кеш, МБ",
+            description="Сколько памяти держать под загруженные анимации",
+            default=DEFAULT_BUDGET_MB,
+            min=0,
+            soft_max=4096
+        )
+    if not hasattr(bpy.types.Scene, "umz_folder_watch_interval"):
+        bpy.types.Scene.umz_folder_watch_interval = FloatProperty(
+            name="Опрос папки, с",
+            description="Как часто проверять внешнюю папку на изменения",
+            default=FOLDER_WATCH_INTERVAL,
+            min=0.5,
+            soft_max=60.0
+        )
     if not hasattr(bpy.types.Scene, "umz_text_and_markers"):
         bpy.types.Scene.umz_text_and_markers = BoolProperty(
             name="Текст и метки",
@@ -68,6 +215,11 @@ def unregister_scene_props():
             del bpy.types.Scene.umz_selected_animation
         except Exception:
             pass
+    if hasattr(bpy.types.Scene, "umz_anim_filter"):
+        try:
+            del bpy.types.Scene.umz_anim_filter
+        except Exception:
+            pass
     if hasattr(bpy.types.Scene, "umz_anim_full_delete"):
         try:
             del bpy.types.Scene.umz_anim_full_delete
@@ -83,6 +235,23 @@ def unregister_scene_props():
             del bpy.types.Scene.umz_anim_visible_selected_only
         except Exception:
             pass
+    if hasattr(bpy.types.Scene, "umz_capture_tolerance"):
+        try:
+            del bpy.types.Scene.umz_capture_tolerance
+        except Exception:
+            pass
+    for prop in (
+        "umz_library_backend",
+        "umz_sqlite_library_path",
+        "umz_library_compression",
+        "umz_films_cache_budget_mb",
+        "umz_folder_watch_interval",
+    ):
+        if hasattr(bpy.types.Scene, prop):
+            try:
+                delattr(bpy.types.Scene, prop)
+            except Exception:
+                pass
     if hasattr(bpy.types.Scene, "umz_text_and_markers"):
         try:
             del bpy.types.Scene.umz_text_and_markers
@@ -118,14 +287,26 @@ class ANIM_OT_create(bpy.types.Operator):
 
     def execute(self, context):
         name = self.name
-        internal = read_all_films_cached()  # чтобы решить create/update
+        internal = read_manifest_cached()  # чтобы решить create/update
         only_sel = bool(getattr(context.scene, "umz_anim_visible_selected_only", False))
         if name in internal:
-            update_animation_from_scene(name, only_selected=only_sel)
-            self.report({'INFO'}, f"Анимация '{name}' обновлена.")
+            stats = update_animation_from_scene(name, only_selected=only_sel)
+            msg = f"Анимация '{name}' обновлена."
         else:
-            create_animation_from_scene(name, self.description, only_selected=only_sel)
-            self.report({'INFO'}, f"Анимация '{name}' создана.")
+            stats = create_animation_from_scene(name, self.description, only_selected=only_sel)
+            msg = f"Анимация '{name}' создана."
+        if isinstance(stats, dict):
+            msg += f" Объектов: {stats.get('captured', 0)}, пропущено без анимации: {stats.get('skipped', 0)}."
+            if "key_ratio" in stats:
+                msg += f" Ключей осталось: {stats['key_ratio']:.0%}."
+
+        # Файлы пишутся в фоне — дожидаемся и сообщаем об ошибках записи
+        errors = flush_pending_writes()
+        if errors:
+            path, err = errors[0]
+            self.report({'WARNING'}, f"{msg} Ошибка записи файла {os.path.basename(path)}: {err}")
+        else:
+            self.report({'INFO'}, msg)
         try:
             context.scene.umz_selected_animation = name
         except Exception:
@@ -146,15 +327,24 @@ class ANIM_OT_load_delete(bpy.types.Operator):
     def execute(self, context):
         if self.do_delete:
             full = getattr(context.scene, "umz_anim_full_delete", False)
-            ok = delete_animation(self.anim, full_delete=bool(full))
-            if ok:
-                all_names = list(read_all_films_cached().keys())
+            res = delete_animation(self.anim, full_delete=bool(full))
+            errors = flush_pending_writes()
+            if errors:
+                path, err = errors[0]
+                self.report({'WARNING'}, f"Ошибка удаления файла {os.path.basename(path)}: {err}")
+            if res.get("removed"):
+                all_names = list(read_manifest_cached().keys())
                 try:
                     context.scene.umz_selected_animation = all_names[0] if all_names else ""
                 except Exception:
                     pass
                 if full:
-                    self.report({'INFO'}, f"Анимация '{self.anim}' удалена и связанные Action удалены.")
+                    msg = f"Анимация '{self.anim}' удалена, удалено Action: {len(res.get('actions_removed', []))}."
+                    kept = res.get("actions_kept") or {}
+                    if kept:
+                        a_name, users = next(iter(kept.items()))
+                        msg += f" Оставлено (используются другими анимациями): {len(kept)}, например '{a_name}' в {', '.join(users)}."
+                    self.report({'INFO'}, msg)
                 else:
                     self.report({'INFO'}, f"Анимация '{self.anim}' удалена (запись).")
                 mark_cache_dirty()
@@ -168,7 +358,9 @@ class ANIM_OT_load_delete(bpy.types.Operator):
             except Exception as e:
                 self.report({'ERROR'}, f"Ошибка при применении анимации: {e}")
                 return {'CANCELLED'}
-            self.report({'INFO'}, f"Загружено объектов: {len(res.get('applied', []))}")
+            total = (res.get("timings") or {}).get("total")
+            took = f" за {total:.2f} с" if total is not None else ""
+            self.report({'INFO'}, f"Загружено объектов: {len(res.get('applied', []))}{took}")
             return {'FINISHED'}
 
 
@@ -197,6 +389,140 @@ class ANIM_OT_set_dir(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
 
+class ANIM_OT_convert_folder(bpy.types.Operator):
+    bl_idname = "umz.anim_convert_folder"
+    bl_label = "Сжатие папки анимаций"
+    bl_description = "Перезаписать файлы внешней папки в выбранном формате (json / gzip / xz)"
+    compression: EnumProperty(
+        name="Формат",
+        items=[
+            ("NONE", "JSON", "Без сжатия (.json)"),
+            ("GZIP", "gzip", "Сжатие gzip (.json.gz)"),
+            ("XZ", "xz", "Сжатие lzma (.json.xz)"),
+        ],
+        default="GZIP",
+    )
+
+    def execute(self, context):
+        if not get_external_folder():
+            self.report({'WARNING'}, "Папка анимаций не задана.")
+            return {'CANCELLED'}
+        converted, errors = convert_external_folder(self.compression)
+        if errors:
+            path, err = errors[0]
+            self.report({'WARNING'}, f"Сконвертировано файлов: {converted}, ошибок: {len(errors)} ({os.path.basename(path)}: {err})")
+        else:
+            self.report({'INFO'}, f"Сконвертировано файлов: {converted}")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+
+class ANIM_OT_pack_library(bpy.types.Operator):
+    bl_idname = "umz.anim_pack_library"
+    bl_label = "Упаковать библиотеку"
+    bl_description = "Собрать все анимации внешней папки в один файл .pfpack с индексом в заголовке"
+    pack_name: StringProperty(name="Имя файла", default="library")
+    remove_sources: BoolProperty(name="Удалить исходные файлы", default=False)
+
+    def execute(self, context):
+        if not get_external_folder():
+            self.report({'WARNING'}, "Папка анимаций не задана.")
+            return {'CANCELLED'}
+        path, errors = write_library_pack(self.pack_name, remove_sources=self.remove_sources)
+        if errors:
+            err_path, err = errors[0]
+            self.report({'WARNING'}, f"Ошибка записи {os.path.basename(err_path)}: {err}")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Библиотека упакована: {os.path.basename(path)}")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+
+class ANIM_OT_import_sqlite(bpy.types.Operator):
+    bl_idname = "umz.anim_import_sqlite"
+    bl_label = "Импорт папки в SQLite"
+    bl_description = "Скопировать все анимации из папки JSON в базу SQLite"
+
+    def execute(self, context):
+        if not get_external_folder():
+            self.report({'WARNING'}, "Папка анимаций не задана.")
+            return {'CANCELLED'}
+        try:
+            imported, errors = import_folder_to_sqlite()
+        except Exception as e:
+            self.report({'ERROR'}, f"{e}")
+            return {'CANCELLED'}
+        if errors:
+            name, err = errors[0]
+            self.report({'WARNING'}, f"Импортировано: {imported}, ошибок: {len(errors)} ({name}: {err})")
+        else:
+            self.report({'INFO'}, f"Импортировано анимаций: {imported}")
+        return {'FINISHED'}
+
+
+# Список версий для EnumProperty (держим ссылки на строки, как требует Blender)
+_VERSION_ITEMS = []
+
+
+def version_items(self, context):
+    global _VERSION_ITEMS
+    items = []
+    for number, created in reversed(list_film_versions(self.anim)):
+        items.append((str(number), f"v{number}  {format_created(created)}", ""))
+    if not items:
+        items = [("", "(нет истории)", "")]
+    _VERSION_ITEMS = items
+    return items
+
+
+class ANIM_OT_restore_version(bpy.types.Operator):
+    bl_idname = "umz.anim_restore_version"
+    bl_label = "Восстановить версию"
+    bl_description = "Сделать выбранную версию анимации текущей (восстановление тоже сохраняется в историю)"
+    anim: StringProperty()
+    version: EnumProperty(name="Версия", items=version_items)
+
+    def execute(self, context):
+        if not self.version:
+            self.report({'WARNING'}, "У анимации нет сохранённых версий.")
+            return {'CANCELLED'}
+        try:
+            restore_animation_version(self.anim, int(self.version))
+        except Exception as e:
+            self.report({'ERROR'}, f"{e}")
+            return {'CANCELLED'}
+        errors = flush_pending_writes()
+        if errors:
+            path, err = errors[0]
+            self.report({'WARNING'}, f"Ошибка записи файла {os.path.basename(path)}: {err}")
+        else:
+            self.report({'INFO'}, f"Анимация '{self.anim}': восстановлена версия {self.version}.")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+
+class ANIM_OT_compact_history(bpy.types.Operator):
+    bl_idname = "umz.anim_compact_history"
+    bl_label = "Сжать историю"
+    bl_description = "Свернуть старые версии анимации в одну базовую"
+    anim: StringProperty()
+    keep: IntProperty(name="Оставить версий", default=5, min=1)
+
+    def execute(self, context):
+        dropped = compact_animation_history(self.anim, self.keep)
+        self.report({'INFO'}, f"Свёрнуто версий: {dropped}")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+
 # -------------------------
 # Draw
 # -------------------------
@@ -211,16 +537,32 @@ def draw_ui(layout, context):
 
     col = layout.column(align=True)
     selected = getattr(context.scene, "umz_selected_animation", "")
-    films = read_all_films_cached()
+    films = read_manifest_cached()
     btn_label = "Создать анимацию" if selected == "" or selected not in films else "Сохранить анимацию"
     col.operator("umz.anim_create", text=btn_label, icon='FILE_TICK')
 
     if not (prefs and prefs.external_animations_folder):
         col.operator("umz.anim_set_directory", icon='FILE_FOLDER')
+    else:
+        row = col.row(align=True)
+        row.operator("umz.anim_convert_folder", icon='FILE_ARCHIVE')
+        row.operator("umz.anim_pack_library", icon='PACKAGE')
+        if get_library_backend() == "SQLITE":
+            col.operator("umz.anim_import_sqlite", icon='IMPORT')
+
+    lib = layout.column(align=True)
+    lib.prop(context.scene, "umz_library_backend", text="Хранилище")
+    if get_library_backend() == "SQLITE":
+        lib.prop(context.scene, "umz_sqlite_library_path", text="")
+    lib.prop(context.scene, "umz_library_compression", text="Сжатие")
+    row = lib.row(align=True)
+    row.prop(context.scene, "umz_films_cache_budget_mb", text="Кеш, МБ")
+    row.prop(context.scene, "umz_folder_watch_interval", text="Опрос, с")
 
     col.prop(context.scene, "umz_anim_visible_selected_only", text="Только выделенные объекты")
     col.prop(context.scene, "umz_export_alpha_tracks", text="Экспорт прозрачности (alpha)")
     col.prop(context.scene, "umz_text_and_markers", text="Текст и метки")
+    col.prop(context.scene, "umz_capture_tolerance", text="Допуск прореживания")
     col.prop(context.scene, "umz_anim_full_delete", text="Полное удаление")
 
     layout.separator()
@@ -229,6 +571,7 @@ def draw_ui(layout, context):
     else:
         if not hasattr(context.scene, "umz_selected_animation"):
             register_scene_props()
+        layout.prop(context.scene, "umz_anim_filter", text="", icon='VIEWZOOM')
         row = layout.row(align=True)
         row.prop(context.scene, "umz_selected_animation", text="")
         ops = row.row(align=True)
@@ -242,13 +585,36 @@ def draw_ui(layout, context):
         if film_data:
             created = film_data.get("created_at", "(нет даты)")
             layout.label(text=f"Создано: {format_created(created)}")
+            if film_data.get("source") == "internal":
+                row = layout.row(align=True)
+                op_ver = row.operator("umz.anim_restore_version", icon='RECOVER_LAST')
+                op_ver.anim = context.scene.umz_selected_animation
+                op_hist = row.operator("umz.anim_compact_history", icon='SORTTIME')
+                op_hist.anim = context.scene.umz_selected_animation
+
+    stats = get_cache_stats()
+    mb = 1024.0 * 1024.0
+    layout.label(
+        text=f"Кеш: {stats['items']} шт., {stats['bytes'] / mb:.1f} / {stats['budget'] / mb:.0f} МБ, "
+             f"попаданий {stats['hit_rate']:.0%}",
+        icon='MEMORY',
+    )
 
 
 # -------------------------
 # Регистрация классов UI
 # -------------------------
 
-_classes = (ANIM_OT_create, ANIM_OT_load_delete, ANIM_OT_set_dir)
+_classes = (
+    ANIM_OT_create,
+    ANIM_OT_load_delete,
+    ANIM_OT_set_dir,
+    ANIM_OT_convert_folder,
+    ANIM_OT_pack_library,
+    ANIM_OT_import_sqlite,
+    ANIM_OT_restore_version,
+    ANIM_OT_compact_history,
+)
 _registered = False
 _register_cb = None
 
@@ -276,6 +642,7 @@ def register(register_callback):
         pass
 
     mark_cache_dirty()
+    start_folder_watcher()
     _registered = True
 
 
@@ -284,6 +651,10 @@ def unregister():
     if not _registered:
         return
 
+    stop_folder_watcher()
+    write_queue.shutdown()
+    sqlite_backend.close_all()
+
     for c in reversed(_classes):
         try:
             bpy.utils.unregister_class(c)
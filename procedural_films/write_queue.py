@@ -0,0 +1,303 @@
+import atexit
+import json
+import os
+import threading
+from collections import deque
+
+# =========================================================
+# ФОНОВАЯ ЗАПИСЬ ФАЙЛОВ БИБЛИОТЕКИ
+# JSON кодируется и пишется в отдельном потоке: temp-файл + атомарный os.replace,
+# поэтому падение посреди записи не оставляет обрезанный <name>.json.
+# Здесь НЕТ bpy: колбэки завершения вызываются только в главном потоке
+# (process_completed / flush).
+# Потоковая запись (submit_stream): главный поток только отдаёт готовые куски
+# текста, сжатие, запись и fsync идут здесь же, в фоновом потоке.
+# =========================================================
+
+_LOCK = threading.Condition()
+_JOBS = deque()        # ожидающие задания (FIFO)
+_DONE = deque()        # (on_done, path, error) завершённых заданий
+_PENDING = {}          # path -> число незавершённых заданий по этому пути
+_ERRORS = []           # (path, error) с момента последнего flush()
+_WORKER = None
+_STOP = False
+
+# Сколько символов потоковой записи может ждать в памяти; дальше write() ждёт фоновый поток
+STREAM_BUFFER_LIMIT = 32 * 1024 * 1024
+
+
+def encode_compact(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def atomic_write(path, payload):
+    """Пишет payload (str или bytes) во временный файл рядом с path и атомарно подменяет path."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if isinstance(payload, bytes):
+            f = open(tmp, "wb")
+        else:
+            f = open(tmp, "w", encoding="utf-8")
+        with f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except Exception:
+            pass
+        raise
+
+
+def _release(path):
+    """Снять одно незавершённое задание с path (под _LOCK)."""
+    left = _PENDING.get(path, 1) - 1
+    if left > 0:
+        _PENDING[path] = left
+    else:
+        _PENDING.pop(path, None)
+
+
+class StreamHandle:
+    """
+    Потоковая запись одного файла (см. submit_stream). Методы вызываются из главного
+    потока; после commit() / abort() handle больше не используется.
+    """
+
+    def __init__(self):
+        self._items = deque()   # str-куски и задания ("write", path, data, encoder)
+        self._buffered = 0
+        self._state = None      # None / "commit" / "abort" / "failed"
+
+    def write(self, chunk):
+        """Добавить кусок текста (ждёт, если в памяти уже STREAM_BUFFER_LIMIT символов)."""
+        with _LOCK:
+            _LOCK.wait_for(lambda: self._state is not None or self._buffered < STREAM_BUFFER_LIMIT)
+            if self._state is not None:
+                return
+            self._items.append(chunk)
+            self._buffered += len(chunk)
+            _LOCK.notify_all()
+
+    def submit_write(self, path, data, encoder=None, on_done=None):
+        """
+        Записать другой файл в том же фоновом задании — гарантированно до commit()
+        этого потока (например, Action, на которые он ссылается). on_done не поддерживается.
+        """
+        with _LOCK:
+            if self._state is not None:
+                return
+            _PENDING[path] = _PENDING.get(path, 0) + 1
+            self._items.append(("write", path, data, encoder))
+            _LOCK.notify_all()
+
+    def commit(self):
+        """Дописать всё отданное и атомарно подменить файл (в фоновом потоке)."""
+        self._finish("commit")
+
+    def abort(self):
+        """Отменить: временный файл удаляется, ещё не записанные задания отбрасываются."""
+        self._finish("abort")
+
+    def _finish(self, state):
+        with _LOCK:
+            if self._state is None:
+                self._state = state
+            _LOCK.notify_all()
+
+    def _next(self):
+        """(фоновый поток) Следующий элемент или None, когда поток закончен."""
+        with _LOCK:
+            _LOCK.wait_for(lambda: self._items or self._state is not None)
+            if self._state in ("abort", "failed"):
+                self._drop()
+                return None
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            if isinstance(item, str):
+                self._buffered -= len(item)
+            _LOCK.notify_all()
+            return item
+
+    def _drop(self):
+        """Отбросить ожидающие элементы (под _LOCK)."""
+        while self._items:
+            item = self._items.popleft()
+            if not isinstance(item, str):
+                _release(item[1])
+        self._buffered = 0
+        _LOCK.notify_all()
+
+
+def _run_stream(path, handle, opener):
+    writer = None
+    try:
+        # Открытие тоже под try: иначе handle остался бы открытым и write()/flush() ждали бы вечно
+        writer = opener(path)
+        while True:
+            item = handle._next()
+            if item is None:
+                break
+            if isinstance(item, str):
+                writer.write(item)
+                continue
+            error = None
+            try:
+                _run_job(item)
+            except Exception as e:
+                error = repr(e)
+            with _LOCK:
+                _release(item[1])
+                if error:
+                    _ERRORS.append((item[1], error))
+                _LOCK.notify_all()
+            if error:
+                raise RuntimeError(error)
+        if handle._state != "commit":
+            writer.abort()
+            return
+        writer.commit()
+    except Exception:
+        with _LOCK:
+            handle._state = "failed"
+            handle._drop()
+        if writer is not None:
+            writer.abort()
+        raise
+
+
+def _run_job(job):
+    kind, path, data, encoder = job
+    if kind == "remove":
+        if os.path.isfile(path):
+            os.remove(path)
+        return
+    if kind == "stream":
+        _run_stream(path, data, encoder)
+        return
+    atomic_write(path, (encoder or encode_compact)(data))
+
+
+def _worker_loop():
+    while True:
+        with _LOCK:
+            while not _JOBS and not _STOP:
+                _LOCK.wait()
+            if not _JOBS:
+                return
+            job, on_done = _JOBS.popleft()
+
+        error = None
+        try:
+            _run_job(job)
+        except Exception as e:
+            error = repr(e)
+
+        with _LOCK:
+            path = job[1]
+            _release(path)
+            if error:
+                _ERRORS.append((path, error))
+            _DONE.append((on_done, path, error))
+            _LOCK.notify_all()
+
+
+def _ensure_worker():
+    global _WORKER, _STOP
+    if _WORKER is not None and _WORKER.is_alive():
+        return
+    _STOP = False
+    _WORKER = threading.Thread(target=_worker_loop, name="procedural_films_writer", daemon=True)
+    _WORKER.start()
+
+
+def _submit(job, on_done):
+    with _LOCK:
+        _ensure_worker()
+        path = job[1]
+        _PENDING[path] = _PENDING.get(path, 0) + 1
+        _JOBS.append((job, on_done))
+        _LOCK.notify_all()
+
+
+def submit_write(path, data, encoder=None, on_done=None):
+    """
+    Поставить запись в очередь. data не должен меняться после вызова;
+    encoder(data) -> str | bytes выполняется в фоновом потоке.
+    on_done(path, error) вызывается в главном потоке из process_completed()/flush().
+    """
+    _submit(("write", path, data, encoder), on_done)
+
+
+def submit_stream(path, opener, on_done=None):
+    """
+    Поставить в очередь потоковую запись path. opener(path) вызывается в фоновом
+    потоке и возвращает писателя с write(str) / commit() / abort() (file_formats.JsonStreamWriter).
+    Возвращает StreamHandle: куски отдаются через handle.write(), запись завершается
+    handle.commit() или handle.abort(). Пока поток не завершён, flush() из главного
+    потока ждал бы его вечно — вызывать его до commit()/abort() нельзя.
+    """
+    handle = StreamHandle()
+    _submit(("stream", path, handle, opener), on_done)
+    return handle
+
+
+def submit_remove(path, on_done=None):
+    """Удаление файла в той же очереди (не обгонит ранее поставленную запись)."""
+    _submit(("remove", path, None, None), on_done)
+
+
+def is_pending(path):
+    with _LOCK:
+        return path in _PENDING
+
+
+def process_completed():
+    """Вызывает колбэки завершённых заданий (только из главного потока)."""
+    while True:
+        with _LOCK:
+            if not _DONE:
+                return
+            on_done, path, error = _DONE.popleft()
+        if on_done:
+            try:
+                on_done(path, error)
+            except Exception:
+                pass
+
+
+def flush(timeout=None):
+    """
+    Дождаться записи всего, что стоит в очереди.
+    Возвращает список (path, error) ошибок с прошлого flush(); при таймауте
+    незаписанные пути тоже попадают в список.
+    """
+    with _LOCK:
+        _LOCK.wait_for(lambda: not _JOBS and not _PENDING, timeout=timeout)
+        errors = list(_ERRORS)
+        _ERRORS.clear()
+        for path in _PENDING:
+            errors.append((path, "timeout"))
+    process_completed()
+    return errors
+
+
+def shutdown(timeout=None):
+    """Дописать очередь и остановить поток (unregister / выход из Blender)."""
+    global _STOP, _WORKER
+    flush(timeout=timeout)
+    with _LOCK:
+        _STOP = True
+        _LOCK.notify_all()
+    if _WORKER is not None:
+        _WORKER.join(timeout=timeout)
+    _WORKER = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,75 @@
+from procedural_films.constants import INTERPOLATION_MODES
+from procedural_films.keyframe_reduction import reduce_keyframes
+
+CONSTANT = INTERPOLATION_MODES.index("CONSTANT")
+LINEAR = INTERPOLATION_MODES.index("LINEAR")
+BEZIER = INTERPOLATION_MODES.index("BEZIER")
+
+
+def _auto_handles(frames, values, k):
+    """Auto handles of key k: like Blender, they depend only on the neighbouring keys."""
+    f, v = frames[k], values[k]
+    prev_k = k - 1 if k > 0 else k
+    next_k = k + 1 if k + 1 < len(frames) else k
+    span = frames[next_k] - frames[prev_k]
+    slope = (values[next_k] - values[prev_k]) / span if span else 0.0
+    left = f - (f - frames[prev_k]) / 3.0
+    right = f + (frames[next_k] - f) / 3.0
+    return (left, v - slope * (f - left)), (right, v + slope * (right - f))
+
+
+def _evaluate(frames, values, codes, x):
+    if x <= frames[0]:
+        return values[0]
+    if x >= frames[-1]:
+        return values[-1]
+    i = max(k for k in range(len(frames) - 1) if frames[k] <= x)
+    f0, v0, f1, v1 = frames[i], values[i], frames[i + 1], values[i + 1]
+    if codes[i] == CONSTANT:
+        return v0
+    if codes[i] == LINEAR:
+        return v0 + (v1 - v0) * (x - f0) / (f1 - f0)
+    p1 = _auto_handles(frames, values, i)[1]
+    p2 = _auto_handles(frames, values, i + 1)[0]
+
+    def point(t):
+        u = 1.0 - t
+        return (
+            u * u * u * f0 + 3 * u * u * t * p1[0] + 3 * u * t * t * p2[0] + t * t * t * f1,
+            u * u * u * v0 + 3 * u * u * t * p1[1] + 3 * u * t * t * p2[1] + t * t * t * v1,
+        )
+
+    lo, hi = 0.0, 1.0
+    for _ in range(60):
+        mid = (lo + hi) / 2.0
+        if point(mid)[0] < x:
+            lo = mid
+        else:
+            hi = mid
+    return point((lo + hi) / 2.0)[1]
+
+
+def test_thinned_dense_bezier_run_restores_within_tolerance():
+    frames = [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    values = [0.0, 1.0, 2.0, 3.0, 3.0, 3.0]
+    codes = [BEZIER] * 6
+    f, v, c = reduce_keyframes(frames, values, codes, 0.1)
+    assert len(f) < len(frames)
+    for x, expected in zip(frames, values):
+        assert abs(_evaluate(f, v, c, x) - expected) <= 0.1
+
+
+def test_segment_across_run_boundary_keeps_its_shape():
+    # Dense BEZIER ramp (thinned), then a flat LINEAR run (thinned); the BEZIER
+    # segment 6 -> 7 between the runs must restore exactly as it was
+    frames = [float(i) for i in range(11)]
+    values = [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 2.0, 2.0, 2.0, 2.0]
+    codes = [BEZIER] * 7 + [LINEAR] * 4
+    tolerance = 0.01
+    f, v, c = reduce_keyframes(frames, values, codes, tolerance)
+    assert len(f) < len(frames)
+
+    samples = list(frames) + [6.0 + i / 20.0 for i in range(21)]
+    for x in samples:
+        expected = _evaluate(frames, values, codes, x)
+        assert abs(_evaluate(f, v, c, x) - expected) <= tolerance, x
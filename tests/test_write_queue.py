@@ -0,0 +1,67 @@
+import os
+import threading
+
+from procedural_films import write_queue
+from procedural_films.file_formats import JsonStreamWriter
+
+
+def _returns(func, timeout=10.0):
+    """Runs func in a thread; True if it finished within timeout."""
+    done = threading.Event()
+
+    def run():
+        func()
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done.wait(timeout)
+
+
+def test_stream_to_unwritable_path_does_not_hang(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_queue, "STREAM_BUFFER_LIMIT", 16)
+    # Parent of the target is a regular file: the writer cannot even be opened
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("x")
+    path = str(blocker / "anim.json")
+    pool_path = str(tmp_path / "_actions" / "a.json")
+
+    handle = write_queue.submit_stream(path, lambda p: JsonStreamWriter(p, "NONE"))
+    result = {}
+
+    def produce():
+        handle.submit_write(pool_path, {"name": "a"})
+        for _ in range(100):
+            handle.write('{"tracks":[]}')
+        handle.commit()
+
+    def flush():
+        result["errors"] = write_queue.flush(timeout=10.0)
+
+    assert _returns(produce)
+    assert _returns(flush)
+    assert not write_queue.is_pending(path)
+    assert not write_queue.is_pending(pool_path)
+    assert [p for p, _e in result["errors"]] == [path]
+    assert not os.path.exists(pool_path)
+    assert _returns(lambda: write_queue.shutdown(timeout=10.0))
+
+
+def test_stream_commit_writes_pool_files_first(tmp_path):
+    path = str(tmp_path / "anim.json")
+    pool_path = str(tmp_path / "_actions" / "a.json")
+    seen = {}
+
+    def on_done(_path, error):
+        seen["error"] = error
+        seen["pool_written"] = os.path.isfile(pool_path)
+
+    handle = write_queue.submit_stream(path, lambda p: JsonStreamWriter(p, "NONE"), on_done=on_done)
+    handle.write('{"anim":')
+    handle.submit_write(pool_path, {"name": "a"})
+    handle.write('{"tracks":[]}}')
+    handle.commit()
+
+    assert write_queue.flush(timeout=10.0) == []
+    assert seen == {"error": None, "pool_written": True}
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == '{"anim":{"tracks":[]}}'
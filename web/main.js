@@ -5,7 +5,9 @@ import { GLTFLoader } from '../vendor/three/examples/jsm/loaders/GLTFLoader.js';
 // CONFIG
 // =====================
 const MODEL_URL = './assets/model/model.glb';
-const ANIM_URL = './assets/anim/three_animation1.json';
+// Без расширения: аддон пишет three_<name>.json или three_<name>.json.gz
+const ANIM_URL = './assets/anim/three_animation1';
+const ANIM_EXTENSIONS = ['.json', '.json.gz'];
 
 const MODEL_AXIS_FIX_X = -Math.PI / 2;
 const GLTF_CAMERA_NAME = 'Camera';
@@ -54,6 +56,35 @@ function renameNodesFromGltfId(root) {
   });
 }
 
+// three_<name>.json может лежать сжатым (.json.gz) — распаковываем в браузере
+async function fetchJson(url) {
+  const res = await fetch(url);
+  if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
+
+  const encoding = res.headers.get('Content-Encoding') || '';
+  if (url.endsWith('.gz') && !encoding.includes('gzip')) {
+    if (typeof DecompressionStream === 'undefined') {
+      throw new Error('DecompressionStream не поддерживается — используйте несжатый three_*.json');
+    }
+    const stream = res.body.pipeThrough(new DecompressionStream('gzip'));
+    return new Response(stream).json();
+  }
+  return res.json();
+}
+
+// Первый существующий вариант клипа (ANIM_EXTENSIONS)
+async function fetchClip(baseUrl) {
+  let lastError = null;
+  for (const ext of ANIM_EXTENSIONS) {
+    try {
+      return await fetchJson(baseUrl + ext);
+    } catch (e) {
+      lastError = e;
+    }
+  }
+  throw lastError;
+}
+
 function frameFallbackCamera(object3D, cam) {
   const box = new THREE.Box3().setFromObject(object3D);
   const size = box.getSize(new THREE.Vector3()).length();
@@ -254,9 +285,7 @@ new GLTFLoader().load(
     }
 
     // Load anim JSON once: tracks + alpha_tracks + visible_nodes
-    const res = await fetch(ANIM_URL);
-    if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
-    const animData = await res.json();
+    const animData = await fetchClip(ANIM_URL);
 
     // ВАЖНО: фильтрация видимости с поддержкой родителей
     applySelectiveVisibilityWithParents(modelRoot, animData);